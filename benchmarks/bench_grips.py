@@ -0,0 +1,54 @@
+"""
+Deduplication of large grip libraries: hash-based grip.unique_grips against the old quadratic list scan.
+Run from the root of the repository: python -m benchmarks.bench_grips [number of grips]
+"""
+import random
+import sys
+import grip
+from chord import Chord
+from benchmarks.common import best_time
+
+
+def random_grips(n, seed=1234):
+    """
+    Generates n grips, roughly half of which are duplicates of the others.
+    """
+    rng = random.Random(seed)
+    chord = Chord("C")
+    grips = []
+    for _ in range(n):
+        if grips and rng.random() < 0.5:
+            g = rng.choice(grips)
+            grips.append(grip.Grip(g.fret, dict(g.open_closed_pressed), dict(g.positions), chord))
+            continue
+        open_closed_pressed = {string: rng.choice([grip.Grip.OPEN_STRING, grip.Grip.CLOSED_STRING,
+                                                   grip.Grip.PRESSED_STRING]) for string in range(1, 7)}
+        positions = {fret: {} for fret in range(1, 5)}
+        for string in range(1, 7):
+            if open_closed_pressed[string] == grip.Grip.PRESSED_STRING:
+                positions[rng.randint(1, 4)][string] = rng.randint(1, 4)
+        grips.append(grip.Grip(rng.randint(1, 12), open_closed_pressed, positions, chord))
+    return grips
+
+
+def unique_by_scan(grips):
+    updated = []
+    for g in grips:
+        if g not in updated:
+            updated.append(g)
+    return updated
+
+
+def main(n=10 ** 5):
+    grips = random_grips(n)
+    unique = grip.unique_grips(grips)
+    print("{} grips, {} unique".format(n, len(unique)))
+    print("    unique_grips          {:8.3f} s".format(best_time(lambda: grip.unique_grips(grips))))
+    print("    set of grips          {:8.3f} s".format(best_time(lambda: set(grips))))
+    scanned = min(n, 5000)
+    assert unique_by_scan(grips[:scanned]) == grip.unique_grips(grips[:scanned])
+    print("    list scan ({} grips) {:8.3f} s".format(scanned, best_time(lambda: unique_by_scan(grips[:scanned]), 1)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Times of incremental.build_songbook on a synthetic songbook: the first build, a build in which nothing changed,
+and a build after one song file was edited.
+Run from the root of the repository: python -m benchmarks.bench_incremental [number of songs]
+"""
+import sys
+import time
+import incremental
+import misc
+from song import create_text_song
+from benchmarks.synthetic import synthetic_songs, write_song_files
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(n=5000):
+    folder = misc.create_temp_folder(".")
+    try:
+        song_files = write_song_files(synthetic_songs(n), folder)
+        songbook_file = folder + "/book.sgbk"
+        tex_file = folder + "/book.tex"
+
+        def build():
+            incremental.build_songbook(song_files, songbook_file, tex_file)
+
+        print("Incremental builds of a songbook with {} songs".format(n))
+        print("    first build   {:8.3f} s".format(timed(build)))
+        print("    nothing new   {:8.3f} s".format(timed(build)))
+        for i in range(3):
+            create_text_song(song_files[n // 2], "Artist", "Edited {}".format(i), [["<C>La <G>la {}".format(i)]])
+            print("    one edit      {:8.3f} s".format(timed(build)))
+    finally:
+        misc.remove_temp_folder(folder)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,42 @@
+"""
+Measures how parsing of the song files scales with the number of worker processes.
+The songs/ corpus is copied many times to a temporary folder first.
+Run from the root of the repository: python -m benchmarks.bench_parallel_parse [copies]
+"""
+import os
+import shutil
+import sys
+import misc
+import songbook
+from benchmarks.common import corpus_files, best_time
+
+
+def copy_corpus(folder, copies):
+    files = []
+    for text_file in corpus_files():
+        name = os.path.basename(text_file)
+        for i in range(copies):
+            copy = os.path.join(folder, "{}.{}".format(i, name))
+            shutil.copyfile(text_file, copy)
+            files.append(copy)
+    return files
+
+
+def main(copies=200):
+    folder = misc.create_temp_folder(".")
+    try:
+        files = copy_corpus(folder, copies)
+        serial = songbook.parse_song_files(files)
+        print("Parsing {} files".format(len(files)))
+        workers = 1
+        while workers <= os.cpu_count():
+            assert songbook.parse_song_files(files, workers) == serial
+            seconds = best_time(lambda: songbook.parse_song_files(files, workers))
+            print("    {:>3} workers {:8.3f} s".format(workers, seconds))
+            workers *= 2
+    finally:
+        misc.remove_temp_folder(folder)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,46 @@
+"""
+Compares the loading times of the legacy (repr + eval) and the current (JSON lines) songbook format.
+Run from the root of the repository: python -m benchmarks.bench_storage [copies]
+"""
+import sys
+import misc
+import storage
+from benchmarks.common import corpus_songs, best_time
+# noinspection PyUnresolvedReferences
+from chord import Chord
+# noinspection PyUnresolvedReferences
+from verse import Verse
+# noinspection PyUnresolvedReferences
+from stanza import Stanza
+# noinspection PyUnresolvedReferences
+from song import Song
+
+
+def load_with_eval(file_name):
+    with open(file_name, encoding="utf-8") as f:
+        return [eval(line.strip()) for line in f]
+
+
+def main(copies=100):
+    songs = corpus_songs(copies)
+    folder = misc.create_temp_folder(".")
+    try:
+        legacy_file = folder + "/legacy.sgbk"
+        current_file = folder + "/current.sgbk"
+        with open(legacy_file, "w", encoding="utf-8") as f:
+            for song in songs:
+                print(repr(song), file=f)
+        with open(current_file, "w", encoding="utf-8") as f:
+            storage.write_songs(f, songs)
+        timings = [("legacy, eval", best_time(lambda: load_with_eval(legacy_file))),
+                   ("legacy, safe parser", best_time(lambda: storage.read_songs(legacy_file))),
+                   ("current", best_time(lambda: storage.read_songs(current_file)))]
+        print("Loading {} songs".format(len(songs)))
+        for name, seconds in timings:
+            print("    {:<20} {:8.3f} s".format(name, seconds))
+    finally:
+        misc.remove_temp_folder(folder)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
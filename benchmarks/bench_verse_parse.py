@@ -0,0 +1,75 @@
+"""
+Throughput of verse.parse_verse on verse lines taken from the songs/ corpus,
+compared with the old character-by-character parser, which parsed every chord anew (chord.parse is memoized now).
+Run from the root of the repository: python -m benchmarks.bench_verse_parse [number of lines]
+"""
+import itertools
+import sys
+import time
+import chord
+import verse
+from benchmarks.common import corpus_files
+
+
+def corpus_lines():
+    lines = []
+    for text_file in corpus_files():
+        with open(text_file, encoding="utf-8") as f:
+            lines += [line.strip() for line in f.readlines()[2:] if line.strip()]
+    return lines
+
+
+def parse_chord_without_cache(description):
+    atoms = description.split(chord.MAIN_DECORATION_SEPARATOR)
+    decoration = atoms[1:]
+    base_tone = atoms[0]
+    if base_tone not in chord.ALLOWED_TONES:
+        decoration = ["m"] + decoration
+        base_tone = base_tone[:1].upper() + base_tone[1:]
+    return chord.Chord(base_tone, decoration)
+
+
+def parse_verse_by_characters(description):
+    lyrics = []
+    chords = []
+    in_chord = False
+    index = 0
+    chord_string = []
+    position = None
+    for char in description:
+        if char == "<":
+            assert not in_chord
+            in_chord = True
+            position = index
+        elif char == ">":
+            assert in_chord
+            in_chord = False
+            chords.append((parse_chord_without_cache("".join(chord_string)), position))
+            chord_string = []
+        elif in_chord:
+            chord_string.append(char)
+        else:
+            lyrics.append(char)
+            index += 1
+    return verse.Verse("".join(lyrics), chords)
+
+
+def throughput(parse, lines):
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main(n=10 ** 6):
+    lines = corpus_lines()
+    for line in lines:
+        assert verse.parse_verse(line) == parse_verse_by_characters(line)
+    lines = list(itertools.islice(itertools.cycle(lines), n))
+    print("Parsing {} verse lines".format(len(lines)))
+    print("    character loop {:12.0f} lines/s".format(throughput(parse_verse_by_characters, lines)))
+    print("    regex          {:12.0f} lines/s".format(throughput(verse.parse_verse, lines)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,93 @@
+"""
+Verse.__str__ on chord-dense verses, compared with the old implementation that filled a grid of characters
+one by one.
+Run from the root of the repository: python -m benchmarks.bench_verse_str [number of verses]
+"""
+import random
+import sys
+import verse
+from benchmarks.common import best_time
+from benchmarks.bench_verse_parse import corpus_lines
+
+
+def str_with_character_grid(vrs):
+    if len(vrs.chords) == 0:
+        return vrs.lyrics
+    else:
+        chord_positions = []    # (line, index in line)
+        last_in_the_lines = {}  # line: index of the last chord in the line
+        max_length = len(vrs.lyrics)
+        additional_spaces = [0 for _ in range(len(vrs.chords))]  # number of spaces before the given chord
+        longer_spaces = {}
+        for i, (this_chord, this_position) in enumerate(vrs.chords):
+            if i > 0:
+                additional_spaces[i] += additional_spaces[i - 1]
+            for line in range(len(last_in_the_lines) + 1):
+                if line not in last_in_the_lines:
+                    break
+                else:
+                    last_chord, last_position = vrs.chords[last_in_the_lines[line]]
+                    last_end = last_position + len(str(last_chord))
+                    if last_end < this_position:
+                        break
+                    elif line == 0:
+                        # try with additional spaces, but ...
+                        space_between = vrs.lyrics.rfind(" ", last_position, this_position)
+                        if space_between >= 0:      # ... do not break the words
+                            assert space_between not in longer_spaces
+                            longer_spaces[space_between] = 1 + last_end - this_position
+                            additional_spaces[i] += longer_spaces[space_between]
+                            break
+            column = this_position + additional_spaces[i]
+            chord_positions.append((line, column))
+            last_in_the_lines[line] = i
+            max_length = max(max_length, column + len(str(this_chord)))
+
+        max_length = max(max_length, len(vrs.lyrics) + additional_spaces[-1])
+        placeholder = " "
+        any_lyrics = bool(vrs.lyrics.strip())
+        number_lines = 2 * len(last_in_the_lines) + 1 if any_lyrics else 1
+        lines = [[placeholder for _ in range(max_length)] for _ in range(number_lines)]
+        for i, (line, column) in enumerate(chord_positions):
+            chord_string = str(vrs.chords[i][0])
+            real_line = 2 * (line + 1) if any_lyrics else 0
+            for j in range(len(chord_string)):
+                lines[real_line][column + j] = chord_string[j]
+            for lower_line in range(1, real_line):
+                if lines[lower_line][column] == placeholder:
+                    lines[lower_line][column] = "|"
+        if any_lyrics:
+            index = 0
+            for i in range(len(vrs.lyrics)):
+                if i in longer_spaces:
+                    index += longer_spaces[i]
+                lines[0][index] = vrs.lyrics[i]
+                index += 1
+        return "\n".join(["".join(line) for line in lines[::-1]])
+
+
+def dense_verses(n, seed=1234):
+    """
+    Verses from the corpus with a chord in front of (almost) every word.
+    """
+    rng = random.Random(seed)
+    chords = ["C", "d", "E-7", "F#-sus4", "c-sus4", "C#-sus2-sus4", "h", "G-M7", "A-/C#"]
+    lines = corpus_lines()
+    verses = []
+    for _ in range(n):
+        words = verse.parse_verse(rng.choice(lines)).lyrics.split(" ")
+        verses.append(verse.parse_verse(" ".join("<{}>{}".format(rng.choice(chords), word) for word in words)))
+    return verses
+
+
+def main(n=20000):
+    verses = dense_verses(n)
+    for vrs in verses:
+        assert str(vrs) == str_with_character_grid(vrs)
+    print("Rendering {} chord-dense verses".format(n))
+    print("    character grid {:8.3f} s".format(best_time(lambda: [str_with_character_grid(v) for v in verses])))
+    print("    Verse.__str__  {:8.3f} s".format(best_time(lambda: [str(v) for v in verses])))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
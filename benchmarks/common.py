@@ -0,0 +1,47 @@
+import os
+import time
+from song import parse_song
+
+
+SONGS_DIRECTORY = "songs"
+
+
+def corpus_files(directory=SONGS_DIRECTORY):
+    """
+    Finds the song files in the directory that can be parsed (some of them may contain typos).
+    :param directory: folder with song.parse_song compatible files
+    :return: sorted list of paths
+    """
+    files = []
+    for f in sorted(os.listdir(directory)):
+        path = os.path.join(directory, f)
+        if f.endswith(".txt"):
+            try:
+                parse_song(path)
+            except (KeyError, AssertionError):
+                continue
+            files.append(path)
+    return files
+
+
+def corpus_songs(copies=1, directory=SONGS_DIRECTORY):
+    """
+    Parses the songs from the directory and repeats them the given number of times.
+    :param copies: how many times each song appears in the result
+    :param directory: folder with song.parse_song compatible files
+    :return: list of Song objects
+    """
+    songs = [parse_song(f) for f in corpus_files(directory)]
+    return songs * copies
+
+
+def best_time(function, repeats=3):
+    """
+    Calls the function a couple of times and returns the fastest time (in seconds).
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
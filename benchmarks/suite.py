@@ -0,0 +1,180 @@
+"""
+Benchmark suite: times the main code paths on synthetic corpora (see benchmarks.synthetic) of the given sizes,
+and writes the results to a json file. The compare mode reports the benchmarks that got slower than in a baseline.
+Run from the root of the repository:
+    python -m benchmarks.suite run [--songs 1000 10000 ...] [--output bench_results.json] [--repeats 3]
+    python -m benchmarks.suite compare bench_results.json baseline.json [--tolerance 0.2]
+The exit status of compare is 1 if there are regressions.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+from io import StringIO
+import collect_chords
+import misc
+import render_cache
+import search
+import songbook
+from song import parse_song
+from benchmarks.common import best_time
+from benchmarks.synthetic import synthetic_songs, write_song_files, zipf_lyrics_songs
+
+
+DEFAULT_SIZES = [1000]
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_TOLERANCE = 0.2
+RESULTS_VERSION = 1
+QUERIES = 100
+
+
+def search_queries(index, n=QUERIES, seed=1234):
+    """
+    :return: queries of one, two and three words: the most common words, combined with each other and with
+    the less common ones
+    """
+    rng = random.Random(seed)
+    words = sorted(index.postings, key=lambda token: (-len(index.postings[token]), token))
+    common, other = words[:30], words[30:2000]
+    queries = common[:n // 4]
+    queries += [" ".join(rng.sample(common, 1) + rng.sample(other, 2)) for _ in range(n // 4)]
+    queries += [" ".join(rng.sample(common, 2)) for _ in range(n // 4)]
+    queries += [" ".join(rng.sample(common, 3)) for _ in range(n // 4)]
+    return queries
+
+
+class Corpus:
+    """
+    The inputs of the benchmarks for one size of the corpus (prepared before the timing starts).
+    """
+    def __init__(self, n, folder):
+        self.songs = synthetic_songs(n)
+        self.files = write_song_files(self.songs, folder)
+        self.verses = [vrs for sng in self.songs for stnza in sng.stanzas for vrs in stnza.verses]
+        self.chords = [chrd for vrs in self.verses for chrd, _ in vrs.chords]
+        self.book = songbook.SongBook(folder + "/bench.sgbk")
+        self.book.set_songs(self.songs)
+        # the lyrics of the synthetic songs repeat, so the search is benchmarked on distinct ones
+        self.lyrics = zipf_lyrics_songs(n)
+        self.lyrics_index = search.build_index(self.lyrics)
+        self.queries = search_queries(self.lyrics_index)
+
+
+def bench_parse(corpus):
+    for song_file in corpus.files:
+        parse_song(song_file)
+
+
+def bench_transpose(corpus):
+    for chrd in corpus.chords:
+        for half_tones in range(1, 12):
+            chrd.transpose(half_tones)
+
+
+def bench_user_friendly(corpus):
+    for sng in corpus.songs:
+        sng.most_user_friendly_version()
+
+
+def bench_verse_str(corpus):
+    for vrs in corpus.verses:
+        str(vrs)
+
+
+def bench_latex(corpus):
+    # a fresh cache, so that the songs are rendered every time
+    corpus.book.write_latex(StringIO(), render_cache.RenderCache())
+
+
+def bench_grip_lookup(corpus):
+    for chrd in corpus.chords:
+        collect_chords.get_finger_positions(chrd)
+
+
+def bench_search_index(corpus):
+    search.build_index(corpus.lyrics)
+
+
+def bench_search(corpus):
+    for query in corpus.queries:
+        corpus.lyrics_index.search(query)
+
+
+BENCHMARKS = [("parse_song", bench_parse),
+              ("Chord.transpose", bench_transpose),
+              ("Song.most_user_friendly_version", bench_user_friendly),
+              ("Verse.__str__", bench_verse_str),
+              ("SongBook.latex_string", bench_latex),
+              ("grip lookup", bench_grip_lookup),
+              ("search.build_index", bench_search_index),
+              ("SearchIndex.search", bench_search)]
+
+
+def run(sizes, repeats):
+    """
+    :return: {"version": ..., "python": ..., "results": {"<benchmark>/<number of songs>": seconds, ...}}
+    """
+    results = {}
+    for n in sizes:
+        folder = misc.create_temp_folder(".")
+        try:
+            corpus = Corpus(n, folder)
+            for name, function in BENCHMARKS:
+                key = "{}/{}".format(name, n)
+                results[key] = best_time(lambda: function(corpus), repeats)
+                print("    {:<40} {:8.3f} s".format(key, results[key]))
+        finally:
+            misc.remove_temp_folder(folder)
+    return {"version": RESULTS_VERSION, "python": platform.python_version(), "results": results}
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    :param results: the value of run
+    :param baseline: the value of run, for the reference version of the code
+    :param tolerance: the relative slowdown that is still fine
+    :return: list of triples (benchmark, baseline seconds, seconds) of the regressions
+    """
+    regressions = []
+    for key, seconds in results["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is not None and seconds > reference * (1 + tolerance):
+            regressions.append((key, reference, seconds))
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of parsing, transposing, rendering, grip lookup "
+                                                 "and lyrics search.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--songs", type=int, nargs="+", default=DEFAULT_SIZES, help="sizes of the corpora")
+    run_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="json file for the results")
+    run_parser.add_argument("--repeats", type=int, default=3, help="the best of how many runs is reported")
+    compare_parser = commands.add_parser("compare", help="compare the results with a baseline")
+    compare_parser.add_argument("results", help="json file with the results")
+    compare_parser.add_argument("baseline", help="json file with the results of the reference version")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                help="the relative slowdown that is not reported")
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "run":
+        results = run(arguments.songs, arguments.repeats)
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        return 0
+    with open(arguments.results, encoding="utf-8") as f:
+        results = json.load(f)
+    with open(arguments.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, arguments.tolerance)
+    for key, reference, seconds in regressions:
+        print("Regression: {:<40} {:8.3f} s -> {:8.3f} s ({:+.0%})".format(key, reference, seconds,
+                                                                          seconds / reference - 1))
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
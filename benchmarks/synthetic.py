@@ -0,0 +1,80 @@
+"""
+Synthetic corpora. synthetic_songs repeats the songs from the songs folder (with shuffled stanzas and numbered titles)
+up to the wanted number of songs. The chords are not changed, so the chord density is the one of the real songs,
+and the grips of all the chords are in the grip library. zipf_lyrics_songs makes songs with distinct lyrics.
+"""
+import itertools
+import os
+import random
+from song import Song, create_text_song
+from stanza import Stanza
+from verse import Verse
+from benchmarks.common import corpus_songs
+
+
+def synthetic_songs(n, seed=1234):
+    """
+    :param n: the number of songs
+    :param seed: the seed of the random generator
+    :return: list of n Song objects
+    """
+    rng = random.Random(seed)
+    templates = corpus_songs()
+    songs = []
+    for i in range(n):
+        template = templates[i % len(templates)]
+        stanzas = list(template.stanzas)
+        if i >= len(templates):
+            rng.shuffle(stanzas)
+        songs.append(Song(template.artist, "{} {}".format(template.title, i // len(templates)), stanzas))
+    return songs
+
+
+def write_song_files(songs, folder):
+    """
+    Writes the songs to song.parse_song compatible files.
+    :return: list of the paths
+    """
+    files = []
+    for i, sng in enumerate(songs):
+        path = os.path.join(folder, "song{}.txt".format(i))
+        create_text_song(path, sng.artist, sng.title,
+                         [[vrs.description() for vrs in stnza.verses] for stnza in sng.stanzas])
+        files.append(path)
+    return files
+
+
+def zipf_lyrics_songs(n, seed=1234, vocabulary=20000, exponent=1.1):
+    """
+    Songs with distinct lyrics (without chords): the words of the verses are drawn from a vocabulary of made-up
+    words with Zipf distributed frequencies, as in natural texts. Unlike synthetic_songs, the verses do not repeat,
+    so this is the corpus for the lyrics search.
+    :param n: the number of songs
+    :param seed: the seed of the random generator
+    :param vocabulary: the number of the words
+    :param exponent: the exponent of the Zipf distribution
+    :return: list of n Song objects
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "su", "ri", "da", "ve", "zo", "pa", "če", "ši", "žu", "to", "bu", "gle"]
+    words = []
+    for i in range(vocabulary):
+        word = ""
+        while True:
+            word += syllables[i % len(syllables)]
+            i //= len(syllables)
+            if not i:
+                break
+        words.append(word)
+    cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, vocabulary + 1)))
+    songs = []
+    for i in range(n):
+        stanzas = []
+        for _ in range(rng.randint(3, 6)):
+            verses = []
+            for _ in range(4):
+                lyrics = " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(3, 9)))
+                verses.append(Verse(lyrics.capitalize(), []))
+            stanzas.append(Stanza(verses))
+        songs.append(Song("Artist {}".format(i % 1000), "Song {}".format(i), stanzas))
+    return songs
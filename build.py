@@ -0,0 +1,167 @@
+"""
+Builds many songbooks from the same pool of songs. The songbooks are described by a manifest (json):
+
+{
+    "songs": "songs/",
+    "songbooks": [
+        {
+            "name": "Slon in Sadež",
+            "files": "slon_in_sadez*",
+            "transpose": "simplest",
+            "songbook": "songbooks/slon/slon.sgbk",
+            "tex": "songbooks/slon/slon.tex"
+        },
+        ...
+    ]
+}
+
+- songs: the folder with the song files (see song.parse_song),
+- files: shell-style pattern for the names of the song files (default: all the .txt files),
+- artist: optional, only the songs of this artist are included,
+- transpose: "original" (default), "simplest" (see Song.most_user_friendly_version) or a number of half-tones,
+- max_difficulty: optional, only the songs whose chords (after the transposition) are at most this difficult,
+- songbook and tex: the output files.
+
+The song files are parsed only once, and the songbooks are written by a pool of worker processes.
+With --pdf, the tex files are also compiled (see pdf.py); the unchanged ones are skipped.
+Usage: python build.py manifest.json [--workers N] [--pdf]
+"""
+import argparse
+import json
+import logging
+import os
+from fnmatch import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+import collect_chords
+import instrumentation
+import pdf
+import songbook
+import storage
+from song import song_key
+
+
+TRANSPOSE_ORIGINAL = "original"
+TRANSPOSE_SIMPLEST = "simplest"
+DEFAULT_FILES = "*.txt"
+
+_CORPUS = {}  # song file: Song, shared by the songbooks in a worker process
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(manifest_file):
+    with open(manifest_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def selected_files(definition, corpus_files):
+    pattern = definition.get("files", DEFAULT_FILES)
+    return [f for f in corpus_files if fnmatch(os.path.basename(f), pattern)]
+
+
+def transposition(definition, sng):
+    policy = definition.get("transpose", TRANSPOSE_ORIGINAL)
+    if policy == TRANSPOSE_ORIGINAL:
+        return 0
+    elif policy == TRANSPOSE_SIMPLEST:
+        return sng.best_transposition()
+    elif isinstance(policy, int):
+        return policy
+    raise ValueError("Unknown transposition policy {} of the songbook {}".format(policy, definition.get("name")))
+
+
+def select_songs(definition, corpus):
+    """
+    Chooses the songs of the songbook and their transpositions.
+    :param definition: the description of the songbook from the manifest
+    :param corpus: {song file: Song, ...}
+    :return: list of pairs (song file, number of half-tones)
+    """
+    selection = []
+    for song_file in selected_files(definition, sorted(corpus)):
+        sng = corpus[song_file]
+        if "artist" in definition and sng.artist != definition["artist"]:
+            continue
+        half_tones = transposition(definition, sng)
+        if "max_difficulty" in definition and sng.transpose(half_tones).difficulty() > definition["max_difficulty"]:
+            continue
+        selection.append((song_file, half_tones))
+    return selection
+
+
+def _init_worker(corpus):
+    _CORPUS.clear()
+    _CORPUS.update(corpus)
+
+
+def write_songbook(definition, selection):
+    """
+    Writes the songbook and its tex file. The songs are taken from the corpus of the (worker) process,
+    and the grips from the grip library, which was filled and saved by build.
+    :param definition: the description of the songbook from the manifest
+    :param selection: the value of select_songs
+    :return: the name of the songbook
+    """
+    for output in [definition["songbook"], definition["tex"]]:
+        folder = os.path.dirname(output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    # the previous songbook file is replaced as a whole, so it is not read
+    songs = sorted((_CORPUS[song_file].transpose(half_tones) for song_file, half_tones in selection),
+                   key=lambda sng: song_key(sng.artist, sng.title))
+    report_file = definition["tex"] + instrumentation.REPORT_FILE_ENDING
+    with instrumentation.instrumented("write_songbook", report_file=report_file):
+        with instrumentation.stage("write", len(songs)):
+            storage.write_songbook(definition["songbook"], songs)
+        with open(definition["tex"], "w", encoding="utf-8") as f:
+            songbook.write_latex(f, songs, fetch=False)
+            f.write("\n")
+    return definition.get("name", definition["songbook"])
+
+
+def build(manifest, workers=None):
+    """
+    Builds all the songbooks from the manifest.
+    :param manifest: the manifest (a dictionary, as described above)
+    :param workers: the number of worker processes (os.cpu_count() if None)
+    :return: the names of the songbooks that were built
+    """
+    directory = manifest["songs"]
+    corpus_files = sorted(os.path.join(directory, f) for f in os.listdir(directory))
+    definitions = manifest["songbooks"]
+    needed = sorted({f for definition in definitions for f in selected_files(definition, corpus_files)})
+    workers = os.cpu_count() if workers is None else workers
+    corpus = dict(zip(needed, songbook.parse_song_files(needed, workers)))
+    selections = [select_songs(definition, corpus) for definition in definitions]
+
+    # the grips are fetched (and saved) here, so that the workers only read the grip library
+    chords = {chrd.transpose(half_tones) for selection in selections for song_file, half_tones in selection
+              for stz in corpus[song_file].stanzas for vrs in stz.verses for chrd, _ in vrs.chords}
+    collect_chords.prefetch_finger_positions(chords)
+    collect_chords.save_grip_library()
+
+    if workers <= 1 or len(definitions) <= 1:
+        _init_worker(corpus)
+        return [write_songbook(definition, selection) for definition, selection in zip(definitions, selections)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(corpus,)) as executor:
+        return list(executor.map(write_songbook, definitions, selections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the songbooks that are described in the manifest.")
+    parser.add_argument("manifest", help="json file with the definitions of the songbooks")
+    parser.add_argument("--workers", type=int, default=None, help="the number of worker processes")
+    parser.add_argument("--pdf", action="store_true", help="compile the tex files with LaTeX")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    manifest = load_manifest(arguments.manifest)
+    for name in build(manifest, arguments.workers):
+        logger.info("Built %s", name)
+    if arguments.pdf:
+        tex_files = [definition["tex"] for definition in manifest["songbooks"]]
+        for tex_file, compiled in zip(tex_files, pdf.compile_pdfs(tex_files, arguments.workers)):
+            logger.info("%s %s", "Compiled" if compiled else "Up to date", pdf.pdf_file(tex_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import misc
+import song
+import songbook
+import build
+from unittest import mock
+
+
+class BuildTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        self.songs_folder = self.folder + "/songs"
+        os.makedirs(self.songs_folder)
+        names = ["b.prva.txt", "a.druga.txt", "c.tretja.txt", "notes.md"]
+        artists = ["b", "A", "c", "x"]
+        titles = ["Prva", "Druga", "Tretja", "Not a song"]
+        stanzass = [[["Tum <C> bum", "Pam <d> bam"], ["<a>Rom <G> pom"]],
+                    [["<E>Bird is the word"]],
+                    [["<D>Vse <A>je <G>lepo"]],
+                    [["Ignored"]]]
+        self.song_files = {}
+        for name, artist, title, stanzas in zip(names, artists, titles, stanzass):
+            self.song_files[artist] = self.songs_folder + "/" + name
+            song.create_text_song(self.song_files[artist], artist, title, stanzas)
+        self.manifest = {
+            "songs": self.songs_folder,
+            "songbooks": [
+                {"name": "all", "songbook": self.folder + "/all/all.sgbk", "tex": self.folder + "/all/all.tex"},
+                {"name": "b and c", "files": "[bc].*", "transpose": 2,
+                 "songbook": self.folder + "/bc.sgbk", "tex": self.folder + "/bc.tex"},
+                {"name": "only c", "artist": "c", "transpose": "simplest",
+                 "songbook": self.folder + "/c.sgbk", "tex": self.folder + "/c.tex"}
+            ]
+        }
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def assert_book(self, definition, expected):
+        expected.sort(key=lambda s: song.song_key(s.artist, s.title))
+        book = songbook.SongBook(definition["songbook"])
+        self.assertListEqual(expected, book.songs)
+        with open(definition["tex"], encoding="utf-8") as f:
+            self.assertEqual(book.latex_string() + "\n", f.read())
+
+    def assert_books(self):
+        songs = {artist: song.parse_song(f) for artist, f in self.song_files.items() if artist != "x"}
+        all_book, bc_book, c_book = self.manifest["songbooks"]
+        self.assert_book(all_book, list(songs.values()))
+        self.assert_book(bc_book, [songs["b"].transpose(2), songs["c"].transpose(2)])
+        self.assert_book(c_book, [songs["c"].most_user_friendly_version()])
+
+    def test_build_in_one_process(self):
+        self.assertListEqual(["all", "b and c", "only c"], build.build(self.manifest, workers=1))
+        self.assert_books()
+
+    def test_build_in_parallel(self):
+        self.assertListEqual(["all", "b and c", "only c"], build.build(self.manifest, workers=2))
+        self.assert_books()
+
+    def test_old_songbooks_are_not_read(self):
+        build.build(self.manifest, workers=1)
+        with mock.patch("storage.read_songbook") as read, mock.patch("storage.LazySongs") as lazy:
+            build.build(self.manifest, workers=1)
+        read.assert_not_called()
+        lazy.assert_not_called()
+        self.assert_books()
+
+    def test_songs_are_parsed_once(self):
+        with mock.patch("songbook.parse_song", wraps=song.parse_song) as parse:
+            build.build(self.manifest, workers=1)
+        self.assertEqual(3, parse.call_count)
+
+    def test_grips_are_fetched_and_saved_once(self):
+        with mock.patch("collect_chords.prefetch_finger_positions", return_value=[]) as prefetch, \
+                mock.patch("collect_chords.save_grip_library") as save:
+            build.build(self.manifest, workers=1)
+        self.assertEqual(1, prefetch.call_count)
+        self.assertEqual(1, save.call_count)
+
+    def test_max_difficulty(self):
+        definition = {"name": "easy", "max_difficulty": 0, "songbook": self.folder + "/easy.sgbk",
+                      "tex": self.folder + "/easy.tex"}
+        corpus = {f: song.parse_song(f) for f in self.song_files.values() if not f.endswith(".md")}
+        selection = build.select_songs(definition, corpus)
+        self.assertListEqual([f for f in sorted(corpus) if corpus[f].difficulty() <= 0], [f for f, _ in selection])
+
+    def test_unknown_policy(self):
+        definition = {"name": "wrong", "transpose": "up"}
+        with self.assertRaises(ValueError):
+            build.transposition(definition, song.parse_song(self.song_files["A"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,24 +34,90 @@ for tone in ["A#", "H", "C#", "Bb", "B", "Db"]:
 for tone in ["D#", "Eb"]:
     DIFFICULTY[tone] = BARRE_FROM_A[1]
 
+# the difficulty depends only on the index of the tone
+DIFFICULTY_BY_INDEX = [None] * NUMBER_HALFTONES
+for tone, tone_difficulty in DIFFICULTY.items():
+    assert DIFFICULTY_BY_INDEX[ALLOWED_TONES[tone][0]] in [None, tone_difficulty]
+    DIFFICULTY_BY_INDEX[ALLOWED_TONES[tone][0]] = tone_difficulty
+
 MAIN_DECORATION_SEPARATOR = "-"
 
 
+DECORATION_ORDER = {decoration: i for i, decoration in enumerate(DECORATIONS)}
+
+
 def get_tone_index(t):
     return ALLOWED_TONES[t][0]
 
 
+def transpose_tone(tone, half_tones):
+    """
+    Finds the tone that is the given number of half-tones above the given one. The sharp/flat spelling
+    of the original tone is kept, and H is used rather than B.
+    """
+    i_transposed = (get_tone_index(tone) + half_tones) % NUMBER_HALFTONES
+    candidates = [t for t in ALLOWED_TONES if get_tone_index(t) == i_transposed]
+    if len(candidates) == 1:
+        pass
+    elif i_transposed == get_tone_index("H"):
+        candidates = ["H"]
+    else:
+        contains_b = "b" in tone
+        candidates = [t for t in candidates if contains_b == ("b" in t)]
+        assert len(candidates) == 1
+    return candidates[0]
+
+
+# {tone: [tone transposed for 0 half-tones, ..., tone transposed for 11 half-tones], ...}
+TRANSPOSITION_TABLE = {tone: [transpose_tone(tone, shift) for shift in range(NUMBER_HALFTONES)]
+                       for tone in ALLOWED_TONES}
+
+
 class Chord:
-    def __init__(self, base_tone, decoration=None):
-        self.tone = base_tone
-        self.decoration = [] if decoration is None else decoration
-        self.decoration.sort(key=lambda d: DECORATIONS.index(d))
-        self.difficulty = DIFFICULTY[base_tone]
+    """
+    Immutable chord. There is only one instance of every chord (Chord("C", ["m"]) is Chord("C", ["m"])),
+    and everything that the other classes need (hash, sort key, str and latex string) is computed once,
+    when the instance is created.
+    """
+    __slots__ = ("tone", "decoration", "difficulty", "sort_key", "hash", "string", "latex", "transposed")
+    _instances = {}  # (tone, decoration): chord
+
+    def __new__(cls, base_tone, decoration=None):
+        decoration = () if decoration is None else tuple(sorted(decoration, key=DECORATION_ORDER.__getitem__))
+        key = (base_tone, decoration)
+        instance = Chord._instances.get(key)
+        if instance is None:
+            instance = object.__new__(cls)
+            initialize = object.__setattr__
+            initialize(instance, "tone", base_tone)
+            initialize(instance, "decoration", decoration)
+            initialize(instance, "difficulty", DIFFICULTY[base_tone])
+            initialize(instance, "sort_key", tuple([get_tone_index(base_tone)] +
+                                                   [DECORATION_ORDER[decor] for decor in decoration]))
+            initialize(instance, "hash", hash(key))
+            initialize(instance, "string", instance.compute_str())
+            initialize(instance, "latex", instance.compute_latex_string())
+            initialize(instance, "transposed", [None] * NUMBER_HALFTONES)  # filled by transpose
+            Chord._instances[key] = instance
+        return instance
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Chord objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Chord objects are immutable")
+
+    def __reduce__(self):
+        # unpickled chords are the interned instances as well
+        return Chord, (self.tone, list(self.decoration))
 
     def __repr__(self):
-        return "Chord('{}', {})".format(self.tone, self.decoration)
+        return "Chord('{}', {})".format(self.tone, list(self.decoration))
 
     def __str__(self):
+        return self.string
+
+    def compute_str(self):
         main = self.tone
         decor = self.decoration
         if self.decoration and self.decoration[0] == MINOR:
@@ -62,10 +128,10 @@ class Chord:
         return "{}{}{}".format(main, between, appendix)
 
     def __eq__(self, other):
-        return self.tone == other.tone and self.decoration == other.decoration
+        return self is other
 
     def tuple_to_compare(self):
-        return tuple([get_tone_index(self.tone)] + [DECORATIONS.index(decor) for decor in self.decoration])
+        return self.sort_key
 
     def __lt__(self, other):
         """
@@ -73,25 +139,18 @@ class Chord:
         :param other:
         :return:
         """
-        return self.tuple_to_compare() < other.tuple_to_compare()
+        return self.sort_key < other.sort_key
 
     def __hash__(self):
-        return hash(repr(self))
+        return self.hash
 
     def transpose(self, half_tones):
-        i = get_tone_index(self.tone)
-        i_transposed = (i + half_tones) % NUMBER_HALFTONES
-        candidates = [t for t in ALLOWED_TONES if get_tone_index(t) == i_transposed]
-        if len(candidates) == 1:
-            pass
-        elif i_transposed == get_tone_index("H"):
-            candidates = ["H"]
-        else:
-            contains_b = "b" in self.tone
-            candidates = [t for t in candidates if contains_b == ("b" in t)]
-            assert len(candidates) == 1
-        new_tone = candidates[0]
-        return Chord(new_tone, self.decoration)
+        shift = half_tones % NUMBER_HALFTONES
+        transposed = self.transposed[shift]
+        if transposed is None:
+            transposed = Chord(TRANSPOSITION_TABLE[self.tone][shift], self.decoration)
+            self.transposed[shift] = transposed
+        return transposed
 
     def latex_string(self):
         """
@@ -99,7 +158,10 @@ class Chord:
         e.g., \\[C#] or \\[C#$^\\text{ sus2}$].
         :return: the described string
         """
-        chord_str = str(self)
+        return self.latex
+
+    def compute_latex_string(self):
+        chord_str = self.string
         i = chord_str.find(MAIN_DECORATION_SEPARATOR)
         if i >= 0:
             main = chord_str[:i]
@@ -115,14 +177,19 @@ class Chord:
         return modified
 
 
+_PARSED = {}  # string: chord
+
+
 def parse(chord):
-    atoms = chord.split(MAIN_DECORATION_SEPARATOR)
-    decoration = atoms[1:]
-    base_tone = atoms[0]
-    if base_tone not in ALLOWED_TONES:
-        decoration = ["m"] + decoration
-        base_tone = base_tone.upper()
-    if len(decoration):
-        return Chord(base_tone, decoration)
-    else:
-        return Chord(base_tone)
+    """
+    The inverse of Chord.__str__, e.g., parse("c#-7") is Chord("C#", ["m", "7"]).
+    """
+    if chord not in _PARSED:
+        atoms = chord.split(MAIN_DECORATION_SEPARATOR)
+        decoration = atoms[1:]
+        base_tone = atoms[0]
+        if base_tone not in ALLOWED_TONES:
+            decoration = ["m"] + decoration
+            base_tone = base_tone[:1].upper() + base_tone[1:]  # bb is B-flat minor
+        _PARSED[chord] = Chord(base_tone, decoration)
+    return _PARSED[chord]
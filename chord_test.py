@@ -1,4 +1,5 @@
 import unittest
+import pickle
 import chord
 
 
@@ -60,14 +61,29 @@ class ChordTest(unittest.TestCase):
         for i, half_tones in enumerate(minuses):
             self.assertEqual(chord_2.transpose(half_tones), transposed[i])
 
+    def test_transposition_table(self):
+        for tone in chord.ALLOWED_TONES:
+            self.assertEqual(chord.NUMBER_HALFTONES, len(chord.TRANSPOSITION_TABLE[tone]))
+            for half_tones in range(-15, 15):
+                transposed = chord.Chord(tone, ["m"]).transpose(half_tones)
+                self.assertEqual(chord.transpose_tone(tone, half_tones), transposed.tone)
+                self.assertEqual(("b" in tone) and len(transposed.tone) == 2, "b" in transposed.tone)
+                self.assertIs(transposed, chord.Chord(tone, ["m"]).transpose(half_tones + 12))
+        self.assertIs(chord.Chord("Bb").transpose(2), chord.Chord("C"))
+        self.assertIs(chord.Chord("Bb").transpose(3), chord.Chord("Db"))
+        self.assertIs(chord.Chord("A#").transpose(3), chord.Chord("C#"))
+        self.assertIs(chord.Chord("A").transpose(2), chord.Chord("H"))
+
     def test_parse_str(self):
-        strings = ["C-M7", "D#-sus2-sus4", "E-sus4", "d-7", "f#", "G"]
+        strings = ["C-M7", "D#-sus2-sus4", "E-sus4", "d-7", "f#", "G", "bb", "Db-7"]
         chords = [chord.Chord("C", ["M7"]),
                   chord.Chord("D#", ["sus2", "sus4"]),
                   chord.Chord("E", ["sus4"]),
                   chord.Chord("D", ["m", "7"]),
                   chord.Chord("F#", ["m"]),
-                  chord.Chord("G")]
+                  chord.Chord("G"),
+                  chord.Chord("Bb", ["m"]),
+                  chord.Chord("Db", ["7"])]
 
         for chord_string, chord_object in zip(strings, chords):
             self.assertEqual(chord.parse(chord_string), chord_object)
@@ -91,6 +107,27 @@ class ChordTest(unittest.TestCase):
         for ans, elt in zip(answers, chords):
             self.assertEqual(ans, elt.latex_string())
 
+    def test_interned(self):
+        decoration = ["sus4", "m"]
+        chord_1 = chord.Chord("D#", decoration)
+        self.assertIs(chord_1, chord.Chord("D#", ["m", "sus4"]))
+        self.assertIs(chord_1, chord.parse("d#-sus4"))
+        self.assertIs(chord_1, pickle.loads(pickle.dumps(chord_1)))
+        self.assertListEqual(["sus4", "m"], decoration)
+        self.assertEqual(hash(chord_1), hash(chord.Chord("D#", ["m", "sus4"])))
+
+    def test_immutable(self):
+        chord_1 = chord.Chord("C", ["7"])
+        with self.assertRaises(AttributeError):
+            chord_1.tone = "D"
+        with self.assertRaises(AttributeError):
+            del chord_1.decoration
+        self.assertEqual("Chord('C', ['7'])", repr(chord_1))
+
+    def test_sort(self):
+        chords = [chord.parse(c) for c in ["H", "c-7", "C", "C#", "c", "A-sus2", "C-7"]]
+        self.assertListEqual(["C", "c", "c-7", "C-7", "C#", "A-sus2", "H"], [str(c) for c in sorted(chords)])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,11 +5,26 @@ import urllib.request
 import urllib.error
 # noinspection PyUnresolvedReferences
 from chord import Chord, ALLOWED_TONES, get_tone_index
-from time import sleep
-from random import random
+from time import sleep, monotonic
+from os.path import exists
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import grip_library
 
 
-GRIP_LIBRARY_FILE = "grips.txt"  # contains dictionary {repr(chord): [repr(grip1), ... }
+logger = logging.getLogger(__name__)
+
+GRIP_LIBRARY_FILE = "grips.store"  # see grip_library.GripLibrary
+LEGACY_GRIP_LIBRARY_FILE = "grips.txt"  # contains dictionary {repr(chord): [repr(grip1), ... }
+CHORD_URL_BASE = "https://www.8notes.com/guitar_chord_chart/"
+
+# politeness towards the chord site: at most REQUESTS_PER_SECOND on average, and at most REQUESTS_BURST at once
+REQUESTS_PER_SECOND = 1.0
+REQUESTS_BURST = 4
+FETCH_WORKERS = 4
+FETCH_RETRIES = 3
+FETCH_TIMEOUT = 30
 
 MINOR = ("m",)
 SEVEN = ("7",)
@@ -33,29 +48,36 @@ for allowed_tone in ALLOWED_TONES:
     ALLOWED_DECORATIONS["/{}".format(allowed_tone)] = "_{}-bass".format(ALLOWED_TONES[allowed_tone][1])
 
 
+_GRIP_LIBRARY = None
+_UNAVAILABLE_CHORDS = set()  # the chords whose grips could not be obtained in this run
+
+
 def load_grip_library():
-    with open(GRIP_LIBRARY_FILE) as f:
-        return eval(f.readline())
+    if not exists(GRIP_LIBRARY_FILE) and exists(LEGACY_GRIP_LIBRARY_FILE):
+        return grip_library.import_legacy_library(LEGACY_GRIP_LIBRARY_FILE, GRIP_LIBRARY_FILE)
+    return grip_library.GripLibrary(GRIP_LIBRARY_FILE)
 
 
-GRIP_LIBRARY = load_grip_library()
+def get_grip_library():
+    """
+    The grip library is loaded when it is needed for the first time. Even then, only the grips of the chords
+    that are asked for are decoded.
+    :return: GripLibrary object
+    """
+    global _GRIP_LIBRARY
+    if _GRIP_LIBRARY is None:
+        _GRIP_LIBRARY = load_grip_library()
+    return _GRIP_LIBRARY
 
 
 def save_grip_library():
-    with open(GRIP_LIBRARY_FILE, "w") as f:
-        print(repr(GRIP_LIBRARY), file=f)
+    get_grip_library().save()
 
 
 def filter_grip_library():
-    new_lib = {}
-    global GRIP_LIBRARY
-    for key, grips in GRIP_LIBRARY.items():
-        updated = []
-        for g in grips:
-            if g not in updated:
-                updated.append(g)
-        new_lib[key] = updated
-    GRIP_LIBRARY = new_lib
+    library = get_grip_library()
+    for key, grips in library.items():
+        library[key] = grip.unique_grips(grips)
 
 
 class ChordHTMLParser(HTMLParser):
@@ -219,7 +241,7 @@ class ChordHTMLParser(HTMLParser):
         if is_ok:
             self.grips.append(grip.Grip(fret, open_closed_pressed, positions_dict, self.chord))
         else:
-            print("This grip description is not valid.")
+            logger.warning("A grip description of the chord %s is not valid", self.chord)
 
 
 def transform_decoration(my_chord):
@@ -238,16 +260,121 @@ def transform_decoration(my_chord):
     return False, None
 
 
-def chord_url(my_chord):
+def chord_url(my_chord, base_url=CHORD_URL_BASE):
     tone_str = ALLOWED_TONES[my_chord.tone][1]
     is_ok, decoration_str = transform_decoration(my_chord)
     if is_ok:
-        return "https://www.8notes.com/guitar_chord_chart/{0}{1}.asp".format(tone_str, decoration_str)
+        return "{0}{1}{2}.asp".format(base_url, tone_str, decoration_str)
     else:
-        print("Probably, the chord {} cannot be found on the internet:)".format(my_chord))
+        logger.warning("Probably, the chord %s cannot be found on the internet", my_chord)
         return None
 
 
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter: the bucket holds at most capacity tokens, and it is refilled
+    with rate tokens per second. Every request takes one token (and waits for it if necessary).
+    """
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=REQUESTS_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+DEFAULT_BUCKET = TokenBucket()
+
+
+def fetch_html(url, bucket=DEFAULT_BUCKET, retries=FETCH_RETRIES, backoff=1.0):
+    """
+    Downloads the page. Server errors and network errors are retried (with exponentially growing pauses),
+    client errors (e.g., 404 for a wrong url) are not.
+    :param url: the page address
+    :param bucket: TokenBucket that limits the rate of the requests
+    :param retries: the number of additional attempts
+    :param backoff: the pause (in seconds) after the first failed attempt
+    :return: the contents of the page or None if it could not be obtained
+    """
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+                return response.read().decode("utf8")
+        except urllib.error.HTTPError as error:
+            if error.code < 500:
+                logger.warning("Wrong url? %s (%d)", url, error.code)
+                return None
+            logger.warning("Server error for %s (%d)", url, error.code)
+        except (urllib.error.URLError, OSError) as error:
+            logger.warning("Could not reach %s: %s", url, error)
+        if attempt < retries:
+            sleep(backoff * 2 ** attempt)
+    return None
+
+
+def fetch_grips(my_chord, bucket=DEFAULT_BUCKET, retries=FETCH_RETRIES, base_url=CHORD_URL_BASE):
+    """
+    Downloads and parses the grips of the chord.
+    :return: list of Grip objects or None if they could not be obtained
+    """
+    url = chord_url(my_chord, base_url)
+    if url is None:
+        return None
+    logger.info("Obtaining grips for the chord %s from url %s", my_chord, url)
+    html_description = fetch_html(url, bucket, retries)
+    if html_description is None:
+        return None
+    my_parser = ChordHTMLParser(my_chord)
+    try:
+        my_parser.feed(html_description)
+    except (AssertionError, AttributeError, IndexError, KeyError, ValueError) as error:
+        logger.warning("Could not parse the grips of the chord %s from %s: %r", my_chord, url, error)
+        return None
+    return my_parser.grips
+
+
+def prefetch_finger_positions(chords, workers=FETCH_WORKERS, bucket=DEFAULT_BUCKET, retries=FETCH_RETRIES,
+                              base_url=CHORD_URL_BASE):
+    """
+    Concurrently downloads the grips of the chords that are not in the grip library yet
+    and adds them to the library.
+    :param chords: iterable of Chord objects, e.g., SongBook.chords()
+    :param workers: the number of threads that download the pages
+    :param bucket: TokenBucket that limits the rate of the requests
+    :param retries: the number of additional attempts for every chord
+    :param base_url: the address of the chord site
+    :return: list of the chords whose grips could not be obtained. They are not asked for again in this run.
+    """
+    library = get_grip_library()
+    missing = sorted({my_chord for my_chord in chords if repr(my_chord) not in library})
+    failed = [my_chord for my_chord in missing if my_chord in _UNAVAILABLE_CHORDS]
+    missing = [my_chord for my_chord in missing if my_chord not in _UNAVAILABLE_CHORDS]
+    if not missing:
+        return failed
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda c: fetch_grips(c, bucket, retries, base_url), missing))
+    for my_chord, grips in zip(missing, results):
+        if grips is None:
+            failed.append(my_chord)
+            _UNAVAILABLE_CHORDS.add(my_chord)
+        else:
+            library[repr(my_chord)] = grips
+    return sorted(failed)
+
+
 def load_test_html():
     a = []
     with open("html_am.txt") as f:
@@ -256,33 +383,28 @@ def load_test_html():
     return "".join(a)
 
 
+def lookup_finger_positions(my_chord):
+    """
+    Only reads the grip library, e.g., after prefetch_finger_positions.
+    :return: list of Grip objects or None if the chord is not in the library
+    """
+    library = get_grip_library()
+    return library[repr(my_chord)] if repr(my_chord) in library else None
+
+
 def get_finger_positions(my_chord, debug=False):
-    if repr(my_chord) not in GRIP_LIBRARY:
-        print("Obtaing grips from the chord {}".format(my_chord))
-        url = chord_url(my_chord)
-        if url is not None:
-            print("    from url", url)
-            my_parser = ChordHTMLParser(my_chord)
-            if not debug:
-                try:
-                    html_description = urllib.request.urlopen(url).read().decode("utf8")
-                    a = int(15 + 20 * random())
-                    print("Sleeping for", a, "seconds")
-                    sleep(a)
-                    my_parser.feed(html_description)
-                    GRIP_LIBRARY[repr(my_chord)] = my_parser.grips
-                except urllib.error.HTTPError:
-                    print("Wrong url for {}?".format(my_chord), url)
-                    return None
-                except:
-                    print("Something went wrong")
-                    return None
-            else:
-                html_description = load_test_html()
-                my_parser.feed(html_description)
+    library = get_grip_library()
+    if repr(my_chord) not in library:
+        if my_chord in _UNAVAILABLE_CHORDS:
+            return None
+        if not debug:
+            grips = fetch_grips(my_chord)
+            if grips is None:
+                _UNAVAILABLE_CHORDS.add(my_chord)
                 return None
+            library[repr(my_chord)] = grips
         else:
+            my_parser = ChordHTMLParser(my_chord)
+            my_parser.feed(load_test_html())
             return None
-    return GRIP_LIBRARY[repr(my_chord)]
-
-
+    return library[repr(my_chord)]
@@ -0,0 +1,131 @@
+import unittest
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+import misc
+import collect_chords
+import grip_library
+from chord import Chord
+
+
+class ChordPageHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the chord site: every page is html_am.txt, except for the configured failures.
+    """
+    page = None
+    server_errors = {}  # path: number of 500 responses before the page is served
+    not_found = set()
+    broken = set()  # paths whose page is not a valid grip table
+    requested = []
+
+    def do_GET(self):
+        ChordPageHandler.requested.append(self.path)
+        if self.path in ChordPageHandler.not_found:
+            self.send_error(404)
+        elif self.path in ChordPageHandler.broken:
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'<div class="greybox g2"><table class="piano_table"><tr><td>-</td></tr></table></div>')
+        elif ChordPageHandler.server_errors.get(self.path, 0) > 0:
+            ChordPageHandler.server_errors[self.path] -= 1
+            self.send_error(500)
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(ChordPageHandler.page)
+
+    def log_message(self, *args):
+        pass
+
+
+class CollectChordsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("html_am.txt", "rb") as f:
+            ChordPageHandler.page = f.read()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ChordPageHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ChordPageHandler.server_errors = {}
+        ChordPageHandler.not_found = set()
+        ChordPageHandler.broken = set()
+        ChordPageHandler.requested = []
+        self.folder = misc.create_temp_folder(".")
+        self.library = grip_library.GripLibrary(self.folder + "/grips.store")
+        self.library_patch = mock.patch.object(collect_chords, "_GRIP_LIBRARY", self.library)
+        self.library_patch.start()
+        self.unavailable_patch = mock.patch.object(collect_chords, "_UNAVAILABLE_CHORDS", set())
+        self.unavailable_patch.start()
+        self.bucket = collect_chords.TokenBucket(rate=1000, capacity=10)
+
+    def tearDown(self):
+        self.library_patch.stop()
+        self.unavailable_patch.stop()
+        misc.remove_temp_folder(self.folder)
+
+    def prefetch(self, chords, retries=2):
+        with mock.patch.object(collect_chords, "sleep"):  # no pauses between the retries
+            return collect_chords.prefetch_finger_positions(chords, workers=3, bucket=self.bucket, retries=retries,
+                                                            base_url=self.base_url)
+
+    def test_prefetch(self):
+        chords = [Chord("A", ["m"]), Chord("C"), Chord("D", ["7"]), Chord("C")]
+        self.assertListEqual([], self.prefetch(chords))
+        self.assertListEqual(["/am.asp", "/c.asp", "/d7.asp"], sorted(ChordPageHandler.requested))
+        for chrd in chords:
+            self.assertEqual(9, len(self.library[repr(chrd)]))
+        self.assertEqual(Chord("C"), self.library[repr(Chord("C"))][0].chord)
+
+    def test_prefetch_skips_known_chords(self):
+        self.library[repr(Chord("C"))] = []
+        self.assertListEqual([], self.prefetch([Chord("C"), Chord("G")]))
+        self.assertListEqual(["/g.asp"], ChordPageHandler.requested)
+
+    def test_retry_server_errors(self):
+        ChordPageHandler.server_errors = {"/e.asp": 2}
+        self.assertListEqual([], self.prefetch([Chord("E")], retries=2))
+        self.assertListEqual(["/e.asp"] * 3, ChordPageHandler.requested)
+
+    def test_give_up(self):
+        ChordPageHandler.server_errors = {"/e.asp": 5}
+        ChordPageHandler.not_found = {"/f.asp"}
+        self.assertListEqual([Chord("E"), Chord("F")], self.prefetch([Chord("E"), Chord("F")], retries=1))
+        self.assertEqual(2, ChordPageHandler.requested.count("/e.asp"))
+        self.assertEqual(1, ChordPageHandler.requested.count("/f.asp"))
+        self.assertNotIn(repr(Chord("E")), self.library)
+
+    def test_failed_chords_are_not_fetched_again(self):
+        ChordPageHandler.not_found = {"/f.asp"}
+        self.assertListEqual([Chord("F")], self.prefetch([Chord("C"), Chord("F")]))
+        self.assertListEqual([Chord("F")], self.prefetch([Chord("C"), Chord("F")]))
+        self.assertIsNone(collect_chords.get_finger_positions(Chord("F")))
+        self.assertIsNone(collect_chords.lookup_finger_positions(Chord("F")))
+        self.assertEqual(9, len(collect_chords.lookup_finger_positions(Chord("C"))))
+        self.assertListEqual(["/c.asp", "/f.asp"], sorted(ChordPageHandler.requested))
+
+    def test_page_that_cannot_be_parsed(self):
+        ChordPageHandler.broken = {"/g.asp"}
+        self.assertListEqual([Chord("G")], self.prefetch([Chord("A"), Chord("G")]))
+        self.assertEqual(9, len(self.library[repr(Chord("A"))]))
+        self.assertNotIn(repr(Chord("G")), self.library)
+
+    def test_token_bucket(self):
+        bucket = collect_chords.TokenBucket(rate=50, capacity=2)
+        start = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 * 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,18 +19,22 @@ class Grip:
         self.open_closed_pressed = open_closed_pressed
         self.positions = positions_dict
         self.chord = chord
+        # canonical description, used for comparisons and hashing (the grips are not modified after creation)
+        self.key = (fret,
+                    tuple(sorted(open_closed_pressed.items())),
+                    tuple(sorted((fret_number, string_number, finger_number)
+                                 for fret_number, fingers in positions_dict.items()
+                                 for string_number, finger_number in fingers.items())))
+        self.hash = hash(self.key)
 
     def __repr__(self):
         return "grip.Grip({}, {}, {}, {})".format(self.fret, self.open_closed_pressed, self.positions, repr(self.chord))
 
     def __eq__(self, other):
-        same_frets = self.fret == other.fret
-        same_ocp = self.open_closed_pressed == other.open_closed_pressed
-        same_pos = self.positions == other.positions
-        return same_frets and same_ocp and same_pos
+        return self.key == other.key
 
     def __hash__(self):
-        return hash(repr(self))
+        return self.hash
 
     def latex_string(self):
         fret_representation = self.fret if self.fret != 1 else ""
@@ -53,12 +57,16 @@ class Grip:
                                                   fingers_where)
 
 
+def unique_grips(grips):
+    """
+    Removes the duplicates from the list of grips, but keeps the order of the first occurrences.
+    """
+    return list(dict.fromkeys(grips))
+
+
 class Grips:
     def __init__(self, grips):
-        self.grips = []
-        for grip in grips:
-            if grip not in self.grips:
-                self.grips.append(grip)
+        self.grips = unique_grips(grips)
 
     def latex_string(self):
         header = ["\\begin{table}",
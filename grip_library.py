@@ -0,0 +1,152 @@
+import json
+import os
+from os.path import exists
+from chord import Chord
+import grip
+import storage
+
+
+# Every line of the store describes the grips of one chord:
+# <json [tone, decoration]><tab><json [grip1, ...]>, where grip1 = [fret, [state of string 1, ...],
+# [[fret number, [[string number, finger number], ...]], ...]] (see Grip).
+# Only the keys are read when the store is opened, the grips of a chord are decoded when they are needed.
+# The store is append-only: a changed chord is appended as a new line, and the last line of a chord wins.
+# Once there are COMPACTION_RATIO times more lines than chords, the store is rewritten.
+KEY_SEPARATOR = b"\t"
+COMPACTION_RATIO = 2
+COMPACTION_MIN_LINES = 64
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_DECODER = json.JSONDecoder()
+
+
+def encode_grip(g):
+    strings = [g.open_closed_pressed[string] for string in range(1, 7)]
+    positions = [[fret_number, [[string, finger] for string, finger in fingers.items()]]
+                 for fret_number, fingers in g.positions.items()]
+    return [g.fret, strings, positions]
+
+
+def decode_grip(description, chord):
+    fret, strings, positions = description
+    open_closed_pressed = {string + 1: state for string, state in enumerate(strings)}
+    positions_dict = {fret_number: {string: finger for string, finger in fingers} for fret_number, fingers in positions}
+    return grip.Grip(fret, open_closed_pressed, positions_dict, chord)
+
+
+def encode_key(chord):
+    return _ENCODER.encode([chord.tone, list(chord.decoration)]).encode("utf-8")
+
+
+def encode_grips(grips):
+    return _ENCODER.encode([encode_grip(g) for g in grips]).encode("utf-8")
+
+
+class GripLibrary:
+    """
+    Dictionary-like container {repr(chord): [grip1, ...], ...} backed by a store file.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.chords = {}    # repr(chord): chord
+        self.raw = {}       # repr(chord): encoded grips, as in the store
+        self.grips = {}     # repr(chord): decoded grips
+        self.dirty = set()  # the chords that changed since the last save
+        self.lines = 0      # the number of records in the store
+        self.needs_compaction = False
+        if exists(file_name):
+            with open(file_name, "rb") as f:
+                for line in f:
+                    i = line.find(KEY_SEPARATOR)
+                    if i < 0 or not line.endswith(b"\n"):
+                        # a record that was not written completely (or garbage)
+                        self.needs_compaction = True
+                        continue
+                    tone, decoration = _DECODER.decode(line[:i].decode("utf-8"))
+                    chord = Chord(tone, decoration)
+                    self.chords[repr(chord)] = chord
+                    self.raw[repr(chord)] = line[i + 1:].rstrip(b"\r\n")
+                    self.lines += 1
+
+    def __contains__(self, key):
+        return key in self.chords
+
+    def __len__(self):
+        return len(self.chords)
+
+    def __getitem__(self, key):
+        if key not in self.grips:
+            chord = self.chords[key]
+            self.grips[key] = [decode_grip(g, chord) for g in _DECODER.decode(self.raw[key].decode("utf-8"))]
+        return self.grips[key]
+
+    def __setitem__(self, key, grips):
+        """
+        :param key: repr(chord)
+        :param grips: list of Grip objects of the chord
+        """
+        if key in self.chords:
+            if self[key] == grips:
+                return
+        else:
+            self.chords[key] = storage.legacy_literal(key, {"Chord": Chord})
+        self.raw.pop(key, None)
+        self.grips[key] = grips
+        self.dirty.add(key)
+
+    def keys(self):
+        return self.chords.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self.chords]
+
+    def encoded(self, key):
+        value = self.raw[key] if key in self.raw else encode_grips(self.grips[key])
+        return encode_key(self.chords[key]) + KEY_SEPARATOR + value + b"\n"
+
+    def save(self):
+        """
+        Appends the changed chords to the store. If nothing changed, the store is not touched.
+        """
+        if not self.dirty and not self.needs_compaction:
+            return
+        new_lines = self.lines + len(self.dirty)
+        if self.needs_compaction or new_lines >= max(COMPACTION_MIN_LINES, COMPACTION_RATIO * len(self.chords)):
+            self.compact()
+            return
+        with open(self.file_name, "ab") as f:
+            f.write(b"".join(self.encoded(key) for key in self.chords if key in self.dirty))
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines = new_lines
+        self.dirty.clear()
+
+    def compact(self):
+        """
+        Writes the library (one line per chord) to a temporary file, and replaces the store with it.
+        """
+        temporary = self.file_name + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(b"".join(self.encoded(key) for key in self.chords))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.file_name)
+        self.lines = len(self.chords)
+        self.dirty.clear()
+        self.needs_compaction = False
+
+
+def import_legacy_library(legacy_file, file_name):
+    """
+    Converts the old library file (the repr of the dictionary {repr(chord): [repr(grip1), ...], ...}) to a store.
+    :param legacy_file: path to the old file
+    :param file_name: path to the new store
+    :return: GripLibrary object
+    """
+    with open(legacy_file) as f:
+        legacy = storage.legacy_literal(f.readline(), {"Chord": Chord, "grip.Grip": grip.Grip})
+    library = GripLibrary(file_name)
+    for key, grips in legacy.items():
+        library[key] = grips
+    library.compact()
+    return library
@@ -0,0 +1,122 @@
+import unittest
+import os
+from unittest import mock
+import misc
+import grip
+import grip_library
+from chord import Chord
+
+
+class GripLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        self.store = self.folder + "/grips.store"
+        self.chord_h = Chord("H")
+        self.chord_a = Chord("A", ["m"])
+        self.grips_h = [grip.Grip(1, {1: 'x', 2: '', 3: '', 4: '', 5: '', 6: ''},
+                                  {1: {}, 2: {2: 1, 6: 1}, 3: {}, 4: {3: 3, 4: 3, 5: 3}}, self.chord_h),
+                        grip.Grip(7, {1: '', 2: '', 3: '', 4: '', 5: '', 6: ''},
+                                  {1: {1: 1, 5: 1, 6: 1}, 2: {4: 2}, 3: {2: 3, 3: 4}, 4: {}}, self.chord_h)]
+        self.grips_a = [grip.Grip(1, {1: 'o', 2: '', 3: '', 4: '', 5: 'o', 6: 'x'},
+                                  {1: {2: 1}, 2: {3: 3, 4: 2}, 3: {}, 4: {}}, self.chord_a)]
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def assert_same_grips(self, expected, actual):
+        self.assertListEqual(expected, actual)
+        self.assertListEqual([repr(g) for g in expected], [repr(g) for g in actual])
+
+    def test_save_and_load(self):
+        library = grip_library.GripLibrary(self.store)
+        self.assertEqual(0, len(library))
+        library[repr(self.chord_h)] = self.grips_h
+        library[repr(self.chord_a)] = self.grips_a
+        library.save()
+
+        loaded = grip_library.GripLibrary(self.store)
+        self.assertEqual(2, len(loaded))
+        self.assertIn(repr(self.chord_a), loaded)
+        self.assertNotIn(repr(Chord("C")), loaded)
+        self.assertDictEqual({}, loaded.grips)
+        self.assert_same_grips(self.grips_a, loaded[repr(self.chord_a)])
+        self.assertListEqual([repr(self.chord_a)], list(loaded.grips))
+        self.assert_same_grips(self.grips_h, loaded[repr(self.chord_h)])
+
+    def test_save_keeps_undecoded_grips(self):
+        library = grip_library.GripLibrary(self.store)
+        library[repr(self.chord_h)] = self.grips_h
+        library[repr(self.chord_a)] = self.grips_a
+        library.save()
+        loaded = grip_library.GripLibrary(self.store)
+        loaded[repr(self.chord_a)] = self.grips_a[:0]
+        loaded.save()
+        reloaded = grip_library.GripLibrary(self.store)
+        self.assert_same_grips(self.grips_h, reloaded[repr(self.chord_h)])
+        self.assertListEqual([], reloaded[repr(self.chord_a)])
+
+    def number_of_lines(self):
+        with open(self.store, "rb") as f:
+            return len(f.readlines())
+
+    def test_unchanged_library_is_not_written(self):
+        library = grip_library.GripLibrary(self.store)
+        library[repr(self.chord_h)] = self.grips_h
+        library.save()
+        loaded = grip_library.GripLibrary(self.store)
+        loaded[repr(self.chord_h)] = list(self.grips_h)
+        with mock.patch("builtins.open") as mocked_open:
+            loaded.save()
+        mocked_open.assert_not_called()
+
+    def test_changes_are_appended(self):
+        library = grip_library.GripLibrary(self.store)
+        library[repr(self.chord_h)] = self.grips_h
+        library[repr(self.chord_a)] = self.grips_a
+        library.save()
+        self.assertEqual(2, self.number_of_lines())
+        library[repr(self.chord_h)] = self.grips_h[:1]
+        library.save()
+        self.assertEqual(3, self.number_of_lines())
+        loaded = grip_library.GripLibrary(self.store)
+        self.assertEqual(2, len(loaded))
+        self.assert_same_grips(self.grips_h[:1], loaded[repr(self.chord_h)])
+        self.assert_same_grips(self.grips_a, loaded[repr(self.chord_a)])
+
+    def test_compaction(self):
+        library = grip_library.GripLibrary(self.store)
+        for i in range(grip_library.COMPACTION_MIN_LINES):
+            library[repr(self.chord_h)] = self.grips_h[i % 2:]
+            library.save()
+        self.assertEqual(1, self.number_of_lines())
+        self.assertFalse(os.path.exists(self.store + ".tmp"))
+        self.assert_same_grips(self.grips_h[1:], grip_library.GripLibrary(self.store)[repr(self.chord_h)])
+
+    def test_incomplete_record_is_ignored(self):
+        library = grip_library.GripLibrary(self.store)
+        library[repr(self.chord_h)] = self.grips_h
+        library.save()
+        with open(self.store, "ab") as f:
+            f.write(grip_library.encode_key(self.chord_a) + b"\t[[1,")
+        loaded = grip_library.GripLibrary(self.store)
+        self.assertNotIn(repr(self.chord_a), loaded)
+        loaded[repr(self.chord_a)] = self.grips_a
+        loaded.save()
+        self.assertEqual(2, self.number_of_lines())
+        reloaded = grip_library.GripLibrary(self.store)
+        self.assert_same_grips(self.grips_h, reloaded[repr(self.chord_h)])
+        self.assert_same_grips(self.grips_a, reloaded[repr(self.chord_a)])
+
+    def test_import_legacy_library(self):
+        legacy_file = self.folder + "/grips.txt"
+        with open(legacy_file, "w") as f:
+            print(repr({repr(self.chord_h): self.grips_h, repr(self.chord_a): self.grips_a}), file=f)
+        grip_library.import_legacy_library(legacy_file, self.store)
+        self.assertTrue(os.path.exists(self.store))
+        loaded = grip_library.GripLibrary(self.store)
+        self.assert_same_grips(self.grips_h, loaded[repr(self.chord_h)])
+        self.assert_same_grips(self.grips_a, loaded[repr(self.chord_a)])
+
+
+if __name__ == "__main__":
+    unittest.main()
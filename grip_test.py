@@ -0,0 +1,41 @@
+import unittest
+import grip
+from chord import Chord
+
+
+class GripTest(unittest.TestCase):
+    def setUp(self):
+        self.open_strings = {1: 'x', 2: '', 3: '', 4: '', 5: '', 6: ''}
+        self.positions = {1: {}, 2: {2: 1, 6: 1}, 3: {}, 4: {3: 3, 4: 3, 5: 3}}
+        self.grip_1 = grip.Grip(1, self.open_strings, self.positions, Chord("H"))
+        self.grip_2 = grip.Grip(7, {1: '', 2: '', 3: '', 4: '', 5: '', 6: ''},
+                                {1: {1: 1, 5: 1, 6: 1}, 2: {4: 2}, 3: {2: 3, 3: 4}, 4: {}}, Chord("H"))
+
+    def tearDown(self):
+        pass
+
+    def test_equality_and_hash(self):
+        same = grip.Grip(1, dict(self.open_strings), {4: {5: 3, 4: 3, 3: 3}, 2: {6: 1, 2: 1}}, Chord("H"))
+        self.assertEqual(self.grip_1, same)
+        self.assertEqual(hash(self.grip_1), hash(same))
+        self.assertNotEqual(self.grip_1, self.grip_2)
+        other_fret = grip.Grip(2, self.open_strings, self.positions, Chord("H"))
+        self.assertNotEqual(self.grip_1, other_fret)
+        other_finger = grip.Grip(1, self.open_strings, {2: {2: 1, 6: 1}, 4: {3: 2, 4: 3, 5: 4}}, Chord("H"))
+        self.assertNotEqual(self.grip_1, other_finger)
+
+    def test_unique_grips(self):
+        copy_1 = grip.Grip(1, dict(self.open_strings), dict(self.positions), Chord("H"))
+        grips = [self.grip_2, self.grip_1, self.grip_2, copy_1]
+        unique = grip.unique_grips(grips)
+        self.assertListEqual([self.grip_2, self.grip_1], unique)
+        self.assertIs(self.grip_1, unique[1])
+        self.assertListEqual(unique, grip.Grips(grips).grips)
+
+    def test_latex_string(self):
+        self.assertEqual("\\gtab{}{:X24442:013331}", self.grip_1.latex_string())
+        self.assertEqual("\\gtab{}{7:133211:134211}", self.grip_2.latex_string())
+
+
+if __name__ == "__main__":
+    unittest.main()
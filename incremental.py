@@ -0,0 +1,294 @@
+import hashlib
+import json
+import mmap
+import os
+import uuid
+from os.path import exists
+import chord
+from song import parse_song, song_key
+import collect_chords
+import instrumentation
+import render_cache
+import songbook
+import storage
+
+
+MANIFEST_FILE_ENDING = ".manifest"
+FRAGMENTS_FILE_ENDING = ".fragments"
+MANIFEST_VERSION = 3
+FILE = "file"
+REMOVED = "removed"
+OUTPUT = "output"
+TEMPORARY_FILE_ENDING = ".tmp"
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def manifest_file(songbook_file):
+    return songbook_file + MANIFEST_FILE_ENDING
+
+
+def fragments_file(songbook_file):
+    return songbook_file + FRAGMENTS_FILE_ENDING
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class Manifest:
+    """
+    The state of the previous build of a songbook: {source file: entry, ...}, where entry is a dictionary with the keys
+    - mtime, size, hash: the state of the source file,
+    - artist, title: the song,
+    - chords: the chords in the song (as str(chord)),
+    - fragment: [offset, length of the song, length of the latex] in the fragments file, where the
+      storage.dumps_song representation of the song is followed by its Song.latex_string(), both in utf-8.
+    The entries of the songs that were just parsed have the keys song and latex instead of fragment.
+
+    Both files only grow: the manifest file is a header line followed by json records (an entry with the key file,
+    a removed file or a new output key), and the later records win. A record that was not written completely
+    is ignored, and an unreadable manifest (or one of another version or renderer) is treated as an empty one.
+    When most of the fragments are not used any more, both files are compacted through temporary files.
+    """
+    def __init__(self, songbook_file):
+        self.file_name = manifest_file(songbook_file)
+        self.fragments_file = fragments_file(songbook_file)
+        self.entries = {}
+        self.output = None
+        self.build = None
+        self.records = 0  # the number of the records in the manifest file
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.fragments_file, "rb") as f:
+                fragments_build = f.readline().decode("utf-8").strip()
+                fragments_size = f.seek(0, os.SEEK_END)
+            with open(self.file_name, "rb") as f:
+                header = json.loads(f.readline())
+                if header != self.header(fragments_build):
+                    return
+                # a record that was not written completely is ignored
+                complete = f.read().decode("utf-8").rpartition("\n")[0]
+            for record in json.loads("[" + complete.replace("\n", ",") + "]"):
+                self.apply(record)
+            # the fragments that were not written completely
+            for text_file, entry in list(self.entries.items()):
+                offset, song_length, latex_length = entry["fragment"]
+                if offset + song_length + latex_length > fragments_size:
+                    del self.entries[text_file]
+        except (OSError, ValueError, LookupError, TypeError):
+            self.entries, self.output, self.records = {}, None, 0
+            return
+        self.build = fragments_build
+
+    @staticmethod
+    def header(build):
+        return {"version": MANIFEST_VERSION, "renderer": render_cache.RENDERER_VERSION, "build": build}
+
+    def apply(self, record):
+        self.records += 1
+        if FILE in record:
+            self.entries[record.pop(FILE)] = record
+        elif REMOVED in record:
+            self.entries.pop(record[REMOVED], None)
+        else:
+            self.output = record[OUTPUT]
+
+    def open_fragments(self):
+        """
+        :return: a read-only memory map of the fragments file, or None if there is no previous build
+        """
+        if self.build is None:
+            return None
+        with open(self.fragments_file, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def song_line(entry, buffer):
+        """
+        :param entry: see Manifest
+        :param buffer: the value of open_fragments
+        :return: storage.dumps_song value of the song of the entry
+        """
+        if "song" in entry:
+            return entry["song"]
+        offset, song_length, _ = entry["fragment"]
+        return buffer[offset:offset + song_length].decode("utf-8")
+
+    @staticmethod
+    def latex(entry, buffer):
+        """
+        :return: Song.latex_string() value of the song of the entry (see song_line)
+        """
+        if "latex" in entry:
+            return entry["latex"]
+        offset, song_length, latex_length = entry["fragment"]
+        return buffer[offset + song_length:offset + song_length + latex_length].decode("utf-8")
+
+    def save(self, entries, changed, output):
+        """
+        Appends the changes to the files (or compacts them).
+        :param entries: the new state {source file: entry, ...}
+        :param changed: the source files whose entries are new or changed
+        :param output: the new output key
+        :return:
+        """
+        removed = [text_file for text_file in self.entries if text_file not in entries]
+        live = sum(sum(entry["fragment"][1:]) for entry in entries.values() if "fragment" in entry)
+        size = os.path.getsize(self.fragments_file) if self.build is not None else 0
+        records = self.records + len(changed) + len(removed) + 1
+        if self.build is None or size > 2 * live or records > 2 * len(entries) + 16:
+            self.compact(entries, output)
+            return
+        with open(self.fragments_file, "ab") as f:
+            for text_file in changed:
+                entry = entries[text_file]
+                if "latex" in entry:
+                    song_line = entry.pop("song").encode("utf-8")
+                    latex = entry.pop("latex").encode("utf-8")
+                    entry["fragment"] = [f.tell(), len(song_line), len(latex)]
+                    f.write(song_line + latex)
+            f.flush()
+            os.fsync(f.fileno())
+        lines = [_ENCODER.encode(dict(entries[text_file], **{FILE: text_file})) for text_file in changed]
+        lines += [_ENCODER.encode({REMOVED: text_file}) for text_file in removed]
+        if output != self.output:
+            lines.append(_ENCODER.encode({OUTPUT: output}))
+        with open(self.file_name, "ab") as f:
+            f.write("".join(line + "\n" for line in lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries, self.output, self.records = entries, output, self.records + len(lines)
+
+    def compact(self, entries, output):
+        """
+        Writes the entries and only their fragments to new files, which replace the old ones.
+        """
+        build = uuid.uuid4().hex
+        lines = [_ENCODER.encode(self.header(build))]
+        buffer = self.open_fragments()
+        try:
+            with open(self.fragments_file + TEMPORARY_FILE_ENDING, "wb") as f:
+                f.write((build + "\n").encode("utf-8"))
+                for text_file, entry in entries.items():
+                    song_line = Manifest.song_line(entry, buffer).encode("utf-8")
+                    latex = Manifest.latex(entry, buffer).encode("utf-8")
+                    entry.pop("song", None)
+                    entry.pop("latex", None)
+                    entry["fragment"] = [f.tell(), len(song_line), len(latex)]
+                    f.write(song_line + latex)
+                    lines.append(_ENCODER.encode(dict(entry, **{FILE: text_file})))
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if buffer is not None:
+                buffer.close()
+        lines.append(_ENCODER.encode({OUTPUT: output}))
+        with open(self.file_name + TEMPORARY_FILE_ENDING, "wb") as f:
+            f.write("".join(line + "\n" for line in lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        # if the manifest is not replaced, its build id does not match the new fragments
+        os.replace(self.fragments_file + TEMPORARY_FILE_ENDING, self.fragments_file)
+        os.replace(self.file_name + TEMPORARY_FILE_ENDING, self.file_name)
+        self.entries, self.output, self.build, self.records = entries, output, build, len(lines) - 1
+
+
+def output_key(chords, template_file=None):
+    """
+    Fingerprint of what the tex file depends on besides the rendered songs: the template and the grips of the chords.
+    :param chords: the chords of the songbook
+    :param template_file: the tex template, songbook.TEX_TEMPLATE if None
+    :return: hex digest
+    """
+    template_file = songbook.TEX_TEMPLATE if template_file is None else template_file
+    library = collect_chords.get_grip_library()
+    digest = hashlib.sha256(file_hash(template_file).encode("ascii"))
+    for chrd in sorted(chords):
+        key = repr(chrd)
+        digest.update(library.encoded(key) if key in library else key.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def song_entry(text_file, stat, content_hash):
+    sng = parse_song(text_file)
+    chords = {chrd for stz in sng.stanzas for vrs in stz.verses for chrd, _ in vrs.chords}
+    return {"mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": content_hash,
+            "artist": sng.artist,
+            "title": sng.title,
+            "song": storage.dumps_song(sng),
+            "latex": sng.latex_string(),
+            "chords": [str(chrd) for chrd in sorted(chords)]}
+
+
+def update_entries(text_files, old_entries):
+    """
+    Re-parses and re-renders only the files that changed since the previous build. A file whose modification
+    time and size are the same as before is not even read.
+    :param text_files: song files of the songbook
+    :param old_entries: the entries of the previous build (see Manifest)
+    :return: triple (new entries, list of the files whose entries changed, list of the files that were parsed)
+    """
+    entries = {}
+    changed = []
+    parsed = []
+    for text_file in text_files:
+        stat = os.stat(text_file)
+        old = old_entries.get(text_file)
+        if old is not None and old["mtime"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+            entries[text_file] = old
+            continue
+        content_hash = file_hash(text_file)
+        if old is not None and old["hash"] == content_hash:
+            entries[text_file] = dict(old, mtime=stat.st_mtime_ns, size=stat.st_size)
+        else:
+            entries[text_file] = song_entry(text_file, stat, content_hash)
+            parsed.append(text_file)
+        changed.append(text_file)
+    return entries, changed, parsed
+
+
+def build_songbook(text_files, songbook_file, tex_file, instrument=None):
+    """
+    Incremental version of songbook.create_songbook_from_text_files followed by SongBook.write_to_tex_file.
+    The parsed and rendered songs are kept in a manifest next to the songbook file, and only the songs whose
+    source changed are parsed and rendered again. If nothing changed (neither the songs nor the renderer,
+    the template or the grips of the chords), the output files are not rewritten.
+    :param text_files: song.parse_song compatible files
+    :param songbook_file: the name of the output songbook file
+    :param tex_file: the name of the output tex file
+    :param instrument: see instrumentation.mode
+    :return: list of the files that were parsed
+    """
+    report_file = tex_file + instrumentation.REPORT_FILE_ENDING
+    with instrumentation.instrumented("build_songbook", instrument, report_file):
+        manifest = Manifest(songbook_file)
+        with instrumentation.stage("parse", len(text_files)):
+            entries, changed, parsed = update_entries(text_files, manifest.entries)
+        chords = {chord.parse(chrd) for chrd in set().union(*(e["chords"] for e in entries.values()))}
+        outputs_exist = exists(songbook_file) and exists(tex_file)
+        if not parsed and set(entries) == set(manifest.entries) and output_key(chords) == manifest.output \
+                and outputs_exist:
+            if changed:  # only the modification times of some files changed
+                manifest.save(entries, changed, manifest.output)
+            return parsed
+        ordered = dict(sorted(entries.items(), key=lambda item: song_key(item[1]["artist"], item[1]["title"])))
+        buffer = manifest.open_fragments()
+        try:
+            with instrumentation.stage("write"):
+                storage.write_songbook_lines(songbook_file, ((e["artist"], e["title"], manifest.song_line(e, buffer))
+                                                             for e in ordered.values()))
+            with open(tex_file, "w", encoding="utf-8") as f:
+                songbook.write_latex_document(f, (manifest.latex(e, buffer) for e in ordered.values()), chords)
+                f.write("\n")
+        finally:
+            if buffer is not None:
+                buffer.close()
+        # the grips that were fetched while the tex file was written are a part of the output
+        manifest.save(ordered, changed, output_key(chords))
+        return parsed
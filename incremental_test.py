@@ -0,0 +1,139 @@
+import unittest
+import os
+import shutil
+from unittest import mock
+import misc
+import song
+import songbook
+import collect_chords
+import grip_library
+import incremental
+import render_cache
+from chord import Chord
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        self.song_files = [self.folder + "/song{}.txt".format(i) for i in range(3)]
+        self.songbook_file = self.folder + "/book.sgbk"
+        self.tex_file = self.folder + "/book.tex"
+        artists = ["b", "A", "c"]
+        titles = ["Prva", "Druga", "Tretja"]
+        stanzass = [[["Tum <C> bum", "Pam <d> bam"], ["<a-7>Rom <G> pom"]],
+                    [["<E>Bird is the word"]],
+                    [["<D>Vse <A>je <G>lepo"]]]
+        for song_file, artist, title, stanzas in zip(self.song_files, artists, titles, stanzass):
+            song.create_text_song(song_file, artist, title, stanzas)
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def assert_same_as_full_build(self):
+        book = songbook.SongBook(self.songbook_file)
+        expected = [song.parse_song(f) for f in self.song_files]
+        expected.sort(key=lambda s: song.song_key(s.artist, s.title))
+        self.assertListEqual(expected, book.songs)
+        with open(self.tex_file, encoding="utf-8") as f:
+            self.assertEqual(book.latex_string() + "\n", f.read())
+
+    def test_first_build_parses_everything(self):
+        parsed = incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        self.assertListEqual(self.song_files, parsed)
+        self.assertTrue(os.path.exists(incremental.manifest_file(self.songbook_file)))
+        self.assert_same_as_full_build()
+
+    def test_rebuild_only_changed(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        song.create_text_song(self.song_files[1], "A", "Druga", [["<E>Bird is <A>the word"]])
+        parsed = incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        self.assertListEqual([self.song_files[1]], parsed)
+        self.assert_same_as_full_build()
+
+    def test_touched_but_unchanged(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        os.utime(self.song_files[0], ns=(1, 1))
+        self.assertListEqual([], incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file))
+
+    def test_removed_file(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        removed = self.song_files.pop()
+        self.assertListEqual([], incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file))
+        self.assertNotIn(removed, incremental.Manifest(self.songbook_file).entries)
+        self.assert_same_as_full_build()
+
+    def build_writes_manifest(self):
+        with mock.patch.object(incremental.Manifest, "save", autospec=True,
+                               side_effect=incremental.Manifest.save) as save:
+            incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        return save.called
+
+    def test_no_op_does_not_write_manifest(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        self.assertFalse(self.build_writes_manifest())
+        os.utime(self.song_files[0], ns=(1, 1))
+        self.assertTrue(self.build_writes_manifest())
+        self.assertFalse(self.build_writes_manifest())
+
+    def test_edits_are_appended_and_compacted(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        fragments = incremental.fragments_file(self.songbook_file)
+        sizes = [os.path.getsize(fragments)]
+        for i in range(8):
+            song.create_text_song(self.song_files[1], "A", "Druga", [["<E>Bird is <A>the word {}".format(i)]])
+            self.assertListEqual([self.song_files[1]],
+                                 incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file))
+            self.assert_same_as_full_build()
+            sizes.append(os.path.getsize(fragments))
+        self.assertLess(sizes[0], sizes[1])
+        self.assertLess(max(sizes), 3 * sizes[0])
+        self.assertFalse(os.path.exists(fragments + incremental.TEMPORARY_FILE_ENDING))
+        manifest = incremental.manifest_file(self.songbook_file)
+        self.assertFalse(os.path.exists(manifest + incremental.TEMPORARY_FILE_ENDING))
+
+    def test_damaged_manifest(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        song.create_text_song(self.song_files[1], "A", "Druga", [["<E>Bird is <A>the word"]])
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        manifest = incremental.manifest_file(self.songbook_file)
+        with open(manifest, "rb") as f:
+            content = f.read()
+        # a record that was not written completely: the edited song is parsed again
+        with open(manifest, "wb") as f:
+            f.write(content[:-10])
+        self.assertListEqual([self.song_files[1]],
+                             incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file))
+        self.assert_same_as_full_build()
+        with open(manifest, "wb") as f:
+            f.write(b"{\"version\": ")
+        self.assertListEqual(self.song_files,
+                             incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file))
+        self.assert_same_as_full_build()
+
+    def test_new_renderer_renders_everything(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        with mock.patch.object(render_cache, "RENDERER_VERSION", render_cache.RENDERER_VERSION + 1):
+            parsed = incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        self.assertListEqual(self.song_files, parsed)
+
+    def test_template_and_grips_are_a_part_of_the_output(self):
+        incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file)
+        template = self.folder + "/template.txt"
+        shutil.copyfile(songbook.TEX_TEMPLATE, template)
+        with open(template, "a", encoding="utf-8") as f:
+            f.write("%")
+        with mock.patch.object(songbook, "TEX_TEMPLATE", template):
+            self.assertTrue(self.build_writes_manifest())
+        self.assertTrue(self.build_writes_manifest())
+        library_file = self.folder + "/grips.store"
+        shutil.copyfile(collect_chords.GRIP_LIBRARY_FILE, library_file)
+        library = grip_library.GripLibrary(library_file)
+        with mock.patch.object(collect_chords, "_GRIP_LIBRARY", library):
+            self.assertFalse(self.build_writes_manifest())
+            library[repr(Chord("E"))] = library[repr(Chord("E"))][:1]
+            self.assertTrue(self.build_writes_manifest())
+            self.assert_same_as_full_build()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Optional instrumentation of the songbook builds: the wall time and the number of items of every stage
+(parsing, rendering, grips, writing) and the hit rates of the caches, which are printed to stderr at the end of
+the build and logged (at the info level, with the Report object as the report attribute of the log record). The instrumentation is switched on by the environment variable
+SONGBOOK_INSTRUMENTATION (1 or timings; profile) or by the instrument argument of the instrumented functions.
+In the profile mode, cProfile and tracemalloc reports are written next to the output file.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+ENVIRONMENT_VARIABLE = "SONGBOOK_INSTRUMENTATION"
+TIMINGS = "timings"
+PROFILE = "profile"
+REPORT_FILE_ENDING = ".profile.txt"
+PROFILE_LINES = 30
+MEMORY_LINES = 15
+
+_REPORT = None  # the report of the running build
+
+logger = logging.getLogger(__name__)
+
+
+class Report:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.stages = {}  # stage: [seconds, items]
+        self.caches = {}  # cache: [hits, misses]
+
+    def add_stage(self, name, seconds, items):
+        totals = self.stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += items
+
+    def add_cache(self, name, hits, misses):
+        totals = self.caches.setdefault(name, [0, 0])
+        totals[0] += hits
+        totals[1] += misses
+
+    def lines(self):
+        lines = ["{}: {:.3f} s".format(self.name, self.seconds)]
+        for name, (seconds, items) in self.stages.items():
+            lines.append("    {:<16} {:8.3f} s {:8d} items".format(name, seconds, items))
+        for name, (hits, misses) in self.caches.items():
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            lines.append("    {:<16} {:8d} hits {:8d} misses ({:.0%})".format(name, hits, misses, rate))
+        return lines
+
+
+def mode(instrument=None):
+    """
+    :param instrument: None (the environment variable decides), False, True (same as TIMINGS), TIMINGS or PROFILE
+    :return: TIMINGS, PROFILE or None
+    """
+    if instrument is None:
+        instrument = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if instrument is True or instrument in ["1", TIMINGS]:
+        return TIMINGS
+    elif instrument == PROFILE:
+        return PROFILE
+    return None
+
+
+@contextmanager
+def instrumented(name, instrument=None, report_file=None):
+    """
+    Collects the report of the build in the with block and logs it at the end. An instrumented build within
+    another one is a part of the outer report.
+    :param name: the name of the build
+    :param instrument: see mode
+    :param report_file: where the report is written in the profile mode
+    :return: the Report object, or None if the instrumentation is off
+    """
+    global _REPORT
+    current_mode = mode(instrument)
+    if current_mode is None or _REPORT is not None:
+        yield _REPORT
+        return
+    report = _REPORT = Report(name)
+    profiler = None
+    if current_mode == PROFILE:
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.seconds = time.perf_counter() - start
+        _REPORT = None
+        lines = report.lines()
+        if profiler is not None:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            write_profile(report_file, lines, profiler, snapshot, peak)
+            lines.append("Profile written to {}".format(report_file))
+        print("\n".join(lines), file=sys.stderr)
+        logger.info("\n".join(lines), extra={"report": report})
+
+
+def write_profile(report_file, lines, profiler, snapshot, peak):
+    statistics = io.StringIO()
+    pstats.Stats(profiler, stream=statistics).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    with open(report_file, "w", encoding="utf-8") as f:
+        print("\n".join(lines), file=f)
+        print("\nPeak traced memory: {:.1f} MiB\n".format(peak / 2 ** 20), file=f)
+        for line in snapshot.statistics("lineno")[:MEMORY_LINES]:
+            print(line, file=f)
+        print(file=f)
+        print(statistics.getvalue(), file=f)
+
+
+@contextmanager
+def stage(name, items=0):
+    """
+    Adds the time of the with block (and the number of the processed items) to the stage of the running build.
+    """
+    if _REPORT is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _REPORT.add_stage(name, time.perf_counter() - start, items)
+
+
+def count_cache(name, hits, misses):
+    if _REPORT is not None:
+        _REPORT.add_cache(name, hits, misses)
+
+
+def is_on():
+    return _REPORT is not None
@@ -0,0 +1,95 @@
+import unittest
+import io
+import logging
+import os
+import misc
+import song
+import songbook
+import incremental
+import instrumentation
+import render_cache
+from unittest import mock
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        self.song_files = [self.folder + "/song{}.txt".format(i) for i in range(3)]
+        stanzass = [[["Tum <C> bum", "Pam <d> bam"], ["<a>Rom <G> pom"]],
+                    [["<E>Bird is the word"]],
+                    [["<D>Vse <A>je <G>lepo"]]]
+        for i, (song_file, stanzas) in enumerate(zip(self.song_files, stanzass)):
+            song.create_text_song(song_file, "artist", "title {}".format(i), stanzas)
+        self.songbook_file = self.folder + "/book.sgbk"
+        self.tex_file = self.folder + "/book.tex"
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def build(self, instrument):
+        with self.assertLogs("instrumentation", logging.DEBUG) as logs:
+            # assertLogs needs at least one record
+            logging.getLogger("instrumentation").debug("build")
+            book = songbook.create_songbook_from_text_files(self.song_files, self.songbook_file,
+                                                            instrument=instrument)
+            book.write_to_tex_file(self.tex_file, render_cache.RenderCache(), instrument=instrument)
+        return "\n".join(logs.output)
+
+    def test_mode(self):
+        self.assertIsNone(instrumentation.mode(False))
+        self.assertEqual(instrumentation.TIMINGS, instrumentation.mode(True))
+        with mock.patch.dict(os.environ, {instrumentation.ENVIRONMENT_VARIABLE: "profile"}):
+            self.assertEqual(instrumentation.PROFILE, instrumentation.mode())
+        with mock.patch.dict(os.environ, {instrumentation.ENVIRONMENT_VARIABLE: ""}):
+            self.assertIsNone(instrumentation.mode())
+
+    def test_off(self):
+        with mock.patch("sys.stderr", io.StringIO()) as stderr:
+            output = self.build(False)
+        self.assertEqual("", stderr.getvalue())
+        self.assertNotIn("write_to_tex_file", output)
+        self.assertFalse(os.path.exists(self.tex_file + instrumentation.REPORT_FILE_ENDING))
+
+    def test_timings(self):
+        reports = []
+        original = instrumentation.Report.lines
+
+        def remember(report):
+            reports.append(report)
+            return original(report)
+
+        with mock.patch.object(instrumentation.Report, "lines", remember):
+            output = self.build(True)
+        create_report, tex_report = reports
+        self.assertEqual("create_songbook_from_text_files", create_report.name)
+        self.assertEqual(3, create_report.stages["parse"][1])
+        self.assertEqual(3, tex_report.stages["render"][1])
+        self.assertEqual(7, tex_report.stages["grips"][1])
+        self.assertListEqual([0, 3], tex_report.caches["render cache"])
+        self.assertListEqual([7, 0], tex_report.caches["grip library"])
+        self.assertIn("render cache", output)
+        self.assertIsNone(instrumentation._REPORT)
+
+    def test_report_is_printed_and_logged(self):
+        with mock.patch("sys.stderr", io.StringIO()) as stderr, \
+                self.assertLogs("instrumentation", logging.INFO) as logs:
+            incremental.build_songbook(self.song_files, self.songbook_file, self.tex_file, instrument=True)
+        report, = logs.records
+        self.assertEqual(logging.INFO, report.levelno)
+        self.assertEqual("build_songbook", report.report.name)
+        self.assertEqual(3, report.report.stages["parse"][1])
+        self.assertIn("grips", report.report.stages)
+        self.assertEqual(report.getMessage() + "\n", stderr.getvalue())
+
+    def test_profile(self):
+        with mock.patch.dict(os.environ, {instrumentation.ENVIRONMENT_VARIABLE: instrumentation.PROFILE}):
+            self.build(None)
+        for output_file in [self.songbook_file, self.tex_file]:
+            with open(output_file + instrumentation.REPORT_FILE_ENDING, encoding="utf-8") as f:
+                report = f.read()
+            self.assertIn("Peak traced memory", report)
+            self.assertIn("cumulative", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
-import songbook
+import incremental
+import logging
 import os
 # noinspection PyUnresolvedReferences
 from chord import Chord
@@ -10,11 +11,13 @@ from stanza import Stanza
 from song import Song
 #
 #
+logging.basicConfig(level=logging.INFO)
 directory = "songs/"
 input_files = [directory + f for f in os.listdir(directory) if f.startswith("slon_in_sadez")]
 
 the_songbook = "songbooks/theSongbook/the_songbook2.sgbk"
 the_songbook_tex = "songbooks/theSongbook/the_songbook2.tex"
-book = songbook.create_songbook_from_text_files(input_files, the_songbook)  # songbook.SongBook(the_songbook)  #
-# book = songbook.SongBook(the_songbook)
-book.write_to_tex_file(the_songbook_tex)
+# only the songs that changed since the last run are parsed and rendered again
+incremental.build_songbook(input_files, the_songbook, the_songbook_tex)
+# book = songbook.create_songbook_from_text_files(input_files, the_songbook)
+# book.write_to_tex_file(the_songbook_tex)
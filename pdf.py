@@ -0,0 +1,143 @@
+"""
+Compiles the tex files of the songbooks to pdf. The songs package writes the song indexes (.sxd files) during a LaTeX
+run, songidx.lua turns them into .sbx files, and the next run puts them into the document, hence several passes.
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists
+
+
+ENGINES = ["lualatex", "pdflatex"]
+INDEX_TOOL = "texlua"
+LATEX_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latexStuff")
+SONGS_PACKAGE = "songs.sty"
+INDEX_SCRIPT = os.path.join(LATEX_FOLDER, "songidx.lua")
+PASSES = 2
+HASH_FILE_ENDING = ".pdfhash"
+INDEX_PATTERN = re.compile(r"\\new(?:author|scrip)?index\{[^{}]*\}\{([^{}]*)\}")
+
+
+def find_engine(engines=None):
+    """
+    :param engines: the names of the LaTeX programs, in the order of preference (ENGINES if None)
+    :return: the path to the first one that is installed
+    """
+    engines = ENGINES if engines is None else engines
+    for engine in engines:
+        path = shutil.which(engine)
+        if path is not None:
+            return path
+    raise Exception("None of the LaTeX engines {} is installed".format(", ".join(engines)))
+
+
+def hash_file(tex_file):
+    return tex_file + HASH_FILE_ENDING
+
+
+def inputs(tex_file):
+    """
+    :return: the files that the pdf is made of: the tex file, the songs package (the copy in the folder of the tex
+    file if there is one, see run) and the index script
+    """
+    package = os.path.join(os.path.dirname(os.path.abspath(tex_file)), SONGS_PACKAGE)
+    if not exists(package):
+        package = os.path.join(LATEX_FOLDER, SONGS_PACKAGE)
+    return [tex_file, package, INDEX_SCRIPT]
+
+
+def tex_hash(tex_file):
+    """
+    :return: hex digest of the inputs of the tex file (see inputs)
+    """
+    digest = hashlib.sha256()
+    for input_file in inputs(tex_file):
+        with open(input_file, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def pdf_file(tex_file):
+    return tex_file[:-len(".tex")] + ".pdf"
+
+
+def is_up_to_date(tex_file):
+    """
+    The pdf is up to date if it exists and neither the tex file nor the songs package or the index script
+    changed since it was compiled.
+    """
+    if not exists(pdf_file(tex_file)) or not exists(hash_file(tex_file)):
+        return False
+    with open(hash_file(tex_file), encoding="utf-8") as f:
+        return f.read().strip() == tex_hash(tex_file)
+
+
+def index_names(tex_file):
+    """
+    :return: the names of the index files (without the endings) that the document declares
+    """
+    with open(tex_file, encoding="utf-8") as f:
+        return INDEX_PATTERN.findall(f.read())
+
+
+def run(command, folder):
+    # the songs package is taken from latexStuff unless the folder of the tex file has its own copy
+    environment = dict(os.environ, TEXINPUTS=os.pathsep.join([".", LATEX_FOLDER, os.environ.get("TEXINPUTS", "")]))
+    completed = subprocess.run(command, cwd=folder, env=environment, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    if completed.returncode != 0:
+        raise Exception("Command {} failed in {}:\n{}".format(" ".join(command), folder,
+                                                            completed.stdout.decode("utf-8", "replace")))
+
+
+def compile_pdf(tex_file, engine=None, passes=PASSES, force=False):
+    """
+    Runs LaTeX on the tex file (in its folder) and generates the song indexes between the passes.
+    :param tex_file: path to the tex file
+    :param engine: path to the LaTeX program (see find_engine if None)
+    :param passes: the number of LaTeX runs
+    :param force: if True, the file is compiled even if the pdf is up to date
+    :return: True if the file was compiled, False if it was skipped
+    """
+    if not force and is_up_to_date(tex_file):
+        return False
+    engine = find_engine() if engine is None else engine
+    content_hash = tex_hash(tex_file)
+    folder = os.path.dirname(os.path.abspath(tex_file))
+    name = os.path.basename(tex_file)
+    indexes = index_names(tex_file)
+    for i in range(passes):
+        run([engine, "-interaction=nonstopmode", "-halt-on-error", name], folder)
+        if i < passes - 1:
+            for index in indexes:
+                if exists(os.path.join(folder, index + ".sxd")):
+                    run([INDEX_TOOL, INDEX_SCRIPT, index + ".sxd", index + ".sbx"], folder)
+    with open(hash_file(tex_file), "w", encoding="utf-8") as f:
+        print(content_hash, file=f)
+    return True
+
+
+def compile_pdfs(tex_files, workers=None, engine=None, passes=PASSES, force=False):
+    """
+    Compiles many tex files at once (see compile_pdf). LaTeX runs in separate processes, so threads suffice.
+    The files in the same folder are compiled one after another, since they share the names of the index files.
+    :param tex_files: paths to the tex files
+    :param workers: the maximal number of simultaneous compilations (os.cpu_count() if None)
+    :return: list of the values of compile_pdf, in the same order as tex_files
+    """
+    if engine is None and (force or not all(is_up_to_date(tex_file) for tex_file in tex_files)):
+        engine = find_engine()
+    workers = os.cpu_count() if workers is None else workers
+    folders = {}
+    for tex_file in tex_files:
+        folders.setdefault(os.path.dirname(os.path.abspath(tex_file)), []).append(tex_file)
+
+    def compile_folder(folder_files):
+        return [(tex_file, compile_pdf(tex_file, engine, passes, force)) for tex_file in folder_files]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        compiled = dict(pair for pairs in executor.map(compile_folder, folders.values()) for pair in pairs)
+    return [compiled[tex_file] for tex_file in tex_files]
@@ -0,0 +1,112 @@
+import unittest
+import os
+import subprocess
+import misc
+import pdf
+from unittest import mock
+
+
+TEX = r"""\documentclass{book}
+\newindex{mainidx}{mainidxfile}
+\newauthorindex{authidx}{authidxfile}
+\begin{document}
+Songs
+\end{document}
+"""
+
+
+class PdfTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        self.tex_files = [os.path.join(self.folder, "book{}.tex".format(i)) for i in range(3)]
+        for tex_file in self.tex_files:
+            with open(tex_file, "w", encoding="utf-8") as f:
+                f.write(TEX)
+        self.commands = []
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def fake_run(self, command, cwd, returncode=0, **kwargs):
+        """
+        Pretends to be LaTeX (writes the index and the pdf) or songidx (writes the .sbx file).
+        """
+        self.commands.append((os.path.basename(command[0]), command[-1]))
+        if command[0] == pdf.INDEX_TOOL:
+            open(os.path.join(cwd, command[-1]), "w").close()
+        else:
+            name = command[-1][:-len(".tex")]
+            for index in ["mainidxfile", "authidxfile"]:
+                open(os.path.join(cwd, index + ".sxd"), "w").close()
+            open(os.path.join(cwd, name + ".pdf"), "w").close()
+        return subprocess.CompletedProcess(command, returncode, b"log")
+
+    def test_find_engine(self):
+        with mock.patch("shutil.which", side_effect=lambda name: "/bin/" + name if name == "pdflatex" else None):
+            self.assertEqual("/bin/pdflatex", pdf.find_engine())
+        with mock.patch("shutil.which", return_value=None):
+            with self.assertRaises(Exception):
+                pdf.find_engine()
+
+    def test_index_names(self):
+        self.assertListEqual(["mainidxfile", "authidxfile"], pdf.index_names(self.tex_files[0]))
+
+    def test_passes_and_indexes(self):
+        with mock.patch("subprocess.run", side_effect=self.fake_run):
+            self.assertTrue(pdf.compile_pdf(self.tex_files[0], engine="lualatex"))
+        expected = [("lualatex", "book0.tex"), ("texlua", "mainidxfile.sbx"), ("texlua", "authidxfile.sbx"),
+                    ("lualatex", "book0.tex")]
+        self.assertListEqual(expected, self.commands)
+        self.assertTrue(pdf.is_up_to_date(self.tex_files[0]))
+
+    def test_unchanged_file_is_skipped(self):
+        with mock.patch("subprocess.run", side_effect=self.fake_run):
+            pdf.compile_pdf(self.tex_files[0], engine="lualatex")
+            self.commands.clear()
+            self.assertFalse(pdf.compile_pdf(self.tex_files[0], engine="lualatex"))
+            self.assertListEqual([], self.commands)
+            with open(self.tex_files[0], "a", encoding="utf-8") as f:
+                f.write("% changed\n")
+            self.assertTrue(pdf.compile_pdf(self.tex_files[0], engine="lualatex"))
+            self.assertEqual(4, len(self.commands))
+
+    def test_changed_package_or_script_is_compiled(self):
+        package = os.path.join(self.folder, pdf.SONGS_PACKAGE)
+        with mock.patch("subprocess.run", side_effect=self.fake_run):
+            pdf.compile_pdf(self.tex_files[0], engine="lualatex")
+        self.assertTrue(pdf.is_up_to_date(self.tex_files[0]))
+        # a copy of the package next to the tex file is used instead of the one in latexStuff
+        with open(package, "w", encoding="utf-8") as f:
+            f.write("% own copy\n")
+        self.assertFalse(pdf.is_up_to_date(self.tex_files[0]))
+        with mock.patch("subprocess.run", side_effect=self.fake_run):
+            pdf.compile_pdf(self.tex_files[0], engine="lualatex")
+        self.assertTrue(pdf.is_up_to_date(self.tex_files[0]))
+        script = os.path.join(self.folder, "songidx.lua")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write("-- changed\n")
+        with mock.patch("pdf.INDEX_SCRIPT", script):
+            self.assertFalse(pdf.is_up_to_date(self.tex_files[0]))
+
+    def test_latex_folder_does_not_depend_on_working_directory(self):
+        self.assertTrue(os.path.isabs(pdf.LATEX_FOLDER))
+        self.assertTrue(os.path.exists(os.path.join(pdf.LATEX_FOLDER, pdf.SONGS_PACKAGE)))
+        self.assertTrue(os.path.exists(pdf.INDEX_SCRIPT))
+
+    def test_failure(self):
+        with mock.patch("subprocess.run", side_effect=lambda *a, **k: self.fake_run(*a, returncode=1, **k)):
+            with self.assertRaises(Exception):
+                pdf.compile_pdf(self.tex_files[0], engine="lualatex")
+        self.assertFalse(pdf.is_up_to_date(self.tex_files[0]))
+
+    def test_compile_many(self):
+        with mock.patch("subprocess.run", side_effect=self.fake_run):
+            self.assertListEqual([True, True, True], pdf.compile_pdfs(self.tex_files, workers=2, engine="pdflatex"))
+            with mock.patch("shutil.which", return_value=None):
+                # nothing to compile, so no engine is needed
+                self.assertListEqual([False, False, False], pdf.compile_pdfs(self.tex_files, workers=2))
+        self.assertEqual(3 * 4, len(self.commands))
+
+
+if __name__ == '__main__':
+    unittest.main()
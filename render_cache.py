@@ -0,0 +1,78 @@
+import os
+from collections import OrderedDict
+import storage
+
+
+# Increase this whenever the LaTeX representation of the songs changes, so that the old fragments are not used.
+RENDERER_VERSION = 1
+DEFAULT_MAX_SONGS = 4096
+FRAGMENT_FILE_ENDING = ".tex"
+
+
+class RenderCache:
+    """
+    Content-addressed cache of Song.latex_string() values: the key is the hash of the song
+    (see storage.content_hash) together with the renderer version. The fragments are kept in memory
+    (the least recently used ones are dropped) and, optionally, in a directory on disk.
+    """
+    def __init__(self, max_songs=DEFAULT_MAX_SONGS, directory=None):
+        self.max_songs = max_songs
+        self.directory = directory
+        self.fragments = OrderedDict()  # key: fragment
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(song):
+        return "{}-{}".format(RENDERER_VERSION, storage.content_hash(song))
+
+    def fragment_file(self, key):
+        return os.path.join(self.directory, key[-2:], key + FRAGMENT_FILE_ENDING)
+
+    def get(self, key):
+        """
+        :return: the fragment for the key or None if it is neither in memory nor on disk
+        """
+        if key in self.fragments:
+            self.fragments.move_to_end(key)
+            return self.fragments[key]
+        if self.directory is not None and os.path.exists(self.fragment_file(key)):
+            with open(self.fragment_file(key), encoding="utf-8") as f:
+                fragment = f.read()
+            self.remember(key, fragment)
+            return fragment
+        return None
+
+    def remember(self, key, fragment):
+        self.fragments[key] = fragment
+        self.fragments.move_to_end(key)
+        while len(self.fragments) > self.max_songs:
+            self.fragments.popitem(last=False)
+
+    def put(self, key, fragment):
+        self.remember(key, fragment)
+        if self.directory is not None:
+            path = self.fragment_file(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = "{}.{}.tmp".format(path, os.getpid())
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(fragment)
+            os.replace(temporary, path)
+
+    def render(self, song):
+        """
+        :param song: Song object
+        :return: song.latex_string(), from the cache if possible
+        """
+        key = RenderCache.key(song)
+        fragment = self.get(key)
+        if fragment is None:
+            self.misses += 1
+            fragment = song.latex_string()
+            self.put(key, fragment)
+        else:
+            self.hits += 1
+        return fragment
+
+
+DEFAULT_CACHE = RenderCache()
@@ -0,0 +1,57 @@
+import unittest
+import os
+from unittest import mock
+import misc
+import render_cache
+import song
+import stanza
+import verse
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = misc.create_temp_folder(".")
+        texts = [["<C>Kuža pazi, <G>z repkom miga, (2x)", "<C> <G-7> (x) <C> (vse skupaj)"]]
+        self.song = song.Song(song.LJUDSKA, "Kuža pazi",
+                              [stanza.Stanza([verse.parse_verse(vrs) for vrs in sta]) for sta in texts])
+
+    def tearDown(self):
+        misc.remove_temp_folder(self.folder)
+
+    def test_memory_cache(self):
+        cache = render_cache.RenderCache()
+        self.assertEqual(self.song.latex_string(), cache.render(self.song))
+        self.assertEqual(self.song.latex_string(), cache.render(song.Song(self.song.artist, self.song.title,
+                                                                          self.song.stanzas)))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        transposed = self.song.transpose(2)
+        self.assertEqual(transposed.latex_string(), cache.render(transposed))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+    def test_least_recently_used_are_dropped(self):
+        cache = render_cache.RenderCache(max_songs=2)
+        songs = [self.song.transpose(i) for i in range(3)]
+        for sng in songs + songs[2:] + songs[:1]:
+            cache.render(sng)
+        self.assertEqual((1, 4), (cache.hits, cache.misses))
+        self.assertListEqual([render_cache.RenderCache.key(songs[i]) for i in [2, 0]], list(cache.fragments))
+
+    def test_disk_cache(self):
+        cache = render_cache.RenderCache(directory=self.folder)
+        cache.render(self.song)
+        other = render_cache.RenderCache(directory=self.folder)
+        expected = self.song.latex_string()
+        with mock.patch.object(song.Song, "latex_string") as latex_string:
+            self.assertEqual(expected, other.render(self.song))
+        latex_string.assert_not_called()
+        self.assertEqual((1, 0), (other.hits, other.misses))
+        self.assertTrue(os.path.exists(other.fragment_file(render_cache.RenderCache.key(self.song))))
+
+    def test_renderer_version_is_part_of_the_key(self):
+        key = render_cache.RenderCache.key(self.song)
+        with mock.patch.object(render_cache, "RENDERER_VERSION", render_cache.RENDERER_VERSION + 1):
+            self.assertNotEqual(key, render_cache.RenderCache.key(self.song))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,699 @@
+"""
+Full-text search in the lyrics of a songbook. The index maps every word to the verses in which it appears.
+The words are compared without accents and case, so that č, š and ž match c, s and z.
+The index is kept next to the songbook file (see index_file) and only the added songs are indexed when the
+songbook grows. The hits are ranked by BM25 (rare words and short verses first). For the common words, only the
+texts that can be among the best are scored (see SearchIndex._search_by_classes).
+"""
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from itertools import repeat
+from os.path import exists
+import storage
+
+
+INDEX_FILE_ENDING = ".search"
+FORMAT_NAME = "sgbk-search"
+FORMAT_VERSION = 3
+TOKEN_PATTERN = re.compile(r"\w+")
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# the index is rebuilt once the removed songs are at least max(REBUILD_MIN_REMOVED, live songs / REBUILD_RATIO)
+REBUILD_MIN_REMOVED = 64
+REBUILD_RATIO = 2
+# if the rarest word of the query is in at most this many texts, they are all scored
+EXHAUSTIVE_LIMIT = 256
+# the buckets with at least 1 / DENSE_RATIO of the texts of their length are intersected as bitmaps
+DENSE_RATIO = 1024
+# see _ranks
+PEELED_BITS = 16
+MAX_FREQUENCY = 2 ** 16 - 1
+# appended to a word: the key of the signature bits of the texts in which the word is repeated
+REPEATED = "+"
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+# the positions of the set bits of every byte
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+_NONZERO = bytes([0] + [1] * 255)
+
+
+class _Unaccented(dict):
+    """
+    str.translate table of the characters without the accents (combining marks after the NFKD decomposition),
+    filled as the characters are met. The decomposition of a text is the concatenation of the decompositions of
+    its characters (up to the order of the combining marks), so the characters can be translated one by one.
+    """
+    def __missing__(self, code):
+        decomposed = unicodedata.normalize("NFKD", chr(code))
+        self[code] = "".join(c for c in decomposed if not unicodedata.combining(c))
+        return self[code]
+
+
+_UNACCENTED = _Unaccented()
+
+
+def normalize(text):
+    """
+    :return: the text without the accents (combining marks after the NFKD decomposition), casefolded
+    """
+    return text.translate(_UNACCENTED).casefold()
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class _WordSignatures(dict):
+    """
+    word: its bits in the signatures of the texts (two of the 64 bits, chosen by the crc32 of the word),
+    filled as the words are met. The texts in which a word is repeated also have the bits of word + REPEATED.
+    """
+    def __missing__(self, token):
+        code = zlib.crc32(token.encode("utf-8"))
+        self[token] = 1 << (code & 63) | 1 << (code >> 6 & 63)
+        return self[token]
+
+
+def index_file(songbook_file):
+    return songbook_file + INDEX_FILE_ENDING
+
+
+def file_state(file_name):
+    """
+    :return: [size, modification time in ns] of the file, or None if it does not exist
+    """
+    if not exists(file_name):
+        return None
+    stat = os.stat(file_name)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+NONE = 2 ** 32 - 1  # the end of the list of the occurrences of a text
+
+
+def inverse_document_frequency(frequency, texts):
+    return math.log(1 + (texts - frequency + 0.5) / (frequency + 0.5))
+
+
+def impact(frequency, length, average_length):
+    """
+    :return: the BM25 score of a word in a text, without the inverse document frequency
+    """
+    return frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+
+
+class SearchIndex:
+    """
+    The songs are identified by their storage.content_hash. The verses with the same words (e.g. the repeated
+    choruses) share a text, and the postings point to the texts, so every text is scored only once.
+    The occurrences of a text (the verses) are a linked list in the order of addition.
+    A removed song is only marked as removed, its verses stay in the index until it is rebuilt.
+
+    The postings of a word are kept twice: sorted by the text number (with the frequencies of the word), for looking
+    up a given text, and in the buckets of the texts with the same frequency and length. The score of the word is
+    the same for all the texts in a bucket, so the buckets give the texts in the order of the score.
+    The texts of every length are numbered by their rank among them, the buckets hold the ranks, and they are
+    intersected as bitmaps of the ranks (built when needed). The signature of a text has the bits of all its words (see
+    _WordSignatures), so most of the texts without some word of the query are skipped without a lookup.
+    """
+    def __init__(self):
+        self.songs = []       # song number: [artist, title, content hash]
+        self.numbers = {}     # content hash: song number
+        self.copies = {}      # content hash: the number of the copies of the song in the songbook (if any)
+        # text number: the number of the words, the first and the last occurrence, the signature
+        self.text_length = array("I")
+        self.text_first = array("I")
+        self.text_last = array("I")
+        self.text_signature = array("Q")
+        # verse number: the song number, the stanza and the verse in it, the next occurrence of the same text
+        self.verse_song = array("I")
+        self.verse_stanza = array("I")
+        self.verse_number = array("I")
+        self.verse_next = array("I")
+        self.postings = {}     # word: array of the numbers of the texts that contain it
+        self.frequencies = {}  # word: array of the numbers of its occurrences in the texts of the postings
+        self.buckets = {}      # word: {(frequency, text length): array of the ranks of the texts (see length_texts)}
+        self.length_texts = {}  # text length: array of the numbers of the texts of this length (by the rank)
+        self.total_length = 0
+        self.changed = False  # whether the index was changed after it was loaded or saved
+        self.source = None    # file_state of the songbook file when the index was loaded or saved
+        self._texts = None    # the words of the text, joined by spaces: text number (built when needed)
+        self._saved_texts = b""
+        self._bitmaps = {}    # (word, frequency, text length): the bucket as a bitmap of the ranks (when needed)
+        # (word, text length): (frequencies, the union of their buckets as a bitmap), see _sparse_bitmap
+        self._sparse_bitmaps = {}
+        self._word_bitmaps = {}  # (word, text length): the texts of the length with the word as a bitmap
+        self._word_signatures = _WordSignatures()
+
+    def __len__(self):
+        return len(self.copies)
+
+    def texts(self):
+        if self._texts is None:
+            keys = self._saved_texts.decode("utf-8").split("\n") if self._saved_texts else []
+            self._texts = {key: number for number, key in enumerate(keys)}
+            self._saved_texts = b""
+        return self._texts
+
+    def _text_number(self, tokens):
+        texts = self.texts()
+        key = " ".join(tokens)
+        text = texts.get(key)
+        if text is not None:
+            return text
+        text = texts[key] = len(self.text_length)
+        length = len(tokens)
+        self.text_length.append(length)
+        self.text_first.append(NONE)
+        self.text_last.append(NONE)
+        self.total_length += length
+        texts_of_length = self.length_texts.get(length)
+        if texts_of_length is None:
+            texts_of_length = self.length_texts[length] = array("I")
+        rank = len(texts_of_length)
+        texts_of_length.append(text)
+        signature = 0
+        word_signatures, postings_of, frequencies_of, buckets_of = \
+            self._word_signatures, self.postings, self.frequencies, self.buckets
+        caches = self._bitmaps or self._sparse_bitmaps or self._word_bitmaps
+        for token, frequency in Counter(tokens).items():
+            frequency = min(frequency, MAX_FREQUENCY)
+            signature |= word_signatures[token]
+            if frequency > 1:
+                signature |= word_signatures[token + REPEATED]
+            postings = postings_of.get(token)
+            if postings is None:
+                postings = postings_of[token] = array("I")
+                frequencies_of[token] = array("H")
+                buckets_of[token] = {}
+            postings.append(text)
+            frequencies_of[token].append(frequency)
+            buckets = buckets_of[token]
+            bucket = buckets.get((frequency, length))
+            if bucket is None:
+                bucket = buckets[frequency, length] = array("I")
+            bucket.append(rank)
+            if caches:
+                self._add_to_bitmaps(token, frequency, length, rank)
+        self.text_signature.append(signature)
+        return text
+
+    def _add_to_bitmaps(self, token, frequency, length, rank):
+        """
+        Adds a new text to the bitmaps of its buckets that were already built.
+        """
+        if (token, frequency, length) in self._bitmaps:
+            self._bitmaps[token, frequency, length] |= 1 << rank
+        if (token, length) in self._sparse_bitmaps:
+            frequencies, bitmap = self._sparse_bitmaps[token, length]
+            if frequency in frequencies:
+                self._sparse_bitmaps[token, length] = frequencies, bitmap | 1 << rank
+        if (token, length) in self._word_bitmaps:
+            self._word_bitmaps[token, length] |= 1 << rank
+
+    def add_song(self, song, song_hash=None):
+        song_hash = storage.content_hash(song) if song_hash is None else song_hash
+        self.changed = True
+        if song_hash in self.numbers:
+            self.copies[song_hash] = self.copies.get(song_hash, 0) + 1
+            return
+        number = len(self.songs)
+        self.songs.append([song.artist, song.title, song_hash])
+        self.numbers[song_hash] = number
+        self.copies[song_hash] = 1
+        for i, stnza in enumerate(song.stanzas):
+            for j, vrs in enumerate(stnza.verses):
+                tokens = tokenize(vrs.lyrics)
+                if not tokens:
+                    continue
+                text = self._text_number(tokens)
+                verse = len(self.verse_song)
+                self.verse_song.append(number)
+                self.verse_stanza.append(i)
+                self.verse_number.append(j)
+                self.verse_next.append(NONE)
+                if self.text_last[text] == NONE:
+                    self.text_first[text] = verse
+                else:
+                    self.verse_next[self.text_last[text]] = verse
+                self.text_last[text] = verse
+
+    def remove_song(self, song, song_hash=None):
+        song_hash = storage.content_hash(song) if song_hash is None else song_hash
+        if song_hash not in self.copies:
+            return
+        self.changed = True
+        self.copies[song_hash] -= 1
+        if not self.copies[song_hash]:
+            del self.copies[song_hash]
+
+    def apply_records(self, lines):
+        """
+        Adds the songs and applies the tombstones of the records of a songbook file (see storage.dumps_song and
+        storage.tombstone_line).
+        """
+        for line in lines:
+            record = json.loads(line)
+            if storage.TOMBSTONE in record:
+                self.remove_song(None, record[storage.TOMBSTONE][2])
+            else:
+                self.add_song(storage.decode_song(record), storage.line_hash(line))
+
+    def needs_rebuild(self):
+        removed = len(self.numbers) - len(self.copies)
+        return removed >= max(REBUILD_MIN_REMOVED, len(self.copies) // REBUILD_RATIO)
+
+    def _frequency(self, token, text):
+        """
+        :return: the number of the occurrences of the word in the text
+        """
+        posting = self.postings[token]
+        i = bisect_left(posting, text)
+        return self.frequencies[token][i] if i < len(posting) and posting[i] == text else 0
+
+    def _score(self, text, tokens, weights, average_length):
+        """
+        :return: the score of the text, or None if it does not contain all the words
+        """
+        length = self.text_length[text]
+        score = 0.0
+        for token, weight in zip(tokens, weights):
+            frequency = self._frequency(token, text)
+            if not frequency:
+                return None
+            score += weight * impact(frequency, length, average_length)
+        return score
+
+    def _signature(self, tokens):
+        signature = 0
+        for token in tokens:
+            signature |= self._word_signatures[token]
+        return signature
+
+    def _with_signature(self, texts, signature):
+        """
+        :return: the texts whose signatures have all the bits of the given one (in the same order)
+        """
+        signatures = self.text_signature
+        return [text for text in texts if signatures[text] & signature == signature]
+
+    def _score_texts(self, texts, tokens, weights, average_length, best, signature=None):
+        """
+        Adds the texts that contain all the words to the best texts.
+        :param signature: the signature of the words (self._signature(tokens), computed if None)
+        """
+        if len(tokens) > 1:
+            texts = self._with_signature(texts, self._signature(tokens) if signature is None else signature)
+        for text in texts:
+            score = self._score(text, tokens, weights, average_length)
+            if score is not None and not best.beats(score, text):
+                best.add(score, text)
+
+    def _bitmap(self, token, frequency, length):
+        """
+        :return: the bucket as an int whose set bits are the ranks of its texts
+        """
+        key = token, frequency, length
+        if key not in self._bitmaps:
+            self._bitmaps[key] = self._ranks_bitmap([self.buckets[token][frequency, length]], length)
+        return self._bitmaps[key]
+
+    def _sparse_bitmap(self, token, length, frequencies):
+        """
+        :return: a bitmap (see _bitmap) of the texts of the given length in which the word has one of the given
+        frequencies, and maybe of some other texts with the word
+        """
+        covered, bitmap = self._sparse_bitmaps.get((token, length), ((), 0))
+        if not set(frequencies).issubset(covered):
+            covered = frozenset(frequencies)
+            bitmap = self._ranks_bitmap([self.buckets[token][frequency, length] for frequency in covered], length)
+            self._sparse_bitmaps[token, length] = covered, bitmap
+        return bitmap
+
+    def _word_bitmap(self, token, length, dense, sparse):
+        """
+        :param dense, sparse: the frequencies of the dense and of the sparse buckets of the word in the length
+        :return: a bitmap (see _bitmap) of the texts of the given length with the word
+        """
+        if (token, length) not in self._word_bitmaps:
+            bitmap = self._sparse_bitmap(token, length, sparse) if sparse else 0
+            for frequency in dense:
+                bitmap |= self._bitmap(token, frequency, length)
+            self._word_bitmaps[token, length] = bitmap
+        return self._word_bitmaps[token, length]
+
+    def _ranks_bitmap(self, buckets, length):
+        """
+        :param buckets: arrays of the ranks of the texts of the given length
+        :return: int whose set bits are the ranks
+        """
+        # one byte per rank first (which is set without a loop in python), then the bytes are packed to bits
+        bytemap = bytearray((len(self.length_texts[length]) + 8) // 8 * 8)
+        for ranks in buckets:
+            deque(map(bytemap.__setitem__, ranks, repeat(1)), maxlen=0)
+        bitmap = int.from_bytes(bytemap, "little")  # the bit 8 * i is the bit i of the result
+        # the bits 8 * (8 * k + j) are moved to 64 * k + j, and the lowest byte of every 8 bytes is taken
+        bitmap |= bitmap >> 7
+        bitmap |= bitmap >> 14
+        bitmap |= bitmap >> 28
+        return int.from_bytes(bitmap.to_bytes(len(bytemap), "little")[::8], "little")
+
+    def _is_dense(self, bucket, length):
+        return len(bucket) * DENSE_RATIO >= len(self.length_texts[length])
+
+    def _live_verses(self, text, limit):
+        """
+        :return: the verses of the text that are in the songs that were not removed (at most limit of them)
+        """
+        verses = []
+        verse = self.text_first[text]
+        while verse != NONE and len(verses) < limit:
+            if self.songs[self.verse_song[verse]][2] in self.copies:
+                verses.append(verse)
+            verse = self.verse_next[verse]
+        return verses
+
+    def _search_by_classes(self, tokens, weights, average_length, best):
+        """
+        The texts with the same length and the same frequencies of the words have the same score, and they are
+        the intersection of the buckets of the words. For every length, the combinations of the frequencies of the
+        dense buckets (the classes) are enumerated from the best score down, as in the k-best sum of sorted lists,
+        and intersected as bitmaps, until the found texts are better than the next class.
+        The other texts (in which some word has the frequency of a sparse bucket) are then scored length by length,
+        from the highest upper bound of the score in the length down, until the found texts are better
+        (see _sparse_texts).
+        """
+        # length: for every word, {frequency of the word in the texts of this length: the score of the word in them}
+        scores = {}
+        for i, (token, weight) in enumerate(zip(tokens, weights)):
+            for frequency, length in self.buckets[token]:
+                scores.setdefault(length, [{} for _ in tokens])[i][frequency] = \
+                    weight * impact(frequency, length, average_length)
+
+        def score(length, chosen):
+            return sum(word_scores[frequency] for word_scores, frequency in zip(scores[length], chosen))
+
+        classes = []  # min-heap of (-score, length, positions in the frequencies of the dense buckets)
+        lengths = []  # (-upper bound, length) of the lengths with the texts of the sparse frequencies
+        dense = {}    # length: for every word, the frequencies of its dense buckets (from the highest)
+        for length, per_word in scores.items():
+            if not all(per_word):
+                continue
+            dense[length] = [sorted((frequency for frequency in word_scores
+                                     if len(tokens) == 1 or self._is_dense(self.buckets[token][frequency, length],
+                                                                           length)), reverse=True)
+                             for token, word_scores in zip(tokens, per_word)]
+            if all(dense[length]):
+                classes.append((-score(length, [word_frequencies[0] for word_frequencies in dense[length]]),
+                                length, (0,) * len(tokens)))
+            if any(len(dense_frequencies) < len(word_scores)
+                   for word_scores, dense_frequencies in zip(per_word, dense[length])):
+                lengths.append((-sum(max(word_scores.values()) for word_scores in per_word), length))
+        heapq.heapify(classes)
+        while classes:
+            negative_score, length, positions = heapq.heappop(classes)
+            if best.beats(-negative_score):
+                break
+            # the next combinations: a lower frequency of one word (only of the words from the last lowered one on,
+            # so that every combination is enumerated once)
+            last = max([i for i, position in enumerate(positions) if position] or [0])
+            for i in range(last, len(tokens)):
+                if positions[i] + 1 < len(dense[length][i]):
+                    lowered = positions[:i] + (positions[i] + 1,) + positions[i + 1:]
+                    chosen = [word_frequencies[position] for word_frequencies, position in zip(dense[length], lowered)]
+                    heapq.heappush(classes, (-score(length, chosen), length, lowered))
+            chosen = [word_frequencies[position] for word_frequencies, position in zip(dense[length], positions)]
+            for text in self._class_texts(tokens, chosen, length):
+                if best.beats(-negative_score, text):
+                    break
+                best.add(-negative_score, text)
+        postings = [(self.postings[token], self.frequencies[token]) for token in tokens]
+        for negative_upper_bound, length in sorted(lengths):
+            if best.beats(-negative_upper_bound):
+                return
+            for text in self._sparse_texts(tokens, best, length, scores[length], dense[length]):
+                chosen = []
+                for posting, frequencies in postings:
+                    i = bisect_left(posting, text)
+                    chosen.append(frequencies[i] if i < len(posting) and posting[i] == text else 0)
+                # the texts in the dense buckets of all the words are in the classes
+                if 0 in chosen or all(frequency in word_frequencies
+                                      for frequency, word_frequencies in zip(chosen, dense[length])):
+                    continue
+                text_score = score(length, chosen)
+                if not best.beats(text_score, text):
+                    best.add(text_score, text)
+
+    def _sparse_texts(self, tokens, best, length, scores, dense):
+        """
+        A text that is better than the found ones has high enough frequencies of every word (given the highest
+        frequencies of the other words). If every word has dense buckets, the texts are the intersection of
+        the bitmaps of such dense buckets and of the sparse buckets of every word, with the texts in some sparse
+        bucket. Otherwise, the buckets of such frequencies of a word without dense buckets are scanned (with
+        the signature of the words, which includes the repetition of a word if it must be repeated).
+        :param scores: for every word, {frequency of the word in the texts of the length: the score of the word}
+        :param dense: for every word, the frequencies of its dense buckets
+        :return: list of the texts of the length that include those with some sparse frequency that can be among
+        the best (and some texts in the dense buckets of all the words)
+        """
+        highest = [max(word_scores.values()) for word_scores in scores]
+        total = sum(highest)
+        needed = []  # for every word, the frequencies with which a text can be among the best
+        for word_scores, word_highest in zip(scores, highest):
+            needed.append([frequency for frequency, word_score in word_scores.items()
+                           if not best.beats(total - word_highest + word_score)])
+            if not needed[-1]:
+                return []
+        if not all(dense):
+            signature = 0
+            for token, word_needed in zip(tokens, needed):
+                signature |= self._word_signatures[token]
+                if min(word_needed) > 1:
+                    signature |= self._word_signatures[token + REPEATED]
+            i = min((i for i in range(len(tokens)) if not dense[i]),
+                    key=lambda i: sum(len(self.buckets[tokens[i]][frequency, length]) for frequency in needed[i]))
+            texts = self.length_texts[length]
+            return self._with_signature([texts[rank] for frequency in needed[i]
+                                         for rank in self.buckets[tokens[i]][frequency, length]], signature)
+        candidates = -1
+        with_sparse = 0
+        for token, word_scores, word_needed, dense_frequencies in zip(tokens, scores, needed, dense):
+            sparse = [frequency for frequency in word_scores if frequency not in dense_frequencies]
+            if sparse:
+                with_sparse |= self._sparse_bitmap(token, length, sparse)
+            if len(word_needed) == len(word_scores):
+                candidates &= self._word_bitmap(token, length, dense_frequencies, sparse)
+                continue
+            bitmap = self._sparse_bitmap(token, length, sparse) if sparse else 0
+            for frequency in word_needed:
+                if frequency in dense_frequencies:
+                    bitmap |= self._bitmap(token, frequency, length)
+            candidates &= bitmap
+        texts = self.length_texts[length]
+        return [texts[rank] for rank in _ranks(candidates & with_sparse)]
+
+    def _class_texts(self, tokens, chosen, length):
+        """
+        :return: iterable of the texts of the given length in which the words have the chosen frequencies (of dense
+        buckets), in the order of the text numbers
+        """
+        texts = self.length_texts[length]
+        if len(tokens) == 1:
+            return map(texts.__getitem__, self.buckets[tokens[0]][chosen[0], length])
+        common = -1
+        for token, frequency in zip(tokens, chosen):
+            common &= self._bitmap(token, frequency, length)
+        return (texts[rank] for rank in _ranks(common))
+
+    def search(self, query, limit=10):
+        """
+        Finds the verses that contain all the words of the query. If the rarest word is in few texts, they are all
+        scored, otherwise see _search_by_classes.
+        :param query: text
+        :param limit: the maximal number of the hits
+        :return: list of the hits (artist, title, content hash, stanza, verse, score), the best first
+        """
+        tokens = sorted(set(tokenize(query)))
+        if not tokens or limit <= 0 or any(token not in self.postings for token in tokens):
+            return []
+        texts = len(self.text_length)
+        average_length = self.total_length / texts
+        weights = [inverse_document_frequency(len(self.postings[token]), texts) for token in tokens]
+        best = _BestTexts(self, limit)
+        rarest = min(tokens, key=lambda token: len(self.postings[token]))
+        if len(self.postings[rarest]) <= EXHAUSTIVE_LIMIT:
+            self._score_texts(self.postings[rarest], tokens, weights, average_length, best)
+        else:
+            self._search_by_classes(tokens, weights, average_length, best)
+        return best.hits()
+
+    def _arrays(self):
+        return [self.text_length, self.text_first, self.text_last, self.text_signature,
+                self.verse_song, self.verse_stanza, self.verse_number, self.verse_next]
+
+    def save(self, file_name, source):
+        """
+        Writes the index: a json header line, followed by the arrays of the texts and the verses, the texts of every
+        length, the postings, the frequencies and the buckets of every word, and the texts.
+        :param file_name: path to the index file
+        :param source: file_state of the songbook file that the index describes
+        """
+        tokens = list(self.postings)
+        header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "source": source, "byteorder": sys.byteorder,
+                  "itemsizes": [self.verse_song.itemsize, array("H").itemsize, self.text_signature.itemsize],
+                  "songs": self.songs, "copies": self.copies, "total_length": self.total_length,
+                  "length_counts": [[length, len(texts)] for length, texts in self.length_texts.items()],
+                  "texts": len(self.text_length), "verses": len(self.verse_song),
+                  "tokens": [[token, len(self.postings[token]),
+                              [[frequency, length, len(texts)]
+                               for (frequency, length), texts in self.buckets[token].items()]]
+                             for token in tokens]}
+        temporary = file_name + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write((_ENCODER.encode(header) + "\n").encode("utf-8"))
+            for values in self._arrays():
+                values.tofile(f)
+            for texts in self.length_texts.values():
+                texts.tofile(f)
+            for token in tokens:
+                self.postings[token].tofile(f)
+                self.frequencies[token].tofile(f)
+                for texts in self.buckets[token].values():
+                    texts.tofile(f)
+            if self._texts is None:
+                f.write(self._saved_texts)
+            else:
+                f.write("\n".join(self._texts).encode("utf-8"))
+        os.replace(temporary, file_name)
+        self.changed = False
+        self.source = source
+
+
+class _BestTexts:
+    """
+    The best texts found by a search, just enough of them to give limit live verses. The texts are ordered by
+    the score, and the texts with the same score by the text number.
+    """
+    def __init__(self, index, limit):
+        self.index = index
+        self.limit = limit
+        self.heap = []  # min-heap of (score, -text number, live verses)
+        self.found = 0  # the number of the live verses in the heap
+
+    def add(self, score, text):
+        verses = self.index._live_verses(text, self.limit)
+        if not verses:
+            return
+        heapq.heappush(self.heap, (score, -text, verses))
+        self.found += len(verses)
+        # the worst text is not needed if the others give enough hits
+        while self.found - len(self.heap[0][2]) >= self.limit:
+            self.found -= len(heapq.heappop(self.heap)[2])
+
+    def beats(self, score, text=None):
+        """
+        :return: whether the found texts give enough hits and are better than the given text (or than any text with
+        the given score if the text is None)
+        """
+        if self.found < self.limit:
+            return False
+        if text is None:
+            return self.heap[0][0] > score
+        return self.heap[0][:2] > (score, -text)
+
+    def hits(self):
+        hits = []
+        index = self.index
+        for score, text, verses in sorted(self.heap, reverse=True):
+            for verse in verses[:self.limit - len(hits)]:
+                artist, title, song_hash = index.songs[index.verse_song[verse]]
+                hits.append((artist, title, song_hash, index.verse_stanza[verse], index.verse_number[verse], score))
+        return hits
+
+
+def _ranks(bitmap):
+    """
+    :return: generator of the positions of the set bits of the int, in the increasing order. The highest
+    PEELED_BITS bits are cleared one by one, which is faster for a few bits than converting the int to bytes.
+    """
+    highest = []
+    while bitmap and len(highest) < PEELED_BITS:
+        position = bitmap.bit_length() - 1
+        highest.append(position)
+        bitmap ^= 1 << position
+    if bitmap:
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        nonzero = data.translate(_NONZERO)
+        i = nonzero.find(1)
+        while i >= 0:
+            for bit in _BYTE_BITS[data[i]]:
+                yield 8 * i + bit
+            i = nonzero.find(1, i + 1)
+    yield from reversed(highest)
+
+
+def load_index(file_name, source):
+    """
+    :param file_name: path to the index file
+    :param source: file_state of the songbook file
+    :return: SearchIndex, or None if there is no index or it does not describe the current songbook file
+    """
+    if not exists(file_name):
+        return None
+    with open(file_name, "rb") as f:
+        header = json.loads(f.readline().decode("utf-8"))
+        content = f.read()
+    index = SearchIndex()
+    if header.get("format") != FORMAT_NAME or header.get("version") != FORMAT_VERSION or \
+            header["source"] != source or header["byteorder"] != sys.byteorder or \
+            header["itemsizes"] != [index.verse_song.itemsize, array("H").itemsize, index.text_signature.itemsize]:
+        return None
+    index.songs = header["songs"]
+    index.numbers = {song_hash: number for number, (_, _, song_hash) in enumerate(index.songs)}
+    index.copies = header["copies"]
+    index.total_length = header["total_length"]
+    index.source = source
+    content = memoryview(content)
+    offset = 0
+
+    def read_array(typecode, length):
+        nonlocal offset
+        values = array(typecode)
+        size = length * values.itemsize
+        values.frombytes(content[offset:offset + size])
+        offset += size
+        return values
+
+    for values, length in zip(index._arrays(), [header["texts"]] * 4 + [header["verses"]] * 4):
+        values.extend(read_array(values.typecode, length))
+    for length, texts in header["length_counts"]:
+        index.length_texts[length] = read_array("I", texts)
+    for token, length, buckets in header["tokens"]:
+        index.postings[token] = read_array("I", length)
+        index.frequencies[token] = read_array("H", length)
+        index.buckets[token] = {(frequency, text_length): read_array("I", texts)
+                                for frequency, text_length, texts in buckets}
+    # the texts are split only when a song is added
+    index._saved_texts = content[offset:].tobytes()
+    return index
+
+
+def build_index(songs):
+    """
+    :param songs: iterable of Song objects
+    :return: SearchIndex of the songs
+    """
+    index = SearchIndex()
+    for sng in songs:
+        index.add_song(sng)
+    return index
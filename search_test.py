@@ -0,0 +1,108 @@
+import random
+import unittest
+from unittest import mock
+import misc
+import search
+import storage
+from song import Song
+from stanza import Stanza
+from verse import parse_verse
+
+
+def make_song(artist, title, stanzas):
+    return Song(artist, title, [Stanza([parse_verse(line) for line in lines]) for lines in stanzas])
+
+
+class SearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = misc.create_temp_folder(".")
+
+    @classmethod
+    def tearDownClass(cls):
+        misc.remove_temp_folder(cls.folder)
+
+    def setUp(self):
+        self.river = make_song("Vlado Kreslin", "Reka", [["<C>Čez reko <G>pelje most", "<a>in most je <F>dolg"],
+                                                         ["Šumi, šumi reka"]])
+        self.bridge = make_song("Siddharta", "Most", [["Most, most, most"], ["<C>Na mostu stojim"]])
+        self.index = search.build_index([self.river, self.bridge])
+
+    def hits(self, query, index=None):
+        index = self.index if index is None else index
+        return [(title, stanza, verse) for _, title, _, stanza, verse, _ in index.search(query)]
+
+    def test_normalize(self):
+        self.assertEqual("cez sumi zaba", search.normalize("Čez ŠUMI žaba"))
+        self.assertListEqual(["cez", "reko", "pelje", "most"], search.tokenize("Čez reko, pelje most!"))
+
+    def test_search(self):
+        self.assertListEqual([("Reka", 0, 0)], self.hits("cez REKO"))
+        self.assertListEqual([("Reka", 1, 0)], self.hits("sumi"))
+        # the repeated word comes first, the equally good hits are in the order of the verses
+        self.assertListEqual([("Most", 0, 0), ("Reka", 0, 0), ("Reka", 0, 1)], self.hits("most"))
+        self.assertListEqual([], self.hits("most reka"))
+        self.assertListEqual([], self.hits("nobody"))
+        self.assertListEqual([], self.hits(", !"))
+        self.assertEqual(1, len(self.index.search("most", limit=1)))
+
+    def test_document_frequency_counts_texts(self):
+        # "most" is three times in the last text, and the word that is in every text still has a positive weight
+        self.assertEqual(3, len(self.index.postings["most"]))
+        self.assertListEqual([1, 1, 3], list(self.index.frequencies["most"]))
+        everywhere = search.build_index([make_song("A", "B", [["la la", "la"]])])
+        self.assertLess(0, everywhere.search("la")[0][5])
+
+    def test_pruned_search_is_exact(self):
+        rng = random.Random(1234)
+        words = ["w{}".format(i) for i in range(12)]
+        songs = []
+        for i in range(300):
+            stanzas = [[" ".join(rng.choices(words, weights=range(12, 0, -1), k=rng.randint(1, 6)))
+                        for _ in range(4)] for _ in range(2)]
+            songs.append(make_song("Artist", str(i), stanzas))
+        queries = words + [" ".join(rng.sample(words, k)) for k in [2, 3] for _ in range(20)]
+        # all the buckets dense or sparse, and the bitmaps built before some of the songs are added
+        for dense_ratio, peeled_bits in [(search.DENSE_RATIO, search.PEELED_BITS), (1, 0), (10 ** 9, 2)]:
+            index = search.build_index(songs[:200])
+            for sng in songs[::7]:
+                index.remove_song(sng)
+            for added in [songs[200:250], songs[250:]]:
+                for limit in [1, 10, 50]:
+                    for query in queries:
+                        with mock.patch("search.EXHAUSTIVE_LIMIT", 0), mock.patch("search.DENSE_RATIO", dense_ratio), \
+                                mock.patch("search.PEELED_BITS", peeled_bits):
+                            pruned = index.search(query, limit)
+                        with mock.patch("search.EXHAUSTIVE_LIMIT", len(songs) * 8):
+                            exhaustive = index.search(query, limit)
+                        self.assertListEqual(exhaustive, pruned)
+                for sng in added:
+                    index.add_song(sng)
+
+    def test_add_and_remove(self):
+        self.index.remove_song(self.river)
+        self.assertListEqual([("Most", 0, 0)], self.hits("most"))
+        self.assertEqual(1, len(self.index))
+        self.index.add_song(self.river)
+        self.index.add_song(self.river)
+        self.index.remove_song(self.river)
+        self.assertListEqual([("Reka", 1, 0)], self.hits("sumi"))
+        self.assertEqual(storage.content_hash(self.river), self.index.search("sumi")[0][2])
+        self.assertFalse(self.index.needs_rebuild())
+
+    def test_save_and_load(self):
+        index_file = self.folder + "/book.sgbk.search"
+        self.index.remove_song(self.bridge)
+        self.index.save(index_file, [10, 20])
+        self.assertFalse(self.index.changed)
+        self.assertIsNone(search.load_index(index_file, [10, 21]))
+        self.assertIsNone(search.load_index(self.folder + "/missing.sgbk.search", None))
+        loaded = search.load_index(index_file, [10, 20])
+        for query in ["most", "cez reko", "stojim"]:
+            self.assertListEqual(self.index.search(query), loaded.search(query))
+        loaded.add_song(self.bridge)
+        self.assertListEqual([("Most", 0, 0), ("Reka", 0, 0), ("Reka", 0, 1)], self.hits("most", loaded))
+
+
+if __name__ == '__main__':
+    unittest.main()
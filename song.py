@@ -1,9 +1,54 @@
+import gzip
+import io
+import sys
+from contextlib import nullcontext
 from verse import parse_verse
+from chord import NUMBER_HALFTONES, DIFFICULTY_BY_INDEX, get_tone_index
 import stanza
 
 
 LJUDSKA = "ljudska"
 NEZNANI_AVTOR = "neznano"
+SONG_SEPARATOR = "%%%"  # separates the songs in a corpus file (a line with only this)
+
+# The transpositions in the order in which they are considered by Song.most_user_friendly_version:
+# if more of them are equally simple, the first one wins.
+TRANSPOSITION_CANDIDATES = [direction * halftones for halftones in range(7) for direction in [1, -1]]
+# DIFFICULTY_MATRIX[shift][i]: the difficulty of the tone with the index i, transposed for shift half-tones
+DIFFICULTY_MATRIX = [[DIFFICULTY_BY_INDEX[(i + shift) % NUMBER_HALFTONES] for i in range(NUMBER_HALFTONES)]
+                     for shift in range(NUMBER_HALFTONES)]
+_BEST_TRANSPOSITIONS = {}  # tone mask: the number of half-tones
+
+
+def song_key(artist, title):
+    """
+    :return: the key by which the songs of a songbook are sorted
+    """
+    return artist.casefold(), title.casefold()
+
+
+def best_transposition_for_mask(mask):
+    """
+    Finds the simplest transposition of the tones that are present in a song.
+    :param mask: the bit i is set if the song contains a chord whose tone has the index i
+    :return: the number of half-tones from TRANSPOSITION_CANDIDATES
+    """
+    if mask not in _BEST_TRANSPOSITIONS:
+        present = [i for i in range(NUMBER_HALFTONES) if mask >> i & 1]
+        scores = [max((row[i] for i in present), default=-float("inf")) for row in DIFFICULTY_MATRIX]
+        _BEST_TRANSPOSITIONS[mask] = min(TRANSPOSITION_CANDIDATES,
+                                         key=lambda half_tones: scores[half_tones % NUMBER_HALFTONES])
+    return _BEST_TRANSPOSITIONS[mask]
+
+
+def best_transpositions(songs):
+    """
+    Batch version of Song.best_transposition. There are only 2^12 possible sets of tones, so the songs
+    with the same set share the computation.
+    :param songs: iterable of Song objects
+    :return: list of the numbers of half-tones
+    """
+    return [best_transposition_for_mask(sng.tone_mask()) for sng in songs]
 
 
 class Song:
@@ -40,28 +85,35 @@ class Song:
         max_difficulty = -float("inf")
         for stnza in self.stanzas:
             for verse in stnza.verses:
-                for chord in verse.chords:
-                    max_difficulty = max(max_difficulty, chord.difficulty)
+                for chrd, _ in verse.chords:
+                    max_difficulty = max(max_difficulty, chrd.difficulty)
         return max_difficulty
 
-    def most_user_friendly_version(self):
+    def tone_mask(self):
+        """
+        :return: the 12-bit mask whose bit i is set if the song contains a chord with the tone index i
+        """
+        mask = 0
+        for chrd in {chrd for stnza in self.stanzas for verse in stnza.verses for chrd, _ in verse.chords}:
+            mask |= 1 << get_tone_index(chrd.tone)
+        return mask
+
+    def best_transposition(self):
         """
         Finds the number of half-tones for which the song should be transposed
         for its chords to be as simple as possible. If there is more than one option,
         the version that is the nearest to the original wins. If still, there are two
         options, the positive wins.
-        :return:
+        :return: the number of half-tones, between -6 and 6
+        """
+        return best_transposition_for_mask(self.tone_mask())
+
+    def most_user_friendly_version(self):
         """
-        optimal_score = float("inf")
-        optimal_version = None
-        for halftones in range(7):  # +- 6 option is computed twice, no biggie
-            for direction in [1, -1]:
-                transposed = self.transpose(direction * halftones)
-                score = transposed.difficulty()
-                if score < optimal_score:
-                    optimal_score = score
-                    optimal_version = transposed
-        return optimal_version
+        Transposes the song for best_transposition() half-tones.
+        :return: the transposed song
+        """
+        return self.transpose(self.best_transposition())
 
     def latex_string(self):
         header = "\\beginsong{{{}}}[by={{{}}}]".format(self.title, self.artist)
@@ -108,18 +160,87 @@ def parse_song(text_file):
     :param text_file: the name of the input file with the songs
     :return: the corresponding Song object
     """
-    stanzas = []
     with open(text_file, encoding="utf-8") as f:
-        artist = f.readline().strip()
-        title = f.readline().strip()
-        current_stanza = []
-        for line in f:
-            stripped = line.strip()
-            if stripped:
-                current_stanza.append(parse_verse(stripped))
-            else:
-                stanzas.append(stanza.Stanza(current_stanza[::]))
-                current_stanza = []
-        if current_stanza:
+        return song_from_lines(f)
+
+
+def song_from_lines(lines):
+    """
+    Parses the lines of a song, given in the form that is described in parse_song.
+    :param lines: iterable of the lines
+    :return: the corresponding Song object
+    """
+    stanzas = []
+    lines = iter(lines)
+    artist = next(lines, "").strip()
+    title = next(lines, "").strip()
+    current_stanza = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped:
+            current_stanza.append(parse_verse(stripped))
+        else:
             stanzas.append(stanza.Stanza(current_stanza[::]))
+            current_stanza = []
+    if current_stanza:
+        stanzas.append(stanza.Stanza(current_stanza[::]))
     return Song(artist, title, stanzas)
+
+
+def iter_songs(stream, separator=SONG_SEPARATOR):
+    """
+    Reads the songs from a corpus: the songs are given as in parse_song, and they are separated by the lines
+    that contain only the separator. Only one song at a time is kept in memory.
+    :param stream: text or binary (utf-8) file object, e.g., sys.stdin or gzip.open(path)
+    :param separator: the separator of the songs
+    :return: generator of Song objects. A binary stream stays open when the generator is finished or closed.
+    """
+    wrapper = None
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        stream = wrapper = io.TextIOWrapper(stream, encoding="utf-8")
+    try:
+        lines = []
+        for line in stream:
+            if line.strip() == separator:
+                if lines:
+                    yield song_from_lines(lines)
+                lines = []
+            elif lines or line.strip():  # skip the empty lines in front of the song
+                lines.append(line)
+        if lines:
+            yield song_from_lines(lines)
+    finally:
+        if wrapper is not None:
+            wrapper.detach()  # otherwise, the wrapper closes the caller's stream when it is garbage collected
+
+
+def open_corpus(path):
+    """
+    Opens a corpus file for iter_songs: "-" stands for the standard input, and .gz files are decompressed.
+    :param path: path to the file
+    :return: context manager that gives the file object
+    """
+    if path == "-":
+        return nullcontext(sys.stdin)
+    elif path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def write_corpus(f, songs, separator=SONG_SEPARATOR):
+    """
+    Writes the songs in the form that is read by iter_songs.
+    :param f: opened (text) file
+    :param songs: iterable of Song objects
+    :param separator: the separator of the songs
+    :return:
+    """
+    for i, sng in enumerate(songs):
+        if i:
+            print(separator, file=f)
+        print(sng.artist, file=f)
+        print(sng.title, file=f)
+        for stnza in sng.stanzas:
+            for vrs in stnza.verses:
+                print(vrs.description(), file=f)
+            print("", file=f)
@@ -0,0 +1,73 @@
+class SongIndex:
+    """
+    Inverted indices of a collection of songs: chord -> songs, difficulty -> songs and artist -> songs.
+    The songs are kept by identity (Song objects are not hashable), in the order in which they were added.
+    A song that is added more than once is indexed once, and stays in the index until it is removed as many times.
+    """
+    def __init__(self, songs=()):
+        self.by_chord = {}       # chord: {id(song): song, ...}
+        self.by_difficulty = {}  # difficulty (see Song.difficulty): {id(song): song, ...}
+        self.by_artist = {}      # artist.casefold(): {id(song): song, ...}
+        self.keys = {}           # id(song): (chords, difficulty, artist key) of the song
+        self.counts = {}         # id(song): how many times the song was added
+        for sng in songs:
+            self.add(sng)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, sng):
+        self.counts[id(sng)] = self.counts.get(id(sng), 0) + 1
+        if id(sng) in self.keys:
+            return
+        chords = {chrd for stz in sng.stanzas for vrs in stz.verses for chrd, _ in vrs.chords}
+        difficulty = max((chrd.difficulty for chrd in chords), default=-float("inf"))
+        artist = sng.artist.casefold()
+        self.keys[id(sng)] = (chords, difficulty, artist)
+        for chrd in chords:
+            self.by_chord.setdefault(chrd, {})[id(sng)] = sng
+        self.by_difficulty.setdefault(difficulty, {})[id(sng)] = sng
+        self.by_artist.setdefault(artist, {})[id(sng)] = sng
+
+    def remove(self, sng):
+        self.counts[id(sng)] -= 1
+        if self.counts[id(sng)]:
+            return
+        del self.counts[id(sng)]
+        chords, difficulty, artist = self.keys.pop(id(sng))
+        for chrd in chords:
+            _discard(self.by_chord, chrd, sng)
+        _discard(self.by_difficulty, difficulty, sng)
+        _discard(self.by_artist, artist, sng)
+
+    def chords(self):
+        return set(self.by_chord)
+
+    def with_chord(self, chrd):
+        return list(self.by_chord.get(chrd, {}).values())
+
+    def with_all_chords(self, chords):
+        """
+        :return: the songs that contain every chord from chords (the smallest bucket is scanned)
+        """
+        buckets = sorted((self.by_chord.get(chrd, {}) for chrd in set(chords)), key=len)
+        if not buckets:
+            return []
+        return [sng for key, sng in buckets[0].items() if all(key in bucket for bucket in buckets[1:])]
+
+    def with_max_difficulty(self, max_difficulty):
+        """
+        :return: the songs whose chords are at most max_difficulty difficult, e.g., chord.SIMPLE for no barre chords
+        """
+        return [sng for difficulty, bucket in sorted(self.by_difficulty.items()) if difficulty <= max_difficulty
+                for sng in bucket.values()]
+
+    def by(self, artist):
+        return list(self.by_artist.get(artist.casefold(), {}).values())
+
+
+def _discard(index, key, sng):
+    bucket = index[key]
+    del bucket[id(sng)]
+    if not bucket:
+        del index[key]
@@ -0,0 +1,57 @@
+import unittest
+import chord
+from chord import Chord
+from song_index import SongIndex
+from song import Song
+from stanza import Stanza
+from verse import parse_verse
+
+
+def make_song(artist, title, lines):
+    return Song(artist, title, [Stanza([parse_verse(line) for line in lines])])
+
+
+class SongIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.easy = make_song("Slon in Sadez", "Easy", ["<C>Tum <G>bum <a>pam"])
+        self.barre = make_song("slon in sadez", "Barre", ["<F>Tum <C>bum"])
+        self.hard = make_song("Siddharta", "Hard", ["<D#>Tum <F>bum"])
+        self.empty = make_song("Siddharta", "Lyrics", ["No chords"])
+        self.index = SongIndex([self.easy, self.barre, self.hard, self.empty])
+
+    def assert_same_songs(self, expected, actual):
+        self.assertListEqual([id(sng) for sng in expected], [id(sng) for sng in actual])
+
+    def test_chords(self):
+        self.assertSetEqual({Chord("C", []), Chord("G", []), Chord("A", ["m"]), Chord("F", []), Chord("D#", [])},
+                            self.index.chords())
+
+    def test_with_chord(self):
+        self.assert_same_songs([self.easy, self.barre], self.index.with_chord(Chord("C", [])))
+        self.assert_same_songs([], self.index.with_chord(Chord("H", [])))
+        self.assert_same_songs([self.barre, self.hard], self.index.with_all_chords([Chord("F", []), Chord("F", [])]))
+        self.assert_same_songs([self.barre], self.index.with_all_chords([Chord("F", []), Chord("C", [])]))
+        self.assert_same_songs([], self.index.with_all_chords([]))
+
+    def test_with_max_difficulty(self):
+        self.assert_same_songs([self.empty, self.easy], self.index.with_max_difficulty(chord.SIMPLE))
+        self.assert_same_songs([self.empty, self.easy, self.barre, self.hard], self.index.with_max_difficulty(10))
+
+    def test_by_artist(self):
+        self.assert_same_songs([self.easy, self.barre], self.index.by("SLON IN SADEZ"))
+        self.assert_same_songs([], self.index.by("nobody"))
+
+    def test_add_and_remove(self):
+        self.index.add(self.easy)
+        self.index.remove(self.easy)
+        self.assert_same_songs([self.easy, self.barre], self.index.with_chord(Chord("C", [])))
+        self.index.remove(self.easy)
+        self.assert_same_songs([self.barre], self.index.with_chord(Chord("C", [])))
+        self.assertNotIn(Chord("G", []), self.index.chords())
+        self.assertEqual(3, len(self.index))
+        self.index.add(self.easy)
+        self.assert_same_songs([self.barre, self.easy], self.index.with_chord(Chord("C", [])))
+
+
+if __name__ == '__main__':
+    unittest.main()
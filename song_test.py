@@ -1,4 +1,9 @@
 import unittest
+import gzip
+import io
+import random
+from unittest import mock
+import chord
 import song
 import stanza
 import verse
@@ -73,3 +78,78 @@ class SongTest(unittest.TestCase):
                  "\\endsong"
         self.assertEqual(answer, self.song_orig.latex_string())
 
+    @staticmethod
+    def brute_force_most_user_friendly(sng):
+        optimal_score = float("inf")
+        optimal_version = None
+        for halftones in range(7):
+            for direction in [1, -1]:
+                transposed = sng.transpose(direction * halftones)
+                score = transposed.difficulty()
+                if score < optimal_score:
+                    optimal_score = score
+                    optimal_version = transposed
+        return optimal_version
+
+    def test_most_user_friendly_version(self):
+        rng = random.Random(1234)
+        tones = sorted(chord.ALLOWED_TONES)
+        songs = [self.song_orig, song.Song("", "", [])]
+        for _ in range(300):
+            chords = [(chord.Chord(rng.choice(tones)), i) for i in range(rng.randint(1, 6))]
+            songs.append(song.Song("", "", [stanza.Stanza([verse.Verse(" " * 6, chords)])]))
+        for sng in songs:
+            self.assertEqual(self.brute_force_most_user_friendly(sng), sng.most_user_friendly_version())
+        self.assertListEqual([sng.best_transposition() for sng in songs], song.best_transpositions(songs))
+
+    def test_best_transposition(self):
+        self.assertEqual(0, self.song_orig.best_transposition())
+        self.assertEqual(1, self.song_orig.transpose(1).best_transposition())  # D and A beat C and G
+        self.assertEqual(1, self.song_orig.transpose(-1).best_transposition())
+        self.assertEqual(0, self.song_orig.transpose(2).best_transposition())
+        self.assertEqual(0, song.Song("", "", []).best_transposition())
+
+    def corpus_songs(self):
+        return [self.song_orig, self.song_orig.transpose(3), song.Song("A", "Empty", [])]
+
+    def test_iter_songs(self):
+        text = io.StringIO()
+        song.write_corpus(text, self.corpus_songs())
+        songs = list(song.iter_songs(io.StringIO("\n\n" + text.getvalue() + song.SONG_SEPARATOR + "\n")))
+        self.assertListEqual(self.corpus_songs(), songs)
+
+    def test_iter_songs_gzip_and_stdin(self):
+        text = io.StringIO()
+        song.write_corpus(text, self.corpus_songs())
+        corpus_file = self.songs_folder + "/corpus.txt.gz"
+        with gzip.open(corpus_file, "wt", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        with song.open_corpus(corpus_file) as f:
+            self.assertListEqual(self.corpus_songs(), list(song.iter_songs(f)))
+        with gzip.open(corpus_file) as f:
+            self.assertListEqual(self.corpus_songs(), list(song.iter_songs(f)))
+        with mock.patch("sys.stdin", io.StringIO(text.getvalue())):
+            with song.open_corpus("-") as f:
+                self.assertListEqual(self.corpus_songs(), list(song.iter_songs(f)))
+
+    def test_iter_songs_keeps_binary_stream_open(self):
+        text = io.StringIO()
+        song.write_corpus(text, self.corpus_songs())
+        stream = io.BytesIO(text.getvalue().encode("utf-8"))
+        self.assertListEqual(self.corpus_songs(), list(song.iter_songs(stream)))
+        self.assertFalse(stream.closed)
+        stream.seek(0)
+        songs = song.iter_songs(stream)
+        self.assertEqual(self.song_orig, next(songs))
+        songs.close()
+        del songs
+        self.assertFalse(stream.closed)
+
+    def test_iter_songs_is_lazy(self):
+        text = io.StringIO()
+        song.write_corpus(text, self.corpus_songs())
+        lines = iter(text.getvalue().splitlines(keepends=True))
+        songs = song.iter_songs(lines)
+        self.assertEqual(self.song_orig, next(songs))
+        # only the first song and the separator have been read
+        self.assertEqual(song.LJUDSKA, next(lines).strip())
@@ -7,13 +7,28 @@ from stanza import Stanza
 # noinspection PyUnresolvedReferences
 from song import Song
 
-from song import parse_song
+from song import parse_song, best_transpositions, iter_songs, open_corpus, song_key
 from os.path import exists
 from os import makedirs
+import heapq
+import logging
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
 from misc import nicify_path
-from re import sub
+from io import StringIO
 import collect_chords
 import grip
+import instrumentation
+import storage
+import render_cache
+import search
+from song_index import SongIndex
+
+
+logger = logging.getLogger(__name__)
 
 
 SONGBOOK_FILE_ENDING = ".sgbk"
@@ -22,28 +37,52 @@ TEX_TEMPLATE_SONGS_PLACEHOLDER = "SONGS_PLACEHOLDER"
 TEX_TEMPLATE_SONGBOOK_TITLE_PLACEHOLDER = "TITLE_PLACEHOLDER"
 TEX_TEMPLATE_CHORDS_PLACEHOLDER = "CHORDS_PLACEHOLDER"
 TEX_TEMPLATE_SONGBOOK_AUTHOR_PLACEHOLDER = "AUTHOR_PLACEHOLDER"
+# the changes are appended to the songbook file, until the number of the appended records reaches
+# max(COMPACTION_MIN_RECORDS, number of songs / COMPACTION_RATIO), and then the file is written from scratch
+COMPACTION_MIN_RECORDS = 64
+COMPACTION_RATIO = 2
+# what create_songbook_from_text_files does if the songbook file exists
+FAIL = "fail"            # raise FileExistsError
+OVERWRITE = "overwrite"  # replace the songbook
+MERGE = "merge"          # add the new songs, and replace the ones with the same artist and title
+SKIP = "skip"            # keep the songbook as it is
+ASK = "ask"              # ask the user whether to overwrite (or skip); FAIL if there is no terminal
+OVERWRITE_POLICIES = [FAIL, OVERWRITE, MERGE, SKIP, ASK]
 
 
 class SongBook:
-    def __init__(self, file_name):
+    def __init__(self, file_name, lazy=False):
+        """
+        Reads the songbook from the file or creates an empty one. The file (and its folder) is created only
+        by write_to_file.
+        :param file_name: path to the songbook file
+        :param lazy: if True, and the file is in the current format, the songs are decoded only when
+        they are accessed (self.songs is then a storage.LazySongs sequence).
+        The songs are kept sorted by song.song_key, and self.keys are their keys.
+        The index of the songs (see SongIndex) is built here, or, for lazy books, at the first query.
+        The index of the lyrics (see search.SearchIndex) is loaded or built at the first lyrics search.
+        """
         self.place_on_disk = file_name
         self.songs = []
+        self.keys = []
+        self.index = None
+        self.lyrics_index = None
+        self.pending = []       # the records that will be appended to the file at the next save
+        self.rewrite = False    # whether the file must be written as a whole at the next save
+        self.unindexed = 0      # the number of the records at the end of the file that are not in its index
+        self.appendable = storage.is_lazy_loadable(file_name)
         if not file_name.endswith(SONGBOOK_FILE_ENDING):
             raise Exception("Songbook file must end with {}".format(SONGBOOK_FILE_ENDING))
-        message = "{} the songbook file {}".format("Reading" if exists(file_name) else "Creating", file_name)
-        print(message)
-        if exists(file_name):
-            with open(file_name, encoding="utf-8") as f:
-                for line in f:
-                    self.songs.append(eval(line.strip()))
-        else:
-            nicer_name = nicify_path(file_name)
-            if "/" in nicer_name:
-                file_folder = nicer_name[:nicer_name.rfind("/")]
-                if not exists(file_folder):
-                    makedirs(file_folder)
-            with open(nicer_name, "w", encoding="utf-8"):
-                pass
+        logger.debug("%s the songbook file %s", "Reading" if exists(file_name) else "Creating", file_name)
+        if lazy and self.appendable:
+            self.songs = storage.LazySongs(file_name, key=song_key)
+            self.keys = [song_key(artist, title) for artist, title in self.songs.titles]
+            self.unindexed = self.songs.unindexed
+        elif exists(file_name):
+            self.songs, self.unindexed = storage.read_songbook(file_name)
+            self.sort_songs()
+        if not self.is_lazy():
+            self.song_index()
 
     def __eq__(self, other):
         same_file = self.place_on_disk == other.place_on_disk
@@ -51,89 +90,523 @@ class SongBook:
         same_songs = all([s1 == s2 for s1, s2 in zip(self.songs, other.songs)])
         return same_file and same_number_of_songs and same_songs
 
+    def is_lazy(self):
+        return isinstance(self.songs, storage.LazySongs)
+
+    def materialize(self):
+        """
+        Decodes all the songs of a lazily loaded songbook, so that they can be modified.
+        :return:
+        """
+        if self.is_lazy():
+            lazy_songs = self.songs
+            self.songs = list(lazy_songs)
+            lazy_songs.close()
+
+    def song_index(self):
+        """
+        :return: SongIndex of the songs (built if needed)
+        """
+        if self.index is None:
+            # for lazy books, indexing decodes the songs, and the decoded ones are kept in self.songs
+            self.index = SongIndex(self.songs[i] for i in range(len(self.songs)))
+        return self.index
+
+    def songs_with_chord(self, chrd):
+        """
+        :return: the songs that contain the chord
+        """
+        return self.song_index().with_chord(chrd)
+
+    def songs_with_chords(self, chords):
+        """
+        :return: the songs that contain all the chords
+        """
+        return self.song_index().with_all_chords(chords)
+
+    def songs_with_max_difficulty(self, max_difficulty):
+        """
+        :return: the songs with no chord harder than max_difficulty (chord.SIMPLE: the songs without barre chords)
+        """
+        return self.song_index().with_max_difficulty(max_difficulty)
+
+    def songs_by_artist(self, artist):
+        """
+        :return: the songs of the artist (the case of the letters is ignored)
+        """
+        return self.song_index().by(artist)
+
+    def lyrics_search_index(self):
+        """
+        :return: search.SearchIndex of the lyrics, loaded from the file next to the songbook file if it describes
+        the saved songbook (the unsaved inserted and removed songs are then applied to it), and built otherwise
+        """
+        if self.lyrics_index is None:
+            if not self.rewrite:
+                self.lyrics_index = search.load_index(search.index_file(self.place_on_disk),
+                                                      search.file_state(self.place_on_disk))
+            if self.lyrics_index is not None:
+                self.lyrics_index.apply_records(self.pending)
+            else:
+                self.lyrics_index = search.build_index(self.songs[i] for i in range(len(self.songs)))
+        return self.lyrics_index
+
+    def search_lyrics(self, query, limit=10):
+        """
+        Finds the verses whose lyrics contain all the words of the query (the accents and the case are ignored).
+        In the lazy mode, only the songs with hits are decoded.
+        :param query: text
+        :param limit: the maximal number of the hits
+        :return: list of the hits (song, stanza index, verse index), the best first
+        """
+        hits = []
+        for artist, title, song_hash, stanza_index, verse_index, _ in self.lyrics_search_index().search(query, limit):
+            for i in self._candidates(artist, title):
+                if self.is_lazy() and self.songs.titles[i] != (artist, title):
+                    continue
+                if storage.content_hash(self.songs[i]) == song_hash:
+                    hits.append((self.songs[i], stanza_index, verse_index))
+                    break
+        return hits
+
+    def _candidates(self, artist, title):
+        """
+        :return: the range of the positions of the songs with the same key as the given artist and title
+        """
+        key = song_key(artist, title)
+        return range(bisect_left(self.keys, key), bisect_right(self.keys, key))
+
+    def _position(self, sng):
+        """
+        :return: the position of the song (preferably the same object, otherwise an equal song)
+        """
+        candidates = self._candidates(sng.artist, sng.title)
+        for i in candidates:
+            if self.songs[i] is sng:
+                return i
+        for i in candidates:
+            if self.songs[i] == sng:
+                return i
+        raise ValueError("The song {} by {} is not in the songbook".format(sng.title, sng.artist))
+
+    def get_song(self, artist, title):
+        """
+        Finds the song with the given artist and title. In the lazy mode, only this song is decoded.
+        :return: Song object or None if there is no such song
+        """
+        for i in self._candidates(artist, title):
+            if self.is_lazy():
+                if self.songs.titles[i] == (artist, title):
+                    return self.songs[i]
+            elif self.songs[i].artist == artist and self.songs[i].title == title:
+                return self.songs[i]
+        return None
+
     def sort_songs(self):
-        self.songs.sort(key=lambda song: (song.artist.upper(), song.title.upper()))
+        """
+        Sorts the songs by song.song_key (stable). Needed only if the artists or the titles were changed in place.
+        """
+        self.materialize()
+        pairs = sorted(((song_key(sng.artist, sng.title), sng) for sng in self.songs), key=itemgetter(0))
+        self.keys = [key for key, _ in pairs]
+        self.songs = [sng for _, sng in pairs]
+
+    def insert_song(self, sng):
+        """
+        Puts the song to its place (after the songs with the same key). Saved by write_to_file as one appended record.
+        """
+        key = song_key(sng.artist, sng.title)
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.songs.insert(i, sng)
+        if self.index is not None:
+            self.index.add(sng)
+        line = storage.dumps_song(sng)
+        if self.lyrics_index is not None:
+            self.lyrics_index.add_song(sng, storage.line_hash(line))
+        self.pending.append(line)
+
+    def remove_song(self, sng):
+        """
+        Removes the song (see _position). Saved by write_to_file as an appended tombstone.
+        """
+        i = self._position(sng)
+        removed = self.songs[i]
+        del self.keys[i]
+        del self.songs[i]
+        if self.index is not None:
+            self.index.remove(removed)
+        if self.lyrics_index is not None:
+            self.lyrics_index.remove_song(removed)
+        self.pending.append(storage.tombstone_line(removed))
+
+    def update_song(self, old, new):
+        """
+        Replaces the song old with the song new (which may have a different artist or title).
+        """
+        self.remove_song(old)
+        self.insert_song(new)
 
     def add_songs(self, new_songs):
-        self.songs += new_songs
+        self.materialize()
+        for sng in new_songs:
+            self.insert_song(sng)
 
     def clear_songs(self):
-        self.songs = []
+        self.set_songs([])
 
     def set_songs(self, songs):
-        self.songs = songs
+        if self.is_lazy():
+            self.songs.close()
+        self.songs = list(songs)
+        self.sort_songs()
+        self.index = SongIndex(self.songs)
+        self.lyrics_index = None
+        self.pending = []
+        self.rewrite = True
 
     def write_to_file(self):
-        self.sort_songs()
-        with open(self.place_on_disk, "w", encoding="utf-8") as f:
-            for song in self.songs:
-                print(repr(song), file=f)
+        """
+        Saves the changes: the records of the inserted and removed songs are appended to the file, unless the file
+        was replaced as a whole (set_songs etc.), is not in the current format, or there would be too many records
+        that are not in the index of the file. In these cases, the songbook is written (compacted) from scratch.
+        The index of the lyrics is saved too, if it was used.
+        """
+        if self.pending or self.rewrite or not self.appendable:
+            self._write_songs()
+        if self.lyrics_index is not None:
+            if self.lyrics_index.needs_rebuild():
+                self.lyrics_index = search.build_index(self.songs[i] for i in range(len(self.songs)))
+            source = search.file_state(self.place_on_disk)
+            if self.lyrics_index.changed or self.lyrics_index.source != source:
+                self.lyrics_index.save(search.index_file(self.place_on_disk), source)
+
+    def _write_songs(self):
+        appended = self.unindexed + len(self.pending)
+        compact = appended >= max(COMPACTION_MIN_RECORDS, len(self.songs) // COMPACTION_RATIO)
+        if self.rewrite or not self.appendable or compact:
+            nicer_name = nicify_path(self.place_on_disk)
+            if "/" in nicer_name:
+                file_folder = nicer_name[:nicer_name.rfind("/")]
+                if not exists(file_folder):
+                    makedirs(file_folder)
+            if self.is_lazy():
+                # the songs that were not decoded are copied as they are
+                storage.write_songbook_lines(self.place_on_disk, self.songs.lines())
+                self.songs.reopen()
+            else:
+                storage.write_songbook(self.place_on_disk, self.songs)
+            self.unindexed = 0
+        else:
+            storage.append_records(self.place_on_disk, self.pending)
+            self.unindexed += len(self.pending)
+        self.pending = []
+        self.rewrite = False
+        self.appendable = True
 
     def latex_string(self):
-        with open(TEX_TEMPLATE) as content_file:
-            content = content_file.read()
-        # add songs
-        songs = [sng.latex_string() for sng in self.songs]
-        content = sub(TEX_TEMPLATE_SONGS_PLACEHOLDER, sub("\\\\", "\\\\\\\\", "\n\n".join(songs)), content)
-        # add chords
-        gripss = []
-        used_chords = sorted(self.chords())
-        should_filter = False
-        for chrd in used_chords:
-            gripss.append(collect_chords.get_finger_positions(chrd))
-            if len(gripss[-1]) != len(set(gripss[-1])):
-                print("You should filter the grip library. Duplicates of grips ...")
-                should_filter = True
-        if should_filter:
-            collect_chords.filter_grip_library()
-        collect_chords.save_grip_library()
-        grips_tex = [grip.Grips(grips).latex_string() for grips in gripss]
-        content = sub(TEX_TEMPLATE_CHORDS_PLACEHOLDER, sub("\\\\", "\\\\\\\\", "\n\n".join(grips_tex)), content)
-        return content
-
-    def write_to_tex_file(self, tex_file):
+        content = StringIO()
+        self.write_latex(content)
+        return content.getvalue()
+
+    def write_latex(self, f, cache=None, fetch=True):
+        """
+        Writes the tex document to the file, song by song, so that only one rendered song at a time
+        is kept in memory.
+        :param f: opened (text) file
+        :param cache: see write_latex
+        :param fetch: see write_latex_document
+        :return:
+        """
+        write_latex(f, self.songs, cache, fetch)
+
+    def write_to_tex_file(self, tex_file, cache=None, instrument=None, fetch=True):
+        """
+        :param tex_file: the name of the output file (.tex is appended if needed)
+        :param cache: see write_latex
+        :param instrument: see instrumentation.mode
+        :param fetch: see write_latex_document
+        :return:
+        """
         if not tex_file.endswith(".tex"):
-            print("Appending .tex to the file name", tex_file)
+            logger.info("Appending .tex to the file name %s", tex_file)
             tex_file += ".tex"
-        with open(tex_file, "w", encoding="utf-8") as f:
-            print(self.latex_string(), file=f)
+        report_file = tex_file + instrumentation.REPORT_FILE_ENDING
+        with instrumentation.instrumented("write_to_tex_file", instrument, report_file):
+            with open(tex_file, "w", encoding="utf-8") as f:
+                self.write_latex(f, cache, fetch)
+                f.write("\n")
+
+    def simplify_songs(self):
+        """
+        Replaces every song with its most user-friendly version (see Song.most_user_friendly_version).
+        :return: the list of the numbers of half-tones for which the songs were transposed
+        """
+        self.materialize()
+        shifts = best_transpositions(self.songs)
+        self.songs = [sng.transpose(shift) if shift else sng for sng, shift in zip(self.songs, shifts)]
+        self.index = SongIndex(self.songs)
+        self.lyrics_index = None
+        self.pending = []
+        self.rewrite = True
+        return shifts
 
     def chords(self):
         """
         Returns the set of chords that are in the book.
         :return:
         """
-        return {chrd[0] for sng in self.songs for stz in sng.stanzas for vrs in stz.verses for chrd in vrs.chords}
+        return self.song_index().chords()
 
 
-def create_songbook_from_text_files(text_files, songbook_file):
+def split_template(template_file=TEX_TEMPLATE):
+    """
+    Splits the tex template at the placeholders for the songs and for the chords.
+    :return: triple (the part before the songs, the part between the songs and the chords, the rest)
+    """
+    with open(template_file) as content_file:
+        content = content_file.read()
+    before_songs, _, rest = content.partition(TEX_TEMPLATE_SONGS_PLACEHOLDER)
+    between, _, after_chords = rest.partition(TEX_TEMPLATE_CHORDS_PLACEHOLDER)
+    return before_songs, between, after_chords
+
+
+def write_latex(f, songs, cache=None, fetch=True):
+    """
+    Renders the songs into the tex document, one at a time (see SongBook.write_latex).
+    :param f: opened (text) file
+    :param songs: iterable of Song objects, in the order of the songbook
+    :param cache: render_cache.RenderCache for the rendered songs, render_cache.DEFAULT_CACHE if None
+    :param fetch: see write_latex_document
+    :return:
+    """
+    cache = render_cache.DEFAULT_CACHE if cache is None else cache
+    used_chords = set()
+    hits, misses = cache.hits, cache.misses
+
+    def song_fragments():
+        for sng in songs:
+            with instrumentation.stage("render", 1):
+                used_chords.update(chrd for stz in sng.stanzas for vrs in stz.verses for chrd, _ in vrs.chords)
+                fragment = cache.render(sng)
+            yield fragment
+
+    write_latex_document(f, song_fragments(), used_chords, fetch)
+    instrumentation.count_cache("render cache", cache.hits - hits, cache.misses - misses)
+
+
+def write_latex_document(f, song_fragments, chords, fetch=True):
+    """
+    Writes the tex template, with the songs and the grips of the chords put in it, to the file.
+    :param f: opened (text) file
+    :param song_fragments: iterable of Song.latex_string() values, written as they come
+    :param chords: the chords whose grips are shown at the end of the songbook. They are used only after
+    all the songs are written, so the collection may be filled while song_fragments are generated.
+    :param fetch: if False, the grip library is only read: the missing grips are not downloaded and the library
+    is not saved (e.g., in the worker processes of build.py, after the grips were fetched by the parent process)
+    :return:
+    """
+    with instrumentation.stage("write"):
+        before_songs, between, after_chords = split_template()
+        f.write(before_songs)
+    for i, fragment in enumerate(song_fragments):
+        with instrumentation.stage("write"):
+            if i:
+                f.write("\n\n")
+            f.write(fragment)
+    with instrumentation.stage("write"):
+        f.write(between)
+    used_chords = sorted(chords)
+    with instrumentation.stage("grips", len(used_chords)):
+        if instrumentation.is_on():
+            known = sum(repr(chrd) in collect_chords.get_grip_library() for chrd in used_chords)
+            instrumentation.count_cache("grip library", known, len(used_chords) - known)
+        if fetch:
+            collect_chords.prefetch_finger_positions(used_chords)
+        should_filter = False
+        first = True
+        for chrd in used_chords:
+            grips = collect_chords.lookup_finger_positions(chrd)
+            if not grips:
+                logger.warning("No grips for the chord %s", chrd)
+                continue
+            if len(grips) != len(set(grips)):
+                logger.info("Duplicates of the grips of the chord %s, the grip library will be filtered", chrd)
+                should_filter = True
+            if not first:
+                f.write("\n\n")
+            f.write(grip.Grips(grips).latex_string())
+            first = False
+        if fetch:
+            if should_filter:
+                collect_chords.filter_grip_library()
+            collect_chords.save_grip_library()
+    with instrumentation.stage("write"):
+        f.write(after_chords)
+
+
+def parse_song_files(text_files, workers=None):
+    """
+    Parses the song files, possibly in parallel.
+    :param text_files: list of song.parse_song compatible files
+    :param workers: the number of worker processes; if None or 1, the files are parsed in this process
+    :return: list of Song objects, in the same order as text_files
+    """
+    if workers is None or workers <= 1 or len(text_files) <= 1:
+        return [parse_song(text_file) for text_file in text_files]
+    chunk_size = max(1, len(text_files) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_song, text_files, chunksize=chunk_size))
+
+
+def resolve_policy(policy, songbook_file):
+    """
+    :param policy: one of OVERWRITE_POLICIES
+    :param songbook_file: the existing songbook file
+    :return: FAIL, OVERWRITE, MERGE or SKIP (ASK is resolved by asking the user)
+    """
+    if policy not in OVERWRITE_POLICIES:
+        raise ValueError("Unknown overwrite policy {}, use one of {}".format(policy, ", ".join(OVERWRITE_POLICIES)))
+    if policy != ASK:
+        return policy
+    if not sys.stdin or not sys.stdin.isatty():
+        return FAIL
+    question = "The songbook file {} already exists. Do you want to overwrite it? (yes/no) ".format(songbook_file)
+    return OVERWRITE if input(question) == "yes" else SKIP
+
+
+def merge_songs(book, songs):
+    """
+    Adds the songs to the book: a song replaces the song with the same artist and title, if there is one.
+    :return: the number of the songs that were added or replaced
+    """
+    changed = 0
+    for sng in songs:
+        old = book.get_song(sng.artist, sng.title)
+        if old is None:
+            book.insert_song(sng)
+        elif old != sng:
+            book.update_song(old, sng)
+        else:
+            continue
+        changed += 1
+    return changed
+
+
+def create_songbook_from_text_files(text_files, songbook_file, workers=None, instrument=None, overwrite=ASK):
     """
     Reads the contents of the text files which are appropriate song.parse_song input arguments.
     Creates a new SongBook object and saves the songs to the file songbook_file.
     :param text_files: the name of the input file with the songs
     :param songbook_file: the name of the output file
-    :return:
+    :param workers: the number of processes that parse the files (see parse_song_files)
+    :param instrument: see instrumentation.mode
+    :param overwrite: what to do if the songbook file exists, one of OVERWRITE_POLICIES
+    :return: the SongBook object
     """
-    should_proceed = True
-    if exists(songbook_file):
-        print("The songbook file {} already exists.".format(songbook_file))
-        should_proceed = input("Do you want to overwrite it? (yes/no) ") == "yes"
-    if should_proceed:
-        songs = []
-        for text_file in text_files:
-            songs.append(parse_song(text_file))
-
-        book = SongBook(songbook_file)
-        book.clear_songs()
-        book.set_songs(songs)
-        book.write_to_file()
-        return book
-    else:
-        print("Exiting ...")
-        return None
+    policy = resolve_policy(overwrite, songbook_file) if exists(songbook_file) else OVERWRITE
+    if policy == FAIL:
+        raise FileExistsError("The songbook file {} already exists".format(songbook_file))
+    elif policy == SKIP:
+        logger.info("Keeping the existing songbook file %s", songbook_file)
+        return SongBook(songbook_file)
+    report_file = songbook_file + instrumentation.REPORT_FILE_ENDING
+    with instrumentation.instrumented("create_songbook_from_text_files", instrument, report_file):
+        with instrumentation.stage("parse", len(text_files)):
+            songs = parse_song_files(text_files, workers)
+        with instrumentation.stage("write", len(songs)):
+            book = SongBook(songbook_file)
+            if policy == MERGE:
+                changed = merge_songs(book, songs)
+                logger.info("Merged %d new or changed songs into %s", changed, songbook_file)
+            else:
+                book.set_songs(songs)
+            book.write_to_file()
+    return book
+
+
+def create_songbook_from_corpus(corpus, songbook_file):
+    """
+    Streams the songs from a corpus (see song.iter_songs) to a songbook file: the songs are written one by one,
+    in the order of the corpus, so only one song at a time is kept in memory.
+    :param corpus: path to the corpus file ("-" for the standard input, .gz files are decompressed)
+    or an opened file object
+    :param songbook_file: the name of the output file
+    :return: the number of the songs
+    """
+    if isinstance(corpus, str):
+        with open_corpus(corpus) as f:
+            return storage.write_songbook(songbook_file, iter_songs(f))
+    return storage.write_songbook(songbook_file, iter_songs(corpus))
+
+
+def _sorted_songs(songbook_file):
+    """
+    Generates the pairs (song, songbook_file), sorted by song.song_key. Books in the current format are read lazily.
+    """
+    if storage.is_lazy_loadable(songbook_file):
+        songs = storage.LazySongs(songbook_file, key=song_key)
+        try:
+            for sng in songs:
+                yield sng, songbook_file
+        finally:
+            songs.close()
+    elif exists(songbook_file):
+        for sng in sorted(storage.read_songs(songbook_file), key=lambda x: song_key(x.artist, x.title)):
+            yield sng, songbook_file
+
+
+def merge_songbooks(songbook_files, merged_file):
+    """
+    Merges the songbooks into one. The books are read song by song (merged in the order of song.song_key) and
+    the merged book is written as the songs come, so only the songs with the same key are kept in memory.
+    Exact duplicates (the same storage.content_hash) are dropped. Different songs with the same artist and title
+    are all kept, but reported as conflicts.
+    :param songbook_files: paths to the songbook files
+    :param merged_file: path to the output songbook file (may not be one of the merged files)
+    :return: triple (the number of the songs in the merged book, the number of the dropped duplicates,
+    list of conflicts (artist, title, [the songbook files with a version of the song, ...]))
+    """
+    if os.path.abspath(merged_file) in {os.path.abspath(songbook_file) for songbook_file in songbook_files}:
+        raise ValueError("The merged songbook {} cannot be one of the merged ones".format(merged_file))
+    duplicates = 0
+    conflicts = []
+
+    def report_conflict(versions):
+        sources = [source for _, _, source in versions.values()]
+        if len(versions) > 1:
+            artist, title, _ = next(iter(versions.values()))
+            logger.warning("%d different songs %s by %s in %s", len(versions), title, artist, ", ".join(sources))
+            conflicts.append((artist, title, sources))
+
+    def records():
+        nonlocal duplicates
+        streams = [_sorted_songs(source) for source in songbook_files]
+        current_key = None
+        versions = {}  # content hash: (artist, title, songbook file) of the songs with the current key
+        for sng, source in heapq.merge(*streams, key=lambda pair: song_key(pair[0].artist, pair[0].title)):
+            key = song_key(sng.artist, sng.title)
+            if key != current_key:
+                report_conflict(versions)
+                current_key = key
+                versions = {}
+            line = storage.dumps_song(sng)
+            song_hash = storage.line_hash(line)
+            if song_hash in versions:
+                duplicates += 1
+                continue
+            versions[song_hash] = (sng.artist, sng.title, source)
+            yield sng.artist, sng.title, line
+        report_conflict(versions)
+
+    written = storage.write_songbook_lines(merged_file, records())
+    logger.info("Merged %d songbooks into %s: %d songs, %d duplicates dropped, %d conflicts",
+                len(songbook_files), merged_file, written, duplicates, len(conflicts))
+    return written, duplicates, conflicts
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     sgbk = create_songbook_from_text_files(["songs/ljudska.kuza_pazi.txt", "songs/siddharta.platina.txt"], "tempo.sgbk")
     tex_f = "songs/songbooks/test1/tempo.tex"
     sgbk.write_to_tex_file(tex_f)
@@ -1,8 +1,17 @@
 import unittest
+import io
+import os
 import random
+import re
+import grip
+import collect_chords
 import misc
 import songbook
 import song
+import storage
+import search
+import chord
+from contextlib import redirect_stdout
 from unittest import mock
 
 
@@ -40,8 +49,8 @@ class SongbookTest(unittest.TestCase):
         misc.remove_temp_folder(cls.songs_folder)
 
     def test_create_from_text_files_and_sort(self):
-        with mock.patch('builtins.input', return_value='yes'):
-            book = songbook.create_songbook_from_text_files(self.song_files, self.songbook_folder + "/book.sgbk")
+        book = songbook.create_songbook_from_text_files(self.song_files, self.songbook_folder + "/book.sgbk",
+                                                        overwrite=songbook.OVERWRITE)
         true_order = sorted(zip([4, 0, 3, 1, 2], self.song_files))
         songs = [song.parse_song(song_file) for _, song_file in true_order]
         book.sort_songs()
@@ -49,11 +58,238 @@ class SongbookTest(unittest.TestCase):
 
     def test_write_to_file_and_create_existing_songbook(self):
         book_file = self.songbook_folder + "/book.sgbk"
-        with mock.patch('builtins.input', return_value='yes'):
-            book = songbook.create_songbook_from_text_files(self.song_files, book_file)
+        book = songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite=songbook.OVERWRITE)
         book.write_to_file()
         book2 = songbook.SongBook(book_file)
 
         self.assertEqual(book, book2)
 
+    def test_lazy_songbook(self):
+        book_file = self.songbook_folder + "/lazy_book.sgbk"
+        book = songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite=songbook.OVERWRITE)
+        lazy_book = songbook.SongBook(book_file, lazy=True)
+        self.assertTrue(lazy_book.is_lazy())
+        self.assertEqual(book.get_song("b", "z"), lazy_book.get_song("b", "z"))
+        self.assertEqual(book, lazy_book)
+        lazy_book.add_songs([])
+        self.assertFalse(lazy_book.is_lazy())
+        self.assertEqual(book, lazy_book)
+
+    def test_parallel_parsing(self):
+        serial = songbook.parse_song_files(self.song_files)
+        parallel = songbook.parse_song_files(self.song_files, workers=2)
+        self.assertListEqual(serial, parallel)
+
+    def test_simplify_songs(self):
+        book = songbook.SongBook(self.songbook_folder + "/simple.sgbk")
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        songs.sort(key=lambda sng: song.song_key(sng.artist, sng.title))
+        book.set_songs([sng.transpose(1) for sng in songs])
+        shifts = book.simplify_songs()
+        self.assertListEqual([sng.transpose(1).best_transposition() for sng in songs], shifts)
+        self.assertListEqual([sng.transpose(1).most_user_friendly_version() for sng in songs], book.songs)
+
+    def test_create_from_corpus(self):
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        corpus = io.StringIO()
+        song.write_corpus(corpus, songs)
+        corpus.seek(0)
+        book_file = self.songbook_folder + "/corpus_book.sgbk"
+        self.assertEqual(len(songs), songbook.create_songbook_from_corpus(corpus, book_file))
+        self.assertListEqual(songs, storage.read_songs(book_file))
+        songs.sort(key=lambda sng: song.song_key(sng.artist, sng.title))
+        self.assertListEqual(songs, songbook.SongBook(book_file).songs)
+
+    def test_write_to_tex_file(self):
+        book = songbook.SongBook(self.songbook_folder + "/tex_book.sgbk")
+        book.set_songs([song.parse_song(song_file) for song_file in self.song_files[1:]])
+        with open(songbook.TEX_TEMPLATE) as f:
+            expected = f.read()
+        songs = "\n\n".join(sng.latex_string() for sng in book.songs)
+        grips = "\n\n".join(grip.Grips(collect_chords.get_finger_positions(chrd)).latex_string()
+                              for chrd in sorted(book.chords()))
+        expected = re.sub(songbook.TEX_TEMPLATE_SONGS_PLACEHOLDER, lambda _: songs, expected)
+        expected = re.sub(songbook.TEX_TEMPLATE_CHORDS_PLACEHOLDER, lambda _: grips, expected)
+        self.assertEqual(expected, book.latex_string())
+        tex_file = self.songbook_folder + "/tex_book.tex"
+        book.write_to_tex_file(tex_file)
+        with open(tex_file, encoding="utf-8") as f:
+            self.assertEqual(expected + "\n", f.read())
+
+    def test_chord_queries(self):
+        book_file = self.songbook_folder + "/query_book.sgbk"
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        book = songbook.SongBook(book_file)
+        book.set_songs(songs[:3])
+        book.add_songs(songs[3:])
+        all_chords = {chrd for sng in songs for stz in sng.stanzas for vrs in stz.verses for chrd, _ in vrs.chords}
+        self.assertSetEqual(all_chords, book.chords())
+        with_e = [sng for sng in songs if chord.Chord("E", []) in {c for stz in sng.stanzas
+                                                                 for vrs in stz.verses for c, _ in vrs.chords}]
+        self.assertListEqual(with_e, book.songs_with_chord(chord.Chord("E", [])))
+        self.assertListEqual([songs[3]], book.songs_with_chords([chord.Chord("A", []), chord.Chord("A", ["m"])]))
+        self.assertListEqual(sorted([sng for sng in songs if sng.difficulty() <= chord.SIMPLE], key=repr),
+                             sorted(book.songs_with_max_difficulty(chord.SIMPLE), key=repr))
+        self.assertListEqual([songs[2], songs[3], songs[4]], book.songs_by_artist("B"))
+        book.write_to_file()
+        lazy_book = songbook.SongBook(book_file, lazy=True)
+        self.assertIsNone(lazy_book.index)
+        self.assertListEqual(sorted(book.songs_by_artist("b"), key=repr),
+                             sorted(lazy_book.songs_by_artist("b"), key=repr))
+        self.assertSetEqual(all_chords, lazy_book.chords())
+        lazy_book.simplify_songs()
+        self.assertSetEqual({c for sng in lazy_book.songs for stz in sng.stanzas for vrs in stz.verses
+                             for c, _ in vrs.chords}, lazy_book.chords())
+
+    def test_insert_remove_update(self):
+        book_file = self.songbook_folder + "/edited_book.sgbk"
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        book = songbook.SongBook(book_file)
+        book.set_songs(songs[:3])
+        book.write_to_file()
+        size = os.path.getsize(book_file)
+        book.insert_song(songs[3])
+        book.insert_song(songs[4])
+        book.remove_song(songs[0])
+        changed = songs[1].transpose(2)
+        book.update_song(songs[1], changed)
+        self.assertListEqual(book.keys, sorted(book.keys))
+        self.assertListEqual([songs[2], songs[3], songs[4]], book.songs_by_artist("b"))
+        book.write_to_file()
+        # only the changes were appended
+        with open(book_file, encoding="utf-8") as f:
+            self.assertEqual(1 + 3 + 5, len(f.readlines()))
+        self.assertLess(size, os.path.getsize(book_file))
+        expected = sorted([changed, songs[2], songs[3], songs[4]], key=lambda sng: song.song_key(sng.artist, sng.title))
+        self.assertListEqual(expected, book.songs)
+        for lazy in [False, True]:
+            loaded = songbook.SongBook(book_file, lazy=lazy)
+            self.assertListEqual(expected, list(loaded.songs))
+            self.assertEqual(5, loaded.unindexed)
+            self.assertEqual(changed, loaded.get_song(changed.artist, changed.title))
+            self.assertIsNone(loaded.get_song(songs[0].artist, songs[0].title))
+        with self.assertRaises(ValueError):
+            book.remove_song(songs[0])
+
+    def test_lazy_insert_and_compaction(self):
+        book_file = self.songbook_folder + "/compacted_book.sgbk"
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        book = songbook.SongBook(book_file)
+        book.set_songs(songs)
+        book.write_to_file()
+        lazy_book = songbook.SongBook(book_file, lazy=True)
+        copies = []
+        for i in range(songbook.COMPACTION_MIN_RECORDS - 1):
+            copy = songs[i % len(songs)].transpose(i)
+            copy.title += str(i)
+            lazy_book.insert_song(copy)
+            copies.append(copy)
+        self.assertTrue(lazy_book.is_lazy())
+        # only the inserted songs are in memory
+        self.assertEqual(len(copies), len(lazy_book.songs.decoded))
+        lazy_book.write_to_file()
+        self.assertTrue(lazy_book.is_lazy())
+        self.assertEqual(songbook.COMPACTION_MIN_RECORDS - 1, lazy_book.unindexed)
+        lazy_book.remove_song(copies[0])
+        lazy_book.write_to_file()
+        # the compaction does not decode the songs
+        self.assertTrue(lazy_book.is_lazy())
+        self.assertEqual(len(copies) - 1, len(lazy_book.songs.decoded))
+        self.assertEqual(0, lazy_book.unindexed)
+        with open(book_file, encoding="utf-8") as f:
+            self.assertEqual(1 + len(songs) + len(copies) - 1, len(f.readlines()))
+        self.assertListEqual(list(lazy_book.songs), songbook.SongBook(book_file).songs)
+
+    def test_search_lyrics(self):
+        book_file = self.songbook_folder + "/searched_book.sgbk"
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        book = songbook.SongBook(book_file)
+        book.set_songs(songs[:3])
+        self.assertListEqual([(songs[0], 1, 0)], book.search_lyrics("ROM pom"))
+        book.write_to_file()
+        index_file = search.index_file(book_file)
+        self.assertTrue(os.path.exists(index_file))
+        # the saved index is used, and the inserted songs are added to it
+        lazy_book = songbook.SongBook(book_file, lazy=True)
+        with mock.patch("search.build_index") as build:
+            lazy_book.insert_song(songs[4])
+            self.assertListEqual([(songs[4], 2, 0)], lazy_book.search_lyrics("the end"))
+            lazy_book.remove_song(songs[0])
+            self.assertListEqual([], lazy_book.search_lyrics("rom"))
+            lazy_book.write_to_file()
+        build.assert_not_called()
+        self.assertListEqual([(songs[1], 0, 0), (songs[1], 0, 1)], lazy_book.search_lyrics("bird"))
+        # the index of a songbook file that was written by someone else is rebuilt
+        other = songbook.SongBook(book_file)
+        other.insert_song(songs[3])
+        other.write_to_file()
+        self.assertListEqual([(songs[3], 0, 0)], songbook.SongBook(book_file).search_lyrics("one stanza"))
+
+    def test_unchanged_book_is_not_written(self):
+        book_file = self.songbook_folder + "/unchanged_book.sgbk"
+        book = songbook.SongBook(book_file)
+        book.set_songs([song.parse_song(song_file) for song_file in self.song_files])
+        book.write_to_file()
+        with mock.patch("storage.write_songbook") as write, mock.patch("storage.append_records") as append:
+            songbook.SongBook(book_file).write_to_file()
+        write.assert_not_called()
+        append.assert_not_called()
+
+    def test_constructor_has_no_side_effects(self):
+        book_file = self.songbook_folder + "/new_folder/new_book.sgbk"
+        output = io.StringIO()
+        with redirect_stdout(output):
+            book = songbook.SongBook(book_file)
+        self.assertEqual("", output.getvalue())
+        self.assertFalse(os.path.exists(os.path.dirname(book_file)))
+        book.write_to_file()
+        self.assertListEqual([], songbook.SongBook(book_file).songs)
+
+    def test_overwrite_policies(self):
+        book_file = self.songbook_folder + "/policy_book.sgbk"
+        songs = sorted([song.parse_song(song_file) for song_file in self.song_files],
+                       key=lambda sng: song.song_key(sng.artist, sng.title))
+        songbook.create_songbook_from_text_files(self.song_files[:2], book_file)
+        first_two = songbook.SongBook(book_file).songs
+        with self.assertRaises(FileExistsError):
+            songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite=songbook.FAIL)
+        with self.assertRaises(ValueError):
+            songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite="maybe")
+        # not a terminal: ask means fail
+        with mock.patch("sys.stdin", io.StringIO("yes\n")):
+            with self.assertRaises(FileExistsError):
+                songbook.create_songbook_from_text_files(self.song_files, book_file)
+        with mock.patch("builtins.input") as ask:
+            book = songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite=songbook.SKIP)
+        ask.assert_not_called()
+        self.assertListEqual(first_two, book.songs)
+        book = songbook.create_songbook_from_text_files(self.song_files, book_file, overwrite=songbook.MERGE)
+        self.assertListEqual(songs, book.songs)
+        self.assertListEqual(songs, songbook.SongBook(book_file).songs)
+        self.assertEqual(len(songs) - 2, songbook.SongBook(book_file).unindexed)
+        songbook.create_songbook_from_text_files(self.song_files[2:], book_file, overwrite=songbook.OVERWRITE)
+        self.assertEqual(len(self.song_files) - 2, len(songbook.SongBook(book_file).songs))
+        with mock.patch("sys.stdin") as stdin, mock.patch("builtins.input", return_value="yes"):
+            stdin.isatty.return_value = True
+            book = songbook.create_songbook_from_text_files(self.song_files, book_file)
+        self.assertListEqual(songs, book.songs)
 
+    def test_merge_songbooks(self):
+        songs = [song.parse_song(song_file) for song_file in self.song_files]
+        changed = songs[0].transpose(1)
+        first, second, legacy = [self.songbook_folder + "/merge{}.sgbk".format(i) for i in range(3)]
+        storage.write_songbook(first, [songs[1], songs[0]])
+        storage.write_songbook(second, [songs[2], songs[1], changed, songs[3]])
+        with open(legacy, "w", encoding="utf-8") as f:
+            for sng in [songs[4], songs[3]]:
+                print(repr(sng), file=f)
+        merged_file = self.songbook_folder + "/merged.sgbk"
+        written, duplicates, conflicts = songbook.merge_songbooks([first, second, legacy], merged_file)
+        self.assertEqual(6, written)
+        self.assertEqual(2, duplicates)
+        self.assertListEqual([(songs[0].artist, songs[0].title, [first, second])], conflicts)
+        expected = sorted(songs + [changed], key=lambda sng: song.song_key(sng.artist, sng.title))
+        self.assertListEqual(expected, storage.read_songs(merged_file))
+        self.assertListEqual(expected, songbook.SongBook(merged_file, lazy=True).songs[:])
+        with self.assertRaises(ValueError):
+            songbook.merge_songbooks([first, merged_file], merged_file)
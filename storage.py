@@ -0,0 +1,534 @@
+import ast
+import hashlib
+import json
+import mmap
+import os
+import uuid
+import warnings
+from collections.abc import MutableSequence
+from os.path import exists, getsize
+from chord import Chord
+from verse import Verse
+from stanza import Stanza
+from song import Song
+
+
+FORMAT_NAME = "sgbk"
+FORMAT_VERSION = 2
+HEADER = {"format": FORMAT_NAME, "version": FORMAT_VERSION}
+# every write of a songbook file gets a random build id, which is stored in the header and in the index, so that
+# the index of a different version of the file (e.g. after a checkout or a copy) is not used
+BUILD = "build"
+INDEX_FILE_ENDING = ".idx"
+# a removed song is not deleted from the file, but a tombstone {"removed": [artist, title, content hash]} is appended
+TOMBSTONE = "removed"
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_DECODER = json.JSONDecoder()
+
+
+def encode_song(song):
+    """
+    Transforms a song into a structure of JSON compatible values:
+    {"artist": artist, "title": title, "stanzas": [stanza1, ...]}, where stanza1 = [verse1, ...],
+    and verse1 = [lyrics, [[tone, [decoration1, ...], position], ...]].
+    :param song: Song object
+    :return: the described dictionary
+    """
+    stanzas = []
+    for stnza in song.stanzas:
+        verses = []
+        for vrs in stnza.verses:
+            verses.append([vrs.lyrics, [[chrd.tone, list(chrd.decoration), position] for chrd, position in vrs.chords]])
+        stanzas.append(verses)
+    return {"artist": song.artist, "title": song.title, "stanzas": stanzas}
+
+
+def decode_song(description):
+    """
+    The inverse of encode_song.
+    :param description: a dictionary as returned by encode_song
+    :return: Song object
+    """
+    stanzas = []
+    for verses in description["stanzas"]:
+        stanza_verses = []
+        for lyrics, chords in verses:
+            stanza_verses.append(Verse(lyrics, [(Chord(tone, decoration), position)
+                                                for tone, decoration, position in chords]))
+        stanzas.append(Stanza(stanza_verses))
+    return Song(description["artist"], description["title"], stanzas)
+
+
+def dumps_song(song):
+    """
+    :param song: Song object
+    :return: one line (without the line ending) of the songbook file that describes the song
+    """
+    return _ENCODER.encode(encode_song(song))
+
+
+def loads_song(line):
+    return decode_song(_DECODER.decode(line))
+
+
+def content_hash(song):
+    """
+    Stable hash of the song: equal songs have equal hashes, in every process and every run.
+    :param song: Song object
+    :return: hexadecimal sha256 digest of dumps_song(song)
+    """
+    return line_hash(dumps_song(song))
+
+
+def line_hash(line):
+    """
+    :param line: dumps_song value
+    :return: the content_hash of the song
+    """
+    return hashlib.sha256(line.encode("utf-8")).hexdigest()
+
+
+def tombstone_line(song):
+    """
+    :param song: Song object
+    :return: the line of the songbook file which says that the song is removed
+    """
+    return _ENCODER.encode({TOMBSTONE: [song.artist, song.title, content_hash(song)]})
+
+
+def _decode_record(line, complete):
+    """
+    :param line: a line of the songbook file (after the header)
+    :param complete: False if the line is the last one and has no line ending
+    :return: the decoded record, or None if the line is empty or is a record that was not written completely
+    """
+    if not line.strip():
+        return None
+    try:
+        return _DECODER.decode(line)
+    except ValueError:
+        if complete:
+            raise
+        return None
+
+
+def _entry_positions(entries):
+    """
+    :param entries: list of the entries [artist, title, ...] of the songs
+    :return: {(artist, title): list of the positions of the entries}
+    """
+    positions = {}
+    for i, (artist, title, _) in enumerate(entries):
+        positions.setdefault((artist, title), []).append(i)
+    return positions
+
+
+def _remove_entry(entries, positions, removed, hash_entry):
+    """
+    Applies a tombstone: the last entry [artist, title, ...] that describes the removed song is replaced with None.
+    Only the entries with the same artist and title are hashed.
+    :param entries: list of the entries of the songs that precede the tombstone
+    :param positions: _entry_positions(entries), which is updated
+    :param removed: [artist, title, content hash] of the removed song
+    :param hash_entry: the function that returns the content_hash of the song of an entry
+    :return:
+    """
+    artist, title, song_hash = removed
+    candidates = positions.get((artist, title), [])
+    for j in range(len(candidates) - 1, -1, -1):
+        if hash_entry(entries[candidates[j]]) == song_hash:
+            entries[candidates[j]] = None
+            del candidates[j]
+            return
+
+
+def header_line(build=None):
+    """
+    :param build: the build id of the file (a new one if None)
+    """
+    return _ENCODER.encode(dict(HEADER, **{BUILD: uuid.uuid4().hex if build is None else build}))
+
+
+def build_id(line):
+    """
+    :param line: the first line of a songbook file in the current format
+    :return: the build id of the file, or None if the file has none
+    """
+    return _DECODER.decode(line).get(BUILD)
+
+
+def is_header(line):
+    return line.startswith("{\"format\"")
+
+
+def parse_header(line):
+    """
+    Checks the header of the songbook file.
+    :param line: the first line of the songbook file
+    :return: version of the file format
+    """
+    header = _DECODER.decode(line)
+    if header.get("format") != FORMAT_NAME:
+        raise Exception("Unknown songbook format: {}".format(header.get("format")))
+    version = header.get("version")
+    if version != FORMAT_VERSION:
+        raise Exception("Unsupported songbook format version: {}".format(version))
+    return version
+
+
+# Legacy files (repr(Song) on every line) are read without eval: the expression tree is walked and only
+# the constructors of the classes below, lists, tuples, dictionaries and constants are accepted.
+LEGACY_CONSTRUCTORS = {"Song": Song, "Stanza": Stanza, "Verse": Verse, "Chord": Chord}
+
+
+def _callable_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        prefix = _callable_name(node.value)
+        return None if prefix is None else "{}.{}".format(prefix, node.attr)
+    return None
+
+
+def _legacy_value(node, constructors):
+    if isinstance(node, ast.Constant):
+        return node.value
+    elif isinstance(node, ast.List):
+        return [_legacy_value(element, constructors) for element in node.elts]
+    elif isinstance(node, ast.Tuple):
+        return tuple(_legacy_value(element, constructors) for element in node.elts)
+    elif isinstance(node, ast.Dict) and None not in node.keys:
+        return {_legacy_value(key, constructors): _legacy_value(value, constructors)
+                for key, value in zip(node.keys, node.values)}
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    elif isinstance(node, ast.Call) and _callable_name(node.func) in constructors:
+        args = [_legacy_value(arg, constructors) for arg in node.args]
+        kwargs = {keyword.arg: _legacy_value(keyword.value, constructors) for keyword in node.keywords}
+        return constructors[_callable_name(node.func)](*args, **kwargs)
+    raise ValueError("Unexpected expression in the legacy file: {}".format(ast.dump(node)))
+
+
+def legacy_literal(text, constructors):
+    """
+    Safe replacement for eval(text) for the texts that consist of reprs of our objects.
+    :param text: a Python expression
+    :param constructors: {name: class, ...} of the classes that may be constructed, e.g., {"grip.Grip": Grip}
+    :return: the value of the expression
+    """
+    with warnings.catch_warnings():
+        # old files may contain lyrics with backslashes that are not valid escape sequences
+        warnings.simplefilter("ignore", DeprecationWarning)
+        tree = ast.parse(text.strip(), mode="eval")
+    return _legacy_value(tree.body, constructors)
+
+
+def loads_legacy_song(line):
+    """
+    Parses the line of the legacy songbook file, i.e., repr(song).
+    :param line: repr of a song
+    :return: Song object
+    """
+    return legacy_literal(line, LEGACY_CONSTRUCTORS)
+
+
+def read_songs(file_name):
+    """
+    Reads all the songs from the songbook file. Both the current and the legacy format are supported.
+    :param file_name: path to the songbook file
+    :return: list of Song objects
+    """
+    return read_songbook(file_name)[0]
+
+
+def read_songbook(file_name):
+    """
+    Same as read_songs, but also tells how many records (songs and tombstones) of the file are not covered
+    by the index, i.e., were appended after the file was written as a whole.
+    :param file_name: path to the songbook file
+    :return: pair (list of Song objects, the number of records that are not covered by the index)
+    """
+    with open(file_name, "rb") as f:
+        first = f.readline().decode("utf-8")
+        if not first.strip():
+            return [], 0
+        if not is_header(first):
+            songs = [loads_legacy_song(first)]
+            songs += [loads_legacy_song(line) for line in f.read().decode("utf-8").splitlines() if line.strip()]
+            return songs, len(songs)
+        parse_header(first)
+        _, covered = _load_index(file_name, os.fstat(f.fileno()).st_size, build_id(first))
+        entries = []  # [artist, title, record], or None for the removed songs
+        positions = {}
+        unindexed = 0
+        offset = len(first.encode("utf-8"))
+        for line in f:
+            record = _decode_record(line.decode("utf-8"), line.endswith(b"\n"))
+            if record is not None:
+                unindexed += offset >= covered
+                if TOMBSTONE in record:
+                    _remove_entry(entries, positions, record[TOMBSTONE],
+                                  lambda entry: line_hash(_ENCODER.encode(entry[2])))
+                else:
+                    positions.setdefault((record["artist"], record["title"]), []).append(len(entries))
+                    entries.append([record["artist"], record["title"], record])
+            offset += len(line)
+    return [decode_song(entry[2]) for entry in entries if entry is not None], unindexed
+
+
+def write_songs(f, songs):
+    """
+    Writes the header and the songs to an opened (text) file.
+    :param f: file object
+    :param songs: iterable of Song objects
+    :return:
+    """
+    print(header_line(), file=f)
+    for song in songs:
+        print(dumps_song(song), file=f)
+
+
+def index_file(file_name):
+    return file_name + INDEX_FILE_ENDING
+
+
+def write_songbook(file_name, songs):
+    """
+    Writes the songs to the songbook file and the index {(artist, title): byte offset of the song} next to it.
+    :param file_name: path to the songbook file
+    :param songs: iterable of Song objects
+    :return: the number of the songs
+    """
+    return write_songbook_lines(file_name, ((song.artist, song.title, dumps_song(song)) for song in songs))
+
+
+def write_songbook_lines(file_name, records):
+    """
+    Same as write_songbook, but the songs are already encoded. The records are written to a temporary file,
+    which then replaces the songbook file, so the songbook survives a crash in the middle of the writing.
+    :param file_name: path to the songbook file
+    :param records: iterable of triples (artist, title, dumps_song(song))
+    :return: the number of the songs
+    """
+    entries = []
+    build = uuid.uuid4().hex
+    temporary = file_name + ".tmp"
+    with open(temporary, "wb") as f:
+        offset = f.write((header_line(build) + "\n").encode("utf-8"))
+        for artist, title, line in records:
+            entries.append([artist, title, offset])
+            offset += f.write((line + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, file_name)
+    write_index(file_name, entries, offset, build)
+    return len(entries)
+
+
+def append_records(file_name, lines):
+    """
+    Appends the records (dumps_song or tombstone_line values) to a songbook file in the current format.
+    The index is not updated: the records after the part of the file that it covers are scanned when the file is read.
+    :param file_name: path to the songbook file
+    :param lines: list of records
+    :return:
+    """
+    with open(file_name, "ab") as f:
+        f.write("".join(line + "\n" for line in lines).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_index(file_name, entries, size, build):
+    """
+    Saves the index of the songbook file (through a temporary file).
+    :param file_name: path to the songbook file (not to the index)
+    :param entries: list of [artist, title, offset]
+    :param size: number of bytes of the songbook file that are covered by the index
+    :param build: the build id of the songbook file
+    :return:
+    """
+    temporary = index_file(file_name) + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        print(_ENCODER.encode({"size": size, BUILD: build, "songs": entries}), file=f)
+    os.replace(temporary, index_file(file_name))
+
+
+def _line_at(buffer, offset):
+    end = buffer.find(b"\n", offset)
+    return buffer[offset:len(buffer) if end < 0 else end].decode("utf-8")
+
+
+def _scan_records(buffer, start, entries):
+    """
+    Finds the songs and the tombstones in the part of the songbook file that is not covered by the index.
+    :param buffer: bytes-like contents of the songbook file
+    :param start: offset of the first line to scan
+    :param entries: list of [artist, title, offset] of the preceding songs, which is updated
+    :return: the number of the scanned records
+    """
+    positions = None  # built at the first tombstone
+    records = 0
+    offset = start
+    end = len(buffer)
+    while offset < end:
+        line_end = buffer.find(b"\n", offset)
+        complete = line_end >= 0
+        if not complete:
+            line_end = end
+        line = buffer[offset:line_end].decode("utf-8")
+        record = None if is_header(line) else _decode_record(line, complete)
+        if record is not None:
+            records += 1
+            if TOMBSTONE in record:
+                if positions is None:
+                    positions = _entry_positions(entries)
+                _remove_entry(entries, positions, record[TOMBSTONE],
+                              lambda entry: line_hash(_line_at(buffer, entry[2])))
+            else:
+                if positions is not None:
+                    positions.setdefault((record["artist"], record["title"]), []).append(len(entries))
+                entries.append([record["artist"], record["title"], offset])
+        offset = line_end + 1
+    if positions is not None:
+        entries[:] = [entry for entry in entries if entry is not None]
+    return records
+
+
+def _load_index(file_name, size, build):
+    """
+    :param file_name: path to the songbook file
+    :param size: the size of the songbook file
+    :param build: the build id of the songbook file
+    :return: pair (list of [artist, title, offset], the number of bytes of the songbook file that the index covers),
+    or ([], 0) if there is no valid index (e.g. if it belongs to a different build of the file)
+    """
+    if build is not None and exists(index_file(file_name)):
+        with open(index_file(file_name), encoding="utf-8") as f:
+            index = _DECODER.decode(f.read())
+        if index.get(BUILD) == build and index["size"] <= size:
+            return index["songs"], index["size"]
+    return [], 0
+
+
+def read_index(file_name, buffer):
+    """
+    Loads the index of the songbook file. If the index is missing, it is built from scratch, and if the songbook
+    file is longer than the part that the index covers, only the rest of the file is scanned.
+    :param file_name: path to the songbook file
+    :param buffer: bytes-like contents of the songbook file
+    :return: pair (list of [artist, title, offset] of the songs, the number of records that the index does not cover)
+    """
+    entries, covered = _load_index(file_name, len(buffer), build_id(_line_at(buffer, 0)))
+    unindexed = _scan_records(buffer, covered, entries)
+    return entries, unindexed
+
+
+def is_lazy_loadable(file_name):
+    """
+    Only the files in the current format can be loaded lazily.
+    """
+    if not exists(file_name) or getsize(file_name) == 0:
+        return False
+    with open(file_name, encoding="utf-8") as f:
+        return is_header(f.readline())
+
+
+class LazySongs(MutableSequence):
+    """
+    Sequence of the songs in a songbook file. The file is memory-mapped and a song is decoded only when it is accessed
+    for the first time. Songs can be inserted and removed, but the file is not changed.
+    """
+    def __init__(self, file_name, key=None):
+        """
+        :param file_name: path to the songbook file
+        :param key: if given, the songs are sorted by key(artist, title)
+        """
+        self.file_name = file_name
+        entries = self._map()
+        if key is not None:
+            entries.sort(key=lambda entry: key(entry[0], entry[1]))
+        self.titles = [(artist, title) for artist, title, _ in entries]
+        self.items = [offset for _, _, offset in entries]  # the offset of the song in the file or the decoded song
+        self.positions = None  # {(artist, title): index}, built by find
+
+    def _map(self):
+        """
+        Memory-maps the file.
+        :return: the entries [artist, title, offset] of the songs, see read_index
+        """
+        with open(self.file_name, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        first_line = self.buffer[:self.buffer.find(b"\n")].decode("utf-8")
+        parse_header(first_line)
+        entries, self.unindexed = read_index(self.file_name, self.buffer)
+        return entries
+
+    def lines(self):
+        """
+        :return: generator of triples (artist, title, dumps_song(song)) for write_songbook_lines; the songs that
+        were not decoded are copied from the file without decoding
+        """
+        for (artist, title), item in zip(self.titles, self.items):
+            yield artist, title, _line_at(self.buffer, item) if isinstance(item, int) else dumps_song(item)
+
+    def reopen(self):
+        """
+        Maps the file again after it was written by write_songbook_lines(file name, self.lines()).
+        The decoded songs are kept, the others are read from the new file.
+        """
+        self.buffer.close()
+        entries = self._map()
+        self.items = [entry[2] if isinstance(item, int) else item for entry, item in zip(entries, self.items)]
+
+    @property
+    def decoded(self):
+        return {i: item for i, item in enumerate(self.items) if not isinstance(item, int)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if isinstance(self.items[i], int):
+            self.items[i] = self.decode(i)
+        return self.items[i]
+
+    def __setitem__(self, i, song):
+        self.items[i] = song
+        self.titles[i] = (song.artist, song.title)
+        self.positions = None
+
+    def __delitem__(self, i):
+        del self.items[i]
+        del self.titles[i]
+        self.positions = None
+
+    def insert(self, i, song):
+        self.items.insert(i, song)
+        self.titles.insert(i, (song.artist, song.title))
+        self.positions = None
+
+    def __iter__(self):
+        # the songs that are only iterated over are not cached, so iterating keeps one song at a time in memory
+        for i in range(len(self)):
+            item = self.items[i]
+            yield self.decode(i) if isinstance(item, int) else item
+
+    def decode(self, i):
+        item = self.items[i]
+        return loads_song(_line_at(self.buffer, item)) if isinstance(item, int) else item
+
+    def find(self, artist, title):
+        """
+        :return: the song with the given artist and title or None if there is no such song
+        """
+        if self.positions is None:
+            self.positions = {artist_title: i for i, artist_title in enumerate(self.titles)}
+        i = self.positions.get((artist, title))
+        return None if i is None else self[i]
+
+    def close(self):
+        self.buffer.close()
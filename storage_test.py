@@ -0,0 +1,172 @@
+import unittest
+import os
+from unittest import mock
+import misc
+import storage
+import song
+import verse
+import stanza
+# noinspection PyUnresolvedReferences
+from chord import Chord
+# noinspection PyUnresolvedReferences
+from verse import Verse
+# noinspection PyUnresolvedReferences
+from stanza import Stanza
+# noinspection PyUnresolvedReferences
+from song import Song
+
+
+class StorageTest(unittest.TestCase):
+    LEGACY_BOOK = "songbooks/theSongbook/the_songbook.sgbk"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = misc.create_temp_folder(".")
+        original = [["<C>Kuža pazi, <G>z repkom miga, <C>vstane, <G>leže, <C>tačko da.",
+                     "(2x) <d-7>J's ne <F#-sus4>morem <E-/H>več"],
+                    ["<C> <G-7> <C> <G-7>"]]
+        stanzas = [stanza.Stanza([verse.parse_verse(vrs) for vrs in sta]) for sta in original]
+        cls.song = song.Song(song.LJUDSKA, "Kuža pazi", stanzas)
+
+    @classmethod
+    def tearDownClass(cls):
+        misc.remove_temp_folder(cls.folder)
+
+    def test_dumps_loads(self):
+        line = storage.dumps_song(self.song)
+        self.assertNotIn("\n", line)
+        self.assertEqual(self.song, storage.loads_song(line))
+
+    def test_write_read(self):
+        book_file = self.folder + "/book.sgbk"
+        with open(book_file, "w", encoding="utf-8") as f:
+            storage.write_songs(f, [self.song, self.song.transpose(3)])
+        self.assertListEqual([self.song, self.song.transpose(3)], storage.read_songs(book_file))
+
+    def test_lazy_songs(self):
+        book_file = self.folder + "/lazy.sgbk"
+        songs = [self.song.transpose(i) for i in range(3)]
+        songs[1].title = "Drugi"
+        storage.write_songbook(book_file, songs)
+        lazy = storage.LazySongs(book_file)
+        self.assertEqual(3, len(lazy))
+        self.assertEqual(songs[1], lazy.find(song.LJUDSKA, "Drugi"))
+        self.assertListEqual([1], list(lazy.decoded))
+        self.assertIsNone(lazy.find(song.LJUDSKA, "Tretji"))
+        self.assertListEqual(songs, list(lazy))
+        self.assertListEqual([1], list(lazy.decoded))
+        self.assertListEqual(songs, storage.read_songs(book_file))
+        lazy.close()
+
+    def test_lazy_songs_stale_or_missing_index(self):
+        book_file = self.folder + "/stale.sgbk"
+        storage.write_songbook(book_file, [self.song])
+        appended = self.song.transpose(1)
+        appended.title = "Dodana"
+        with open(book_file, "a", encoding="utf-8") as f:
+            print(storage.dumps_song(appended), file=f)
+        lazy = storage.LazySongs(book_file)
+        self.assertListEqual([self.song, appended], list(lazy))
+        lazy.close()
+
+        os.remove(storage.index_file(book_file))
+        lazy = storage.LazySongs(book_file)
+        self.assertEqual(appended, lazy.find(song.LJUDSKA, "Dodana"))
+        lazy.close()
+
+    def test_index_of_another_build_is_ignored(self):
+        book_file = self.folder + "/replaced.sgbk"
+        storage.write_songbook(book_file, [self.song.transpose(i) for i in range(2)])
+        with open(storage.index_file(book_file), encoding="utf-8") as f:
+            stale_index = f.read()
+        # the songbook file is replaced (e.g. by a checkout), but its index is not
+        replaced = [self.song.transpose(i) for i in range(3, 6)]
+        storage.write_songbook(book_file, replaced)
+        with open(storage.index_file(book_file), "w", encoding="utf-8") as f:
+            f.write(stale_index)
+        lazy = storage.LazySongs(book_file)
+        self.assertListEqual(replaced, list(lazy))
+        lazy.close()
+        self.assertListEqual(replaced, storage.read_songs(book_file))
+        self.assertFalse(os.path.exists(storage.index_file(book_file) + ".tmp"))
+
+    def test_appended_records_and_tombstones(self):
+        book_file = self.folder + "/appended.sgbk"
+        first, second = self.song, self.song.transpose(1)
+        storage.write_songbook(book_file, [first, second, first])
+        storage.append_records(book_file, [storage.tombstone_line(first), storage.dumps_song(second.transpose(1)),
+                                           storage.tombstone_line(second)])
+        # the last copy of the removed song is removed
+        expected = [first, second.transpose(1)]
+        self.assertEqual((expected, 3), storage.read_songbook(book_file))
+        lazy = storage.LazySongs(book_file)
+        self.assertListEqual(expected, list(lazy))
+        self.assertEqual(3, lazy.unindexed)
+        lazy.close()
+        # a record that was not written completely is ignored
+        with open(book_file, "a", encoding="utf-8") as f:
+            f.write(storage.dumps_song(first)[:20])
+        self.assertListEqual(expected, storage.read_songs(book_file))
+        lazy = storage.LazySongs(book_file)
+        self.assertListEqual(expected, list(lazy))
+        lazy.close()
+
+    def test_tombstones_check_only_the_songs_with_the_same_title(self):
+        book_file = self.folder + "/tombstones.sgbk"
+        songs = [song.Song(self.song.artist, str(i), self.song.stanzas) for i in range(50)]
+        storage.write_songbook(book_file, songs)
+        storage.append_records(book_file, [storage.tombstone_line(sng) for sng in songs[::2]])
+        with mock.patch("storage.line_hash", wraps=storage.line_hash) as hashing:
+            self.assertListEqual(songs[1::2], storage.read_songs(book_file))
+            lazy = storage.LazySongs(book_file)
+            self.assertListEqual(songs[1::2], list(lazy))
+            lazy.close()
+        self.assertEqual(2 * 25, hashing.call_count)
+
+    def test_lines_and_reopen(self):
+        book_file = self.folder + "/reopened.sgbk"
+        songs = [self.song.transpose(i) for i in range(3)]
+        storage.write_songbook(book_file, songs)
+        storage.append_records(book_file, [storage.tombstone_line(songs[0])])
+        lazy = storage.LazySongs(book_file)
+        decoded = lazy[1]
+        lazy.insert(0, songs[0].transpose(5))
+        storage.write_songbook_lines(book_file, lazy.lines())
+        lazy.reopen()
+        self.assertEqual(0, lazy.unindexed)
+        self.assertIs(decoded, lazy[2])
+        self.assertListEqual([songs[0].transpose(5), songs[1], songs[2]], list(lazy))
+        self.assertListEqual([songs[0].transpose(5), songs[1], songs[2]], storage.read_songs(book_file))
+        lazy.close()
+        self.assertFalse(os.path.exists(book_file + ".tmp"))
+
+    def test_lazy_songs_are_mutable(self):
+        book_file = self.folder + "/mutable.sgbk"
+        songs = [self.song.transpose(i) for i in range(3)]
+        storage.write_songbook(book_file, songs)
+        lazy = storage.LazySongs(book_file)
+        lazy.insert(1, songs[2])
+        del lazy[0]
+        self.assertListEqual([songs[2], songs[1], songs[2]], list(lazy))
+        self.assertListEqual([0], list(lazy.decoded))
+        lazy.close()
+
+    def test_read_legacy(self):
+        with open(self.LEGACY_BOOK, encoding="utf-8") as f:
+            expected = [eval(line.strip()) for line in f]
+        self.assertListEqual(expected, storage.read_songs(self.LEGACY_BOOK))
+
+    def test_legacy_line(self):
+        self.assertEqual(self.song, storage.loads_legacy_song(repr(self.song)))
+
+    def test_legacy_rejects_code(self):
+        with self.assertRaises(ValueError):
+            storage.loads_legacy_song("__import__('os').getcwd()")
+
+    def test_unknown_version(self):
+        with self.assertRaises(Exception):
+            storage.parse_header("{\"format\":\"sgbk\",\"version\":99}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,9 @@ import chord
 import re
 
 
+NO_WHITESPACE = re.compile("\\S*")
+
+
 class Verse:
     def __init__(self, lyrics, chords):
         """
@@ -32,61 +35,79 @@ class Verse:
         """
         if len(self.chords) == 0:
             return self.lyrics
-        else:
-            chord_positions = []    # (line, index in line)
-            last_in_the_lines = {}  # line: index of the last chord in the line
-            max_length = len(self.lyrics)
-            additional_spaces = [0 for _ in range(len(self.chords))]  # number of spaces before the given chord
-            longer_spaces = {}
-            for i, (this_chord, this_position) in enumerate(self.chords):
-                if i > 0:
-                    additional_spaces[i] += additional_spaces[i - 1]
-                for line in range(len(last_in_the_lines) + 1):
-                    if line not in last_in_the_lines:
+        lyrics = self.lyrics
+        # place the chords: line 0 is the lowest line of chords, and if a chord does not fit in it,
+        # some spaces are added to the lyrics (if there is a space between the chords) or a higher line is used
+        placed = []         # (column, chord string) in the order of the chords
+        rows = []           # line: [(column, chord string), ...]
+        line_starts = []    # line: position of the last chord in the line
+        line_ends = []      # line: position + length of the last chord in the line
+        longer_spaces = {}  # index of a space in the lyrics: number of additional spaces
+        added = 0
+        max_length = len(lyrics)
+        for this_chord, this_position in self.chords:
+            chord_string = str(this_chord)
+            for line, line_end in enumerate(line_ends):
+                if line_end < this_position:
+                    break
+                elif line == 0:
+                    # try with additional spaces, but ...
+                    space_between = lyrics.rfind(" ", line_starts[0], this_position)
+                    if space_between >= 0:      # ... do not break the words
+                        assert space_between not in longer_spaces
+                        longer_spaces[space_between] = 1 + line_end - this_position
+                        added += 1 + line_end - this_position
                         break
-                    else:
-                        last_chord, last_position = self.chords[last_in_the_lines[line]]
-                        last_end = last_position + len(str(last_chord))
-                        if last_end < this_position:
-                            break
-                        elif line == 0:
-                            # try with additional spaces, but ...
-                            space_between = self.lyrics.rfind(" ", last_position, this_position)
-                            if space_between >= 0:      # ... do not break the words
-                                assert space_between not in longer_spaces
-                                longer_spaces[space_between] = 1 + last_end - this_position
-                                additional_spaces[i] += longer_spaces[space_between]
-                                break
-                column = this_position + additional_spaces[i]
-                chord_positions.append((line, column))
-                last_in_the_lines[line] = i
-                max_length = max(max_length, column + len(str(this_chord)))
-
-            max_length = max(max_length, len(self.lyrics) + additional_spaces[-1])
-            placeholder = " "
-            any_lyrics = bool(self.lyrics.strip())
-            number_lines = 2 * len(last_in_the_lines) + 1 if any_lyrics else 1
-            lines = [[placeholder for _ in range(max_length)] for _ in range(number_lines)]
-            for i, (line, column) in enumerate(chord_positions):
-                chord_string = str(self.chords[i][0])
-                real_line = 2 * (line + 1) if any_lyrics else 0
-                for j in range(len(chord_string)):
-                    lines[real_line][column + j] = chord_string[j]
-                for lower_line in range(1, real_line):
-                    if lines[lower_line][column] == placeholder:
-                        lines[lower_line][column] = "|"
-            if any_lyrics:
-                index = 0
-                for i in range(len(self.lyrics)):
-                    if i in longer_spaces:
-                        index += longer_spaces[i]
-                    lines[0][index] = self.lyrics[i]
-                    index += 1
-            return "\n".join(["".join(line) for line in lines[::-1]])
+            else:
+                line = len(line_ends)
+                line_starts.append(None)
+                line_ends.append(None)
+                rows.append([])
+            line_starts[line] = this_position
+            line_ends[line] = this_position + len(chord_string)
+            column = this_position + added
+            placed.append((column, chord_string))
+            rows[line].append((column, chord_string))
+            if column + len(chord_string) > max_length:
+                max_length = column + len(chord_string)
+        max_length = max(max_length, len(lyrics) + added)
+
+        # draw them: every row of chords is built from its chords and the columns of the | below the higher chords
+        if not lyrics.strip():
+            return _draw_row(placed, [], max_length)
+        lines = []
+        connectors = []
+        for row in reversed(rows):
+            lines.append(_draw_row(row, connectors, max_length))
+            connectors = sorted(connectors + [column for column, _ in row])
+            lines.append(_draw_row([], connectors, max_length))
+        parts = []
+        previous = 0
+        for space in sorted(longer_spaces):
+            parts.append(lyrics[previous:space])
+            parts.append(" " * longer_spaces[space])
+            previous = space
+        parts.append(lyrics[previous:])
+        lines.append("".join(parts).ljust(max_length))
+        return "\n".join(lines)
 
     def __eq__(self, other):
         return self.lyrics == other.lyrics and self.chords == other.chords
 
+    def description(self):
+        """
+        The inverse of parse_verse, e.g., <A>Js ne morem več <E>v temi živet.
+        :return: the lyrics with the chords in angle brackets
+        """
+        parts = []
+        previous = 0
+        for this_chord, position in self.chords:
+            parts.append(self.lyrics[previous:position])
+            parts.append("<{}>".format(this_chord))
+            previous = position
+        parts.append(self.lyrics[previous:])
+        return "".join(parts)
+
     def transpose(self, half_tones):
         return Verse(self.lyrics, [(x[0].transpose(half_tones), x[1]) for x in self.chords])
 
@@ -113,8 +134,7 @@ class Verse:
                     i_end = self.lyrics[i:].find(")") + i + 1
                     assert i_end >= i
                     substring = self.lyrics[i:i_end]
-                    pattern = "\\S{{{0},{0}}}".format(len(substring))
-                    if re.match(pattern, substring) is not None:
+                    if NO_WHITESPACE.fullmatch(substring) is not None:
                         parts.append("\\textit{{{}}}".format(substring))
                     else:
                         parts.append(substring)
@@ -131,6 +151,40 @@ class Verse:
             return "{{\\nolyrics {}}}".format(usual_version)
 
 
+def _draw_row(placed, connectors, width):
+    """
+    A row of Verse.__str__.
+    :param placed: list of pairs (column, chord string) in the order of the chords
+    :param connectors: sorted columns of the | that connect the higher chords with the lyrics
+    :param width: the length of the row
+    :return: the row, where the chords cover the |
+    """
+    row = ""
+    end = 0
+    i = 0
+    n = len(connectors)
+    for column, chord_string in placed:
+        while i < n and connectors[i] < column:
+            if connectors[i] >= end:
+                row += " " * (connectors[i] - end) + "|"
+                end = connectors[i] + 1
+            i += 1
+        if column >= end:
+            row += " " * (column - end) + chord_string
+            end = column + len(chord_string)
+        else:  # the chords of a verse without lyrics may overlap
+            row = row[:column] + chord_string + row[column + len(chord_string):]
+            end = len(row)
+    for connector in connectors[i:]:
+        if connector >= end:
+            row += " " * (connector - end) + "|"
+            end = connector + 1
+    return row.ljust(width)
+
+
+CHORD_PATTERN = re.compile("<([^<>]*)>")
+
+
 def parse_verse(description):
     """
     Parses a description of a verse (lyrics and possibly chords) to a Verse object
@@ -143,23 +197,15 @@ def parse_verse(description):
     """
     lyrics = []
     chords = []
-    in_chord = False
     index = 0
-    chord_string = []
-    position = None
-    for char in description:
-        if char == "<":
-            assert not in_chord
-            in_chord = True
-            position = index
-        elif char == ">":
-            assert in_chord
-            in_chord = False
-            chords.append((chord.parse("".join(chord_string)), position))
-            chord_string = []
-        elif in_chord:
-            chord_string.append(char)
-        else:
-            lyrics.append(char)
-            index += 1
-    return Verse("".join(lyrics), chords)
+    end_of_previous = 0
+    for match in CHORD_PATTERN.finditer(description):
+        part = description[end_of_previous:match.start()]
+        lyrics.append(part)
+        index += len(part)
+        chords.append((chord.parse(match.group(1)), index))
+        end_of_previous = match.end()
+    lyrics.append(description[end_of_previous:])
+    lyrics = "".join(lyrics)
+    assert "<" not in lyrics and ">" not in lyrics, "Unmatched < or > in {}".format(description)
+    return Verse(lyrics, chords)
@@ -0,0 +1,22 @@
+import unittest
+import json
+import verse
+
+
+class VerseGoldenTest(unittest.TestCase):
+    """
+    Compares Verse.__str__ with the outputs of the original implementation, stored in GOLDEN_FILE:
+    the verses from verse_test.py, all the verses of the songs/ corpus and some random chord-dense verses.
+    """
+    GOLDEN_FILE = "testdata/verse_str_golden.json"
+
+    def test_str(self):
+        with open(VerseGoldenTest.GOLDEN_FILE, encoding="utf-8") as f:
+            cases = json.load(f)
+        self.assertGreater(len(cases), 1000)
+        for description, expected in cases:
+            self.assertEqual(expected, str(verse.parse_verse(description)), description)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -65,6 +65,18 @@ class VerseTest(unittest.TestCase):
         self.assertEqual(self.verse_4_true, verse_4_parsed)
         self.assertEqual(self.verse_5_true, verse_5_parsed)
 
+    def test_description(self):
+        descriptions = [self.description_1, self.description_2, self.description_3, self.description_4,
+                        self.description_5.replace("C-m-sus4", "c-sus4")]
+        for description in descriptions:
+            self.assertEqual(description, verse.parse_verse(description).description())
+
+    def test_parse_unmatched(self):
+        # an unclosed < at the end of the line was silently dropped by the old parser
+        for description in ["<A>a <E b", "<A>a <<E>b", "a E>b", "ab <C>cd <D", "ab <"]:
+            with self.assertRaises(AssertionError):
+                verse.parse_verse(description)
+
     def test_str(self):
         verse_1_string_true = "A                E           \n" \
                               "|                |           \n" \